@@ -0,0 +1,318 @@
+"""Micro-benchmarks do servidor de chat.
+
+Uso: python benchmark.py {broadcast,lookup,censor,writes,codec,compression}
+"""
+import argparse
+import json
+import random
+import re
+import socket
+import string
+import threading
+import time
+import zlib
+
+from censor import Censor
+import packer
+import protocol
+from outbox import Outbox
+from protocol import Codec, PROTOCOL_VERSION, DEFLATE, COMPRESS_LEVEL, HEADER
+from rooms import RoomRegistry
+from server import ChatServer
+
+
+class NullOutbox:
+    """Fila de saída que só conta o que recebe, para medir o servidor sem sockets."""
+
+    def __init__(self):
+        self.count = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.messages = 0
+        self.writes = 0
+
+    def put(self, data, key=None):
+        self.count += 1
+        return True
+
+    def close(self, final=None):
+        pass
+
+
+def populate(server, users, rooms=1):
+    """Substitui os clientes do servidor por `users` conexões falsas distribuídas em `rooms` salas."""
+    server.clients.clear()
+    server.usernames.clear()
+    server.rooms = RoomRegistry()
+    for i in range(users):
+        client = object()
+        codec = Codec()
+        codec.upgrade(PROTOCOL_VERSION)
+        username = f"user{i}"
+        room = "general" if i % rooms == 0 else f"sala{i % rooms}"
+        server.clients[client] = {"username": username, "room": room, "codec": codec, "outbox": NullOutbox()}
+        server.usernames[username] = client
+        server.rooms.join(room, client, username)
+    return server
+
+
+def timeit(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_broadcast(args):
+    server = ChatServer()
+    print(f"{'sala':>8} {'serializações':>14} {'µs/broadcast':>13} {'µs/destinatário':>16} {'µs (1 dumps/cliente)':>21}")
+    message = "uma mensagem de tamanho típico para o chat " * 2
+    for room_size in args.sizes:
+        populate(server, room_size)
+        repeat = max(10, 100000 // room_size)
+
+        # Contar quantas vezes o payload é serializado num broadcast (uma por formato de fio)
+        serializations = 0
+        original = protocol.encode_message
+
+        def counting_encode(*args):
+            nonlocal serializations
+            serializations += 1
+            return original(*args)
+
+        protocol.encode_message = counting_encode
+        try:
+            server.broadcast(message, "general")
+        finally:
+            protocol.encode_message = original
+
+        elapsed = timeit(lambda: server.broadcast(message, "general"), repeat)
+
+        # Referência: o que o broadcast antigo fazia (um json.dumps por cliente)
+        clients = list(server.rooms.members("general"))
+        naive = timeit(lambda: [json.dumps({"type": "message", "content": message}).encode('utf-8')
+                                for _ in clients], max(3, repeat // 10))
+
+        print(f"{room_size:>8} {serializations:>14} {elapsed * 1e6:>13.1f} "
+              f"{elapsed * 1e6 / room_size:>16.3f} {naive * 1e6:>21.1f}")
+
+
+def bench_lookup(args):
+    server = ChatServer()
+    populate(server, args.users, args.rooms)
+    targets = [f"user{random.randrange(args.users)}" for _ in range(1000)]
+    some_client = next(iter(server.clients))
+    room = "sala1" if args.rooms > 1 else "general"
+
+    # Referências: as versões antigas com varredura de todos os clientes
+    def scan_whisper(target):
+        for client, info in server.clients.items():
+            if info["username"] == target:
+                return client
+
+    def scan_users(room):
+        return [info["username"] for info in server.clients.values() if info["room"] == room]
+
+    print(f"{args.users} usuários em {args.rooms} salas")
+    print(f"{'operação':<16} {'µs (índice)':>12} {'µs (varredura)':>15}")
+    indexed = timeit(lambda: [server.whisper("bench", t, "oi") for t in targets], 3) / len(targets)
+    scanned = timeit(lambda: [scan_whisper(t) for t in targets[:20]], 1) / 20
+    print(f"{'whisper':<16} {indexed * 1e6:>12.2f} {scanned * 1e6:>15.2f}")
+    indexed = timeit(lambda: server.send_users_list(some_client, room), 100)
+    scanned = timeit(lambda: scan_users(room), 5)
+    print(f"{'users_list':<16} {indexed * 1e6:>12.2f} {scanned * 1e6:>15.2f}")
+
+
+def legacy_censor(bad_words, message):
+    """Implementação antiga de ChatServer.censor_message, para comparação."""
+    words = re.findall(r'\b\w+\b|\W+', message)
+    for i, word in enumerate(words):
+        if word.lower() in bad_words:
+            words[i] = '*' * len(word)
+    return ''.join(words)
+
+
+def bench_censor(args):
+    rng = random.Random(42)
+    with open("palavras_bloqueadas.txt", encoding="utf-8") as file:
+        real_words = [w.strip().lower() for w in file if w.strip()]
+    message = "olha essa porra de mensagem comum que passa pelo chat o dia inteiro sem parar merda"
+
+    print(f"{'termos':>8} {'msgs/s (lista)':>15} {'msgs/s (Censor)':>16} {'msgs/s (acentos+leet)':>22}")
+    for size in args.sizes:
+        words = list(real_words)
+        while len(words) < size:
+            words.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+        words = words[:size]
+
+        # A lista antiga é O(termos) por palavra: repetir menos vezes nas listas grandes
+        legacy = timeit(lambda: legacy_censor(words, message), max(3, 30000 // size))
+        plain = Censor(words)
+        compiled = timeit(lambda: plain.censor(message), 20000)
+        normalized = Censor(words, accents=True, leetspeak=True)
+        folded = timeit(lambda: normalized.censor(message), 20000)
+        print(f"{size:>8} {1 / legacy:>15.0f} {1 / compiled:>16.0f} {1 / folded:>22.0f}")
+
+
+def bench_writes(args):
+    codec = Codec()
+    codec.upgrade(PROTOCOL_VERSION)
+    data = codec.encode({"type": "message", "content": "fulano: uma mensagem de tamanho típico para o chat"})
+    total = args.messages * len(data)
+
+    print(f"{args.messages} mensagens em rajadas de {args.burst}, {args.gap} µs entre rajadas")
+    print(f"{'janela µs':>10} {'escritas':>9} {'msgs/escrita':>13} {'ms':>8}")
+    for window in [None] + args.windows:
+        listener = socket.create_server(("127.0.0.1", 0))
+        sender = socket.create_connection(listener.getsockname())
+        sender.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        receiver, _ = listener.accept()
+        listener.close()
+
+        def drain():
+            received = 0
+            while received < total:
+                received += len(receiver.recv(1 << 20))
+
+        reader = threading.Thread(target=drain)
+        reader.start()
+        start = time.perf_counter()
+        if window is None:
+            # Referência: um sendall por mensagem, como antes da fila agrupar as escritas
+            for i in range(args.messages):
+                sender.sendall(data)
+                if i % args.burst == args.burst - 1:
+                    time.sleep(args.gap / 1e6)
+            writes = args.messages
+        else:
+            outbox = Outbox(sender, limit=args.messages, window=window / 1e6)
+            for i in range(args.messages):
+                outbox.put(data)
+                if i % args.burst == args.burst - 1:
+                    time.sleep(args.gap / 1e6)
+        reader.join()
+        elapsed = time.perf_counter() - start
+        if window is not None:
+            writes = outbox.writes
+            outbox.close()
+        else:
+            sender.close()
+        receiver.close()
+        label = "sendall" if window is None else str(window)
+        print(f"{label:>10} {writes:>9} {args.messages / writes:>13.1f} {elapsed * 1e3:>8.1f}")
+
+
+def bench_codec(args):
+    chat = {"type": "message", "content": "fulano: uma mensagem de tamanho típico para o chat",
+            "room": "general", "seq": 123456, "ts": time.time()}
+    samples = [
+        ("message", chat),
+        ("whisper", {"type": "whisper", "target": "ciclano", "content": "oi, tudo bem?"}),
+        ("users_list", {"type": "users_list", "room": "general",
+                        "users": [f"user{i}" for i in range(100)], "version": 4321}),
+        ("history", {"type": "history", "room": "general", "next_cursor": 123406,
+                     "messages": [{"seq": chat["seq"] - i, "ts": chat["ts"], "content": chat["content"]}
+                                  for i in range(50)]}),
+    ]
+    codecs = [("json", lambda m: json.dumps(m).encode('utf-8'), json.loads),
+              ("msgpack (Python)", packer.py_packb, packer.py_unpackb)]
+    if packer.ACCELERATED:
+        codecs.append(("msgpack (C)", packer.packb, packer.unpackb))
+
+    print(f"{'mensagem':<12} {'codificação':<18} {'bytes':>7} {'µs encode':>10} {'µs decode':>10}")
+    for name, message in samples:
+        for label, dumps, loads in codecs:
+            data = dumps(message)
+            assert loads(data) == message
+            repeat = args.repeat if len(data) < 1000 else args.repeat // 20
+            encode = timeit(lambda: dumps(message), repeat)
+            decode = timeit(lambda: loads(data), repeat)
+            print(f"{name:<12} {label:<18} {len(data):>7} {encode * 1e6:>10.2f} {decode * 1e6:>10.2f}")
+
+
+def bench_compression(args):
+    with open("palavras_bloqueadas.txt", encoding="utf-8") as file:
+        words = [w.strip().lower() for w in file if w.strip()]
+    rng = random.Random(42)
+    while len(words) < args.words:
+        words.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+    plain = Codec()
+    plain.upgrade(PROTOCOL_VERSION)
+    compressed = Codec()
+    compressed.upgrade(PROTOCOL_VERSION, compression=DEFLATE)
+    compressed.compress_threshold = args.threshold
+    lines = [f"user{rng.randrange(100)}: " + " ".join(rng.choice(words[:30] + ["oi", "tudo", "bem", "hoje", "chat"])
+                                                       for _ in range(rng.randint(3, 15))) for _ in range(50)]
+    samples = [
+        ("message", [{"type": "message", "content": lines[0], "room": "general", "ts": time.time()}]),
+        ("users_list", [{"type": "users_list", "room": "general",
+                         "users": [f"user{i}" for i in range(200)], "version": 1}]),
+        ("blocklist", [{"type": "blocked_words_list", "words": words[:args.words]}]),
+        ("backfill", [{"type": "message", "content": line, "room": "general", "ts": time.time()}
+                      for line in lines]),
+    ]
+
+    def without_dictionary(frames):
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+        return HEADER.pack(0) + compressor.compress(frames) + compressor.flush()
+
+    print(f"limite de compressão: {args.threshold} bytes")
+    print(f"{'payload':<12} {'bytes':>8} {'deflate':>8} {'sem dict':>9} {'µs comprimir':>13} {'µs receber':>11}")
+    for name, messages in samples:
+        frames = b"".join(plain.encode(m) for m in messages)
+        data = compressed.compress(frames)
+        repeat = max(10, args.repeat // len(frames) * 100)
+        deflate = timeit(lambda: compressed.compress(frames), repeat)
+
+        def receive():
+            receiver = Codec()
+            receiver.upgrade(PROTOCOL_VERSION, compression=DEFLATE)
+            receiver.feed(data)
+            return list(receiver)
+
+        assert receive() == messages
+        decode = timeit(receive, repeat)
+        print(f"{name:<12} {len(frames):>8} {len(data):>8} {len(without_dictionary(frames)):>9} "
+              f"{deflate * 1e6:>13.1f} {decode * 1e6:>11.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("broadcast", help="custo do fan-out por tamanho de sala")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    p.set_defaults(func=bench_broadcast)
+
+    p = sub.add_parser("lookup", help="whisper e users_list com muitos usuários conectados")
+    p.add_argument("--users", type=int, default=50000)
+    p.add_argument("--rooms", type=int, default=100)
+    p.set_defaults(func=bench_lookup)
+
+    p = sub.add_parser("censor", help="throughput do filtro de palavras por tamanho de blacklist")
+    p.add_argument("--sizes", type=int, nargs="+", default=[30, 10000, 100000])
+    p.set_defaults(func=bench_censor)
+
+    p = sub.add_parser("writes", help="mensagens por escrita no socket com a fila de saída")
+    p.add_argument("--messages", type=int, default=20000)
+    p.add_argument("--burst", type=int, default=20, help="mensagens enfileiradas de uma vez")
+    p.add_argument("--gap", type=int, default=200, help="µs entre rajadas")
+    p.add_argument("--windows", type=int, nargs="+", default=[0, 50, 500], help="janelas de agrupamento em µs")
+    p.set_defaults(func=bench_writes)
+
+    p = sub.add_parser("codec", help="tamanho e custo de JSON e MessagePack por tipo de mensagem")
+    p.add_argument("--repeat", type=int, default=20000)
+    p.set_defaults(func=bench_codec)
+
+    p = sub.add_parser("compression", help="bytes no fio e CPU do deflate por tipo de payload")
+    p.add_argument("--threshold", type=int, default=1024)
+    p.add_argument("--words", type=int, default=1000, help="tamanho da blacklist enviada")
+    p.add_argument("--repeat", type=int, default=20000)
+    p.set_defaults(func=bench_compression)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
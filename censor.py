@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+import unicodedata
+
+import logs
+
+log = logs.get_logger("chat.censor")
+
+# Substituições de leetspeak aplicadas antes da comparação (p0rr4 -> porra)
+LEET_TABLE = str.maketrans({
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s",
+})
+
+WORD_RE = re.compile(r'\w+')
+LEET_WORD_RE = re.compile(r'[\w@$]+')
+
+
+def fold_accents(text):
+    """Remove acentos: "palavrão" -> "palavrao"."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class Censor:
+    """Blacklist compilada num conjunto de palavras normalizadas.
+
+    Cada palavra da mensagem custa uma busca O(1) no conjunto, qualquer que seja
+    o tamanho da blacklist. `words` preserva a lista original (na ordem do
+    arquivo) para ser enviada aos clientes.
+    """
+
+    def __init__(self, words=(), accents=False, leetspeak=False):
+        self.accents = accents
+        self.leetspeak = leetspeak
+        self.words = []
+        self._index = set()
+        self._pattern = LEET_WORD_RE if leetspeak else WORD_RE
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return self.normalize(word) in self._index
+
+    def normalize(self, word):
+        word = word.lower()
+        if self.leetspeak:
+            word = word.translate(LEET_TABLE)
+        if self.accents and not word.isascii():
+            word = fold_accents(word)
+        return word
+
+    def add(self, word):
+        """Adiciona uma palavra sem recompilar o resto. Retorna False se ela já estava na lista."""
+        word = word.strip().lower()
+        key = self.normalize(word)
+        if not word or key in self._index:
+            return False
+        self.words.append(word)
+        self._index.add(key)
+        return True
+
+    def censor(self, message):
+        """Troca cada palavra bloqueada por asteriscos do mesmo tamanho."""
+        if not self._index:
+            return message
+        return self._pattern.sub(self._mask, message)
+
+    def _mask(self, match):
+        word = match.group()
+        if self.normalize(word) in self._index:
+            return '*' * len(word)
+        return word
+
+
+class BlacklistWatcher:
+    """Mantém o arquivo da blacklist e o Censor em uso sincronizados.
+
+    Uma thread verifica o mtime do arquivo a cada `interval` segundos; se ele mudou,
+    compila um Censor novo fora do caminho das mensagens e o entrega a `on_reload`,
+    que só troca a referência. Palavras adicionadas pelos clientes vão para uma
+    lista pendente e são gravadas todas juntas no mesmo ciclo.
+    """
+
+    def __init__(self, path, loader, factory, on_reload, interval=1.0):
+        self.path = path
+        self.loader = loader        # path -> lista de palavras
+        self.factory = factory      # lista de palavras -> Censor
+        self.on_reload = on_reload  # Censor -> None
+        self.interval = interval
+        # Protege só as escritas (adição de palavras e troca do Censor), nunca a censura
+        self.lock = threading.Lock()
+        self._pending = []
+        self._mtime = self._stat()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Para a thread e grava o que ainda estiver pendente."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def append(self, word):
+        """Agenda a gravação de uma palavra no arquivo. Deve ser chamado com `lock`."""
+        self._pending.append(word)
+
+    def flush(self):
+        with self.lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(''.join(f"\n{word}" for word in pending))
+            # Não recarregar por causa da nossa própria escrita
+            self._mtime = self._stat()
+            log.info("Palavras gravadas na blacklist", words=len(pending), path=self.path)
+        except Exception:
+            log.exception("Erro ao salvar palavras na blacklist", path=self.path)
+            with self.lock:
+                self._pending[:0] = pending
+
+    def reload(self):
+        words = self.loader(self.path)
+        # Compilar fora do lock: com blacklists grandes isso leva algum tempo
+        censor = self.factory(words)
+        with self.lock:
+            for word in self._pending:
+                censor.add(word)
+            self.on_reload(censor)
+        log.info("Blacklist recarregada", words=len(censor), path=self.path)
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # Mudanças externas primeiro, para a nossa gravação não mascarar o novo mtime
+            mtime = self._stat()
+            if mtime is not None and mtime != self._mtime:
+                self._mtime = mtime
+                self.reload()
+            self.flush()
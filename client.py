@@ -1,38 +1,72 @@
-import socket
-import threading
-import json
+import selectors
 import curses
 import sys
-import traceback
+import time
+import argparse
 from datetime import datetime
+from session import ChatSession, DEFAULT_ENCODINGS
+from scrollback import Scrollback, DEFAULT_LIMIT as DEFAULT_SCROLLBACK
+from render import RenderScheduler, DEFAULT_FPS, CHAT, USERS, STATUS, INPUT
+import logs
+
+# O laço dorme no select até chegar algo; sem sinal de SIGWINCH no select, a
+# mudança de tamanho do terminal (KEY_RESIZE) é notada em no máximo IDLE_TIMEOUT
+IDLE_TIMEOUT = 0.5
+# Sem select no stdin (Windows), o teclado é consultado nesse intervalo
+KEY_POLL_INTERVAL = 0.02
+
+# Nada de print com o curses na tela: os logs vão para arquivo ou aparecem ao sair
+log = logs.get_logger("chat.client")
 
 class ChatClient:
-    def __init__(self, host='localhost', port=9999):
+    """Interface curses sobre uma session.ChatSession.
+
+    A sessão cuida do protocolo, da sala, da lista de usuários e da reconexão;
+    o cliente só desenha o que ela avisa pelos callbacks e transforma o que o
+    usuário digita em pedidos.
+    """
+
+    def __init__(self, host='localhost', port=9999, encodings=DEFAULT_ENCODINGS,
+                 scrollback=DEFAULT_SCROLLBACK, spill=False, fps=DEFAULT_FPS):
         self.host = host
         self.port = port
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.username = None
-        self.current_room = "general"
+        self.encodings = list(encodings)  # Oferecidas ao servidor, por ordem de preferência
+        self.session = None  # Criada em connect()
         self.running = False
         self.stdscr = None
         self.input_win = None
         self.chat_win = None
         self.status_win = None
         self.users_win = None
-        self.messages = []
+        self.fps = fps
+        self.renderer = None  # RenderScheduler; só existe com a interface aberta
+        self.scrollback = Scrollback(scrollback, spill)  # Mensagens do chat, com rolagem (PageUp/PageDown)
         self.input_text = ""
         self.cursor_pos = 0
-        self.users_in_room = []
         self.is_admin = False  
+
+    @property
+    def username(self):
+        return self.session.username
+
+    @property
+    def current_room(self):
+        return self.session.room
+
+    @property
+    def users_in_room(self):
+        return self.session.users
+
     def connect(self, username):
+        self.session = ChatSession(username, host=self.host, port=self.port, encodings=self.encodings,
+                                   on_message=self.on_message, on_whisper=self.on_whisper,
+                                   on_presence=self.on_presence, on_event=self.on_event,
+                                   on_connection=self.on_connection)
         try:
-            self.client_socket.connect((self.host, self.port))
-            self.username = username
-            # Enviar nome de usuário para o servidor
-            self.client_socket.send(json.dumps({"username": username}).encode('utf-8'))
+            self.session.connect()
             return True
         except Exception as e:
-            print(f"Erro de conexão: {e}")
+            log.error("Erro de conexão", host=self.host, port=self.port, error=repr(e))
             return False
 
     def start_ui(self):
@@ -75,6 +109,7 @@ class ChatClient:
                 self.chat_win = curses.newwin(chat_height, chat_width, 1, 1)
                 self.users_win = curses.newwin(chat_height, users_width, 1, chat_width + 1)
                 self.input_win = curses.newwin(3, max_x - 2, chat_height + 1, 1)
+                self.input_win.keypad(True)  # Setas e PageUp/PageDown chegam como KEY_*, não como sequências de escape
                 self.status_win = curses.newwin(1, max_x, max_y - 1, 0)
                 
                 # Habilitar rolagem para janela de chat
@@ -83,15 +118,18 @@ class ChatClient:
                 # Desenhar bordas iniciais
                 self.draw_borders()
                 
-                # Adicionar usuários padrão para teste
-                self.users_in_room = [self.username]
+                # Daqui em diante as janelas só são desenhadas pelo renderer
+                self.renderer = RenderScheduler({
+                    CHAT: self.draw_chat,
+                    USERS: self.draw_users,
+                    STATUS: self.draw_status,
+                    INPUT: self.draw_input,
+                }, fps=self.fps)
+                self.renderer.invalidate()
+                
                 self.update_users_list()
                 
-                # Iniciar thread para receber mensagens
                 self.running = True
-                receiver_thread = threading.Thread(target=self.receive_messages)
-                receiver_thread.daemon = True
-                receiver_thread.start()
                 
                 # Solicitar lista de usuários do servidor
                 self.request_users_list()
@@ -105,17 +143,15 @@ class ChatClient:
                 self.add_message("Use /join <sala> para mudar de sala")
                 self.add_message("Use /whisper <usuário> <mensagem> para enviar mensagens privadas")
                 
-                # Loop principal de entrada
-                self.input_loop()
+                # Loop principal: teclado, servidor e tela numa thread só
+                self.run_loop()
                 
-            except Exception as e:
+            except Exception:
                 self.shutdown()
-                print(f"Erro na interface: {e}")
-                print(traceback.format_exc())
+                log.exception("Erro na interface")
                 sys.exit(1)
-        except Exception as e:
-            print(f"Erro ao inicializar curses: {e}")
-            print(traceback.format_exc())
+        except Exception:
+            log.exception("Erro ao inicializar curses")
             sys.exit(1)
 
     def draw_borders(self):
@@ -153,26 +189,44 @@ class ChatClient:
             
             # Atualizar a tela
             self.stdscr.refresh()
-        except Exception as e:
+        except Exception:
             self.shutdown()
-            print(f"Erro ao desenhar bordas: {e}")
-            print(traceback.format_exc())
+            log.exception("Erro ao desenhar bordas")
             sys.exit(1)
 
+    def invalidate(self, *regions):
+        """Pede o redesenho de regiões da tela; o próximo quadro do laço as desenha."""
+        if self.renderer is not None:
+            self.renderer.invalidate(*regions)
+
     def update_status(self):
+        self.invalidate(STATUS)
+
+    def update_users_list(self):
+        self.invalidate(USERS)
+
+    def update_chat(self):
+        self.invalidate(CHAT)
+
+    def update_input(self):
+        self.invalidate(INPUT)
+
+    def draw_status(self):
         try:
-            self.status_win.clear()
+            self.status_win.erase()
             self.status_win.bkgd(' ', curses.color_pair(8))
             status_text = f" Sala: {self.current_room} | Comandos: /whisper <usuário>, /join <sala>, /blockword <palavra>, /help, /quit "
-            self.status_win.addstr(0, 0, status_text)
-            self.status_win.refresh()
-        except Exception as e:
-            print(f"Erro ao atualizar status: {e}")
-            print(traceback.format_exc())
+            if not self.session.connected:
+                status_text = f" RECONECTANDO (tentativa {self.session.attempt}) |" + status_text
+            # A última coluna da última linha não aceita addstr
+            self.status_win.addstr(0, 0, status_text[:self.status_win.getmaxyx()[1] - 1])
+            self.status_win.noutrefresh()
+        except Exception:
+            log.exception("Erro ao atualizar status")
 
-    def update_users_list(self):
+    def draw_users(self):
         try:
-            self.users_win.clear()
+            self.users_win.erase()
             
             # Desenhar borda para janela de usuários
             self.users_win.attron(curses.color_pair(6))
@@ -187,14 +241,14 @@ class ChatClient:
                     else:
                         self.users_win.addstr(i + 1, 2, user, curses.color_pair(5))
             
-            self.users_win.refresh()
-        except Exception as e:
-            print(f"Erro ao atualizar lista de usuários: {e}")
-            print(traceback.format_exc())
+            self.users_win.noutrefresh()
+        except Exception:
+            log.exception("Erro ao atualizar lista de usuários")
 
-    def update_chat(self):
+    def draw_chat(self):
         try:
-            self.chat_win.clear()
+            # erase em vez de clear: clear força o terminal a repintar a janela inteira
+            self.chat_win.erase()
             
             # Desenhar borda para janela de chat
             self.chat_win.attron(curses.color_pair(6))
@@ -202,50 +256,25 @@ class ChatClient:
             self.chat_win.attroff(curses.color_pair(6))
             
             height, width = self.chat_win.getmaxyx()
-            available_height = height - 2  
-            available_width = width - 4    
             
-            # Mostrar apenas as últimas mensagens que cabem na janela
-            display_messages = self.messages[-available_height:] if len(self.messages) > available_height else self.messages
+            # Só as mensagens que aparecem na tela são quebradas e desenhadas
+            for y, row in enumerate(self.scrollback.visible_rows(height - 2, width - 4)):
+                x = 2
+                for text, color in row:
+                    self.chat_win.addstr(y + 1, x, text, curses.color_pair(color))
+                    x += len(text)
             
-            for i, msg in enumerate(display_messages):
-                if i < available_height:
-                    # Formatar timestamp se presente
-                    if isinstance(msg, tuple):
-                        timestamp, content = msg
-                        timestamp_str = f"[{timestamp.strftime('%H:%M:%S')}] "
-                        content_start = len(timestamp_str)
-                        self.chat_win.addstr(i + 1, 2, timestamp_str, curses.color_pair(3))
-                    else:
-                        content = msg
-                        content_start = 0
-                    
-                    # Tratar diferentes tipos de mensagem
-                    if isinstance(content, str):
-                        if content.startswith("WHISPER"):
-                            parts = content[8:].split(":", 1)
-                            if len(parts) == 2:
-                                sender, text = parts
-                                self.chat_win.addstr(i + 1, 2 + content_start, "SUSSURRO ", curses.color_pair(2))
-                                self.chat_win.addstr(i + 1, 10 + content_start, f"{sender}:", curses.color_pair(1))
-                                self.chat_win.addstr(i + 1, 11 + content_start + len(sender), text, curses.color_pair(4))
-                        elif ":" in content:
-                            parts = content.split(":", 1)
-                            if len(parts) == 2:
-                                username, text = parts
-                                self.chat_win.addstr(i + 1, 2 + content_start, f"{username}:", curses.color_pair(1))
-                                self.chat_win.addstr(i + 1, 3 + content_start + len(username), text, curses.color_pair(4))
-                        else:
-                            self.chat_win.addstr(i + 1, 2 + content_start, content, curses.color_pair(3))
+            if self.scrollback.scroll:
+                hint = f" {self.scrollback.scroll} mensagens abaixo (PageDown) "[:width - 4]
+                self.chat_win.addstr(height - 1, width - 2 - len(hint), hint, curses.color_pair(2))
             
-            self.chat_win.refresh()
-        except Exception as e:
-            print(f"Erro ao atualizar chat: {e}")
-            print(traceback.format_exc())
+            self.chat_win.noutrefresh()
+        except Exception:
+            log.exception("Erro ao atualizar chat")
 
-    def update_input(self):
+    def draw_input(self):
         try:
-            self.input_win.clear()
+            self.input_win.erase()
             
             # Desenhar borda para janela de entrada
             self.input_win.attron(curses.color_pair(6))
@@ -255,61 +284,122 @@ class ChatClient:
             # Adicionar texto de entrada
             self.input_win.addstr(1, 2, self.input_text[:self.input_win.getmaxyx()[1] - 4])
             self.input_win.move(1, 2 + min(self.cursor_pos, self.input_win.getmaxyx()[1] - 4))
-            self.input_win.refresh()
-        except Exception as e:
-            print(f"Erro ao atualizar entrada: {e}")
-            print(traceback.format_exc())
+            self.input_win.noutrefresh()
+        except Exception:
+            log.exception("Erro ao atualizar entrada")
 
-    def input_loop(self):
-        while self.running:
-            try:
-                self.update_input()
-                
+    def run_loop(self):
+        """Laço único do cliente: o selector da sessão espera pelo socket e pelo stdin.
+
+        Mensagens do servidor só marcam regiões sujas; os quadros saem no ritmo
+        de no máximo `fps` por segundo. Teclas são desenhadas na hora, sem
+        esperar o próximo quadro. Nenhuma outra thread toca no curses ou no socket.
+        Se a conexão cair, a sessão reconecta neste mesmo laço sem travar a interface.
+        """
+        selector = self.session.selector
+        if sys.platform == "win32":
+            # No Windows o select só aceita sockets
+            poll = KEY_POLL_INTERVAL
+        else:
+            selector.register(sys.stdin, selectors.EVENT_READ)
+            poll = IDLE_TIMEOUT
+        self.input_win.nodelay(True)
+        
+        try:
+            while self.running:
                 try:
-                    key = self.input_win.getch()
-                    
-                    if key == curses.KEY_ENTER or key == 10 or key == 13:  
-                        if self.input_text.strip():
-                            self.process_input(self.input_text)
-                            self.input_text = ""
-                            self.cursor_pos = 0
-                    
-                    elif key == curses.KEY_BACKSPACE or key == 127 or key == 8:  
-                        if self.cursor_pos > 0:
-                            self.input_text = self.input_text[:self.cursor_pos-1] + self.input_text[self.cursor_pos:]
-                            self.cursor_pos -= 1
-                    
-                    elif key == curses.KEY_DC or key == 330 or key == 127:  
-                        if self.cursor_pos < len(self.input_text):
-                            self.input_text = self.input_text[:self.cursor_pos] + self.input_text[self.cursor_pos+1:]
-                    
-                    elif key == curses.KEY_LEFT or key == 260:  
-                        if self.cursor_pos > 0:
-                            self.cursor_pos -= 1
-                    
-                    elif key == curses.KEY_RIGHT or key == 261:  
-                        if self.cursor_pos < len(self.input_text):
-                            self.cursor_pos += 1
-                    
-                    elif key == curses.KEY_HOME or key == 262:  
-                        self.cursor_pos = 0
-                    
-                    elif key == curses.KEY_END or key == 360:  
-                        self.cursor_pos = len(self.input_text)
-                    
-                    elif 32 <= key <= 126:  
-                        self.input_text = self.input_text[:self.cursor_pos] + chr(key) + self.input_text[self.cursor_pos:]
-                        self.cursor_pos += 1
+                    self.session.tick()
+                    self.renderer.render()
+                    timeout = min(self.renderer.wait(), poll) if self.renderer.dirty else poll
+                    deadline = self.session.timeout()
+                    if deadline is not None:
+                        timeout = min(timeout, deadline)
                     
+                    if selector.get_map():
+                        events = selector.select(timeout)
                     else:
-                        self.add_message((datetime.now(), f"Tecla pressionada: {key}"))
-                
-                except Exception as e:
-                    self.add_message((datetime.now(), f"Erro ao processar entrada: {e}"))
+                        time.sleep(timeout)  # Windows e sem socket: select sem nada para esperar falha
+                        events = []
+                    for key, mask in events:
+                        # Só o socket da sessão tem data; o stdin é lido logo abaixo
+                        if key.data is not None and self.running:
+                            key.data.on_ready(mask)
+                    
+                    # getch sem espera é barato; chamado sempre, também pega o KEY_RESIZE
+                    # e o que o curses já tinha lido do stdin para o buffer dele
+                    if self.running:
+                        self.read_keys()
+                except Exception:
+                    log.exception("Erro no loop principal")
+                    self.running = False
+        finally:
+            if sys.platform != "win32":
+                selector.unregister(sys.stdin)
+    
+    def read_keys(self):
+        """Processa todas as teclas disponíveis e desenha a entrada na hora."""
+        pressed = False
+        while self.running:
+            key = self.input_win.getch()
+            if key == -1:
+                break
+            pressed = True
+            try:
+                self.handle_key(key)
             except Exception as e:
-                print(f"Erro no loop de entrada: {e}")
-                print(traceback.format_exc())
-                self.running = False
+                self.add_message((datetime.now(), f"Erro ao processar entrada: {e}"))
+        if pressed and self.running:
+            self.update_input()
+            self.renderer.render(force=True)
+    
+    def handle_key(self, key):
+        if key == curses.KEY_ENTER or key == 10 or key == 13:  
+            if self.input_text.strip():
+                self.scrollback.follow()
+                self.process_input(self.input_text)
+                self.input_text = ""
+                self.cursor_pos = 0
+        
+        elif key == curses.KEY_BACKSPACE or key == 127 or key == 8:  
+            if self.cursor_pos > 0:
+                self.input_text = self.input_text[:self.cursor_pos-1] + self.input_text[self.cursor_pos:]
+                self.cursor_pos -= 1
+        
+        elif key == curses.KEY_DC or key == 330 or key == 127:  
+            if self.cursor_pos < len(self.input_text):
+                self.input_text = self.input_text[:self.cursor_pos] + self.input_text[self.cursor_pos+1:]
+        
+        elif key == curses.KEY_LEFT or key == 260:  
+            if self.cursor_pos > 0:
+                self.cursor_pos -= 1
+        
+        elif key == curses.KEY_RIGHT or key == 261:  
+            if self.cursor_pos < len(self.input_text):
+                self.cursor_pos += 1
+        
+        elif key == curses.KEY_HOME or key == 262:  
+            self.cursor_pos = 0
+        
+        elif key == curses.KEY_END or key == 360:  
+            self.cursor_pos = len(self.input_text)
+        
+        elif key == curses.KEY_PPAGE:
+            self.scrollback.page_up()
+            self.update_chat()
+        
+        elif key == curses.KEY_NPAGE:
+            self.scrollback.page_down()
+            self.update_chat()
+        
+        elif key == curses.KEY_RESIZE:
+            self.invalidate()
+        
+        elif 32 <= key <= 126:  
+            self.input_text = self.input_text[:self.cursor_pos] + chr(key) + self.input_text[self.cursor_pos:]
+            self.cursor_pos += 1
+        
+        else:
+            self.add_message((datetime.now(), f"Tecla pressionada: {key}"))
     
     def process_input(self, text):
         try:
@@ -324,6 +414,12 @@ class ChatClient:
                 room = text[6:].strip()
                 self.join_room(room)
             
+            elif text == "/history":
+                if self.session.history_done:
+                    self.add_message((datetime.now(), "Não há mensagens mais antigas nesta sala."))
+                else:
+                    self.request_history()
+            
             elif text.startswith("/quit"):
                 self.running = False
                 self.shutdown()
@@ -352,187 +448,149 @@ class ChatClient:
                 else:
                     self.add_message((datetime.now(), "Apenas administradores podem listar palavras bloqueadas."))
             
+            elif text == "/stats":
+                if self.is_admin:
+                    self.session.request_stats()
+                else:
+                    self.add_message((datetime.now(), "Apenas administradores podem ver as estatísticas do servidor."))
+            
             elif text.startswith("/help"):
                 self.add_message((datetime.now(), "Comandos disponíveis:"))
                 self.add_message((datetime.now(), "  /join <sala> - Entrar em uma sala específica"))
                 self.add_message((datetime.now(), "  /whisper <usuario> <mensagem> - Enviar mensagem privada"))
                 self.add_message((datetime.now(), "  /blockword <palavra> - Adicionar palavra à blacklist"))
+                self.add_message((datetime.now(), "  /history - Mostrar mensagens anteriores da sala"))
                 if self.is_admin:
                     self.add_message((datetime.now(), "  /listblocked - Listar palavras bloqueadas (admin)"))
+                    self.add_message((datetime.now(), "  /stats - Estatísticas do servidor (admin)"))
+                self.add_message((datetime.now(), "  PageUp/PageDown - Rolar as mensagens"))
                 self.add_message((datetime.now(), "  /quit - Sair do chat"))
                 self.add_message((datetime.now(), "  /help - Exibir esta ajuda"))
             
             else:
                 self.send_message(text)
-        except Exception as e:
-            print(f"Erro ao processar comando de entrada: {e}")
-            print(traceback.format_exc())
+        except Exception:
+            log.exception("Erro ao processar comando de entrada")
 
     def add_message(self, message):
         try:
             if not isinstance(message, tuple):
                 message = (datetime.now(), message)
-            self.messages.append(message)
+            self.scrollback.append(*message)
             self.update_chat()
-        except Exception as e:
-            print(f"Erro ao adicionar mensagem: {e}")
-            print(traceback.format_exc())
+        except Exception:
+            log.exception("Erro ao adicionar mensagem")
 
     def request_users_list(self):
         try:
-            self.client_socket.send(json.dumps({
-                "type": "get_users",
-                "room": self.current_room
-            }).encode('utf-8'))
+            self.session.request_users()
         except Exception as e:
-            print(f"Erro ao solicitar lista de usuários: {e}")
-            print(traceback.format_exc())
+            log.exception("Erro ao solicitar lista de usuários")
             self.add_message((datetime.now(), f"Erro ao solicitar lista de usuários: {e}"))
 
-    def receive_messages(self):
-        buffer = ""
-        while self.running:
-            try:
-                data = self.client_socket.recv(1024).decode('utf-8')
-                if not data:
-                    break
-                
-                buffer += data
-                
-                # Processar objetos JSON completos
-                while buffer:
-                    try:
-                        # Tentar encontrar um objeto JSON completo
-                        message, index = self._extract_json(buffer)
-                        if message is None:
-                            # JSON incompleto, aguardar mais dados
-                            break
-                        
-                        # Processar a mensagem
-                        if message["type"] == "message":
-                            self.add_message((datetime.now(), message["content"]))
-                            
-                            # Verificar mensagens de entrada/saída de usuários para atualizar lista
-                            content = message["content"]
-                            if " entrou " in content:
-                                username = content.split(" entrou ")[0]
-                                if username not in self.users_in_room:
-                                    self.users_in_room.append(username)
-                                    self.update_users_list()
-                            elif " saiu " in content:
-                                username = content.split(" saiu ")[0]
-                                if username in self.users_in_room:
-                                    self.users_in_room.remove(username)
-                                    self.update_users_list()
-                        
-                        elif message["type"] == "whisper":
-                            self.add_message((datetime.now(), f"SUSSURRO {message['sender']}: {message['content']}"))
-                        
-                        elif message["type"] == "users_list":
-                            self.users_in_room = message["users"]
-                            self.update_users_list()
-                        
-                        elif message["type"] == "blocked_words_list":
-                            words = message.get("words", [])
-                            self.add_message((datetime.now(), f"Lista de palavras bloqueadas ({len(words)}):"))
-                            # Mostrar as palavras em grupos de 5 para não poluir o chat
-                            for i in range(0, len(words), 5):
-                                group = words[i:i+5]
-                                self.add_message((datetime.now(), "  " + ", ".join(group)))
-                        
-                        # Remover a parte processada do buffer
-                        buffer = buffer[index:]
-                    
-                    except ValueError:
-                        # Erro de análise JSON, descartar o buffer
-                        print(f"Erro ao analisar JSON: {buffer}")
-                        buffer = ""
-                        break
-                
-            except Exception as e:
-                print(f"Erro ao receber mensagem: {e}")
-                print(traceback.format_exc())
-                self.running = False
-                break
-    
-    def _extract_json(self, s):
-        """Extrair um objeto JSON completo de uma string."""
-        # Encontrar a chave de abertura
-        start = s.find('{')
-        if start == -1:
-            return None, 0
+    def on_message(self, message):
+        # Mensagens de usuários trazem a hora do servidor (importa no backfill ao entrar na sala)
+        timestamp = datetime.fromtimestamp(message["ts"]) if "ts" in message else datetime.now()
+        self.add_message((timestamp, message["content"]))
+
+    def on_whisper(self, message):
+        self.add_message((datetime.now(), f"SUSSURRO {message['sender']}: {message['content']}"))
+
+    def on_presence(self, message):
+        self.update_users_list()
+
+    def on_event(self, message):
+        if message["type"] == "history":
+            messages = message.get("messages", [])
+            self.add_message((datetime.now(), f"Histórico de {self.current_room} ({len(messages)} mensagens):"))
+            for entry in messages:
+                self.add_message((datetime.fromtimestamp(entry["ts"]), entry["content"]))
         
-        # Analisar o JSON
-        decoder = json.JSONDecoder()
-        try:
-            obj, end = decoder.raw_decode(s[start:])
-            # Retornar o objeto e a posição final
-            return obj, start + end
-        except json.JSONDecodeError:
-            # Se não foi possível decodificar, pode estar incompleto
-            return None, 0
+        elif message["type"] == "error":
+            self.add_message((datetime.now(), message.get("message", f"Erro do servidor: {message.get('code')}")))
+        
+        elif message["type"] == "stats":
+            self.show_stats(message)
+        
+        elif message["type"] == "blocked_words_list":
+            words = message.get("words", [])
+            self.add_message((datetime.now(), f"Lista de palavras bloqueadas ({len(words)}):"))
+            # Mostrar as palavras em grupos de 5 para não poluir o chat
+            for i in range(0, len(words), 5):
+                group = words[i:i+5]
+                self.add_message((datetime.now(), "  " + ", ".join(group)))
+
+    def on_connection(self, connected):
+        if connected:
+            self.update_users_list()
+            self.add_message((datetime.now(), f"Reconectado. Você está na sala: {self.current_room}"))
+        elif self.session.attempt == 1:
+            self.add_message((datetime.now(), "Conexão com o servidor perdida. Reconectando..."))
+        self.update_status()
+
+    def show_stats(self, message):
+        stats = message.get("stats", {})
+        now = datetime.now()
+        self.add_message((now, f"Estatísticas de {message.get('node', 'servidor')}:"))
+        self.add_message((now, f"  conexões: {stats.get('connected_clients')} | salas: {stats.get('rooms')}"
+                               f" | fila de saída: {stats.get('outbox_depth')} (máx. {stats.get('outbox_depth_max')})"))
+        outbox = stats.get("outbox", {})
+        self.add_message((now, f"  descartadas: {outbox.get('dropped')} | coalescidas: {outbox.get('coalesced')}"
+                               f" | desconectados: {outbox.get('evicted')}"
+                               f" | mensagens por escrita: {outbox.get('messages_per_write', 0):.1f}"))
+        if "latency_us" not in stats:
+            self.add_message((now, "  (métricas desligadas no servidor: use --metrics)"))
+            return
+        for name, value in stats.get("counters", {}).items():
+            self.add_message((now, f"  {name}: {value}"))
+        for stage, summary in stats["latency_us"].items():
+            self.add_message((now, f"  {stage}: p50 {summary['p50']:.0f} µs | p99 {summary['p99']:.0f} µs"
+                                   f" | máx. {summary['max']:.0f} µs ({summary['count']} amostras)"))
 
     def send_message(self, message):
         try:
-            self.client_socket.send(json.dumps({
-                "type": "message",
-                "content": message
-            }).encode('utf-8'))
+            self.session.send_message(message)
         except Exception as e:
-            print(f"Erro ao enviar mensagem: {e}")
-            print(traceback.format_exc())
+            log.exception("Erro ao enviar mensagem")
             self.add_message((datetime.now(), f"Erro ao enviar mensagem: {e}"))
 
     def send_whisper(self, target, message):
         try:
-            self.client_socket.send(json.dumps({
-                "type": "whisper",
-                "target": target,
-                "content": message
-            }).encode('utf-8'))
+            self.session.send_whisper(target, message)
         except Exception as e:
-            print(f"Erro ao enviar sussurro: {e}")
-            print(traceback.format_exc())
+            log.exception("Erro ao enviar sussurro")
             self.add_message((datetime.now(), f"Erro ao enviar sussurro: {e}"))
 
     def join_room(self, room):
         try:
-            self.client_socket.send(json.dumps({
-                "type": "join_room",
-                "room": room
-            }).encode('utf-8'))
-            self.current_room = room
-            self.users_in_room = [self.username]  # Resetar lista de usuários, será atualizada pelo servidor
+            self.session.join_room(room)
             self.update_users_list()
             self.update_status()
             self.add_message((datetime.now(), f"Entrando na sala: {room}"))
-            
-            # Solicitar lista atualizada de usuários para a nova sala
-            self.request_users_list()
         except Exception as e:
-            print(f"Erro ao entrar na sala: {e}")
-            print(traceback.format_exc())
+            log.exception("Erro ao entrar na sala")
             self.add_message((datetime.now(), f"Erro ao entrar na sala: {e}"))
 
     def add_blocked_word(self, word):
         try:
-            self.client_socket.send(json.dumps({
-                "type": "add_blocked_word",
-                "word": word
-            }).encode('utf-8'))
+            self.session.add_blocked_word(word)
         except Exception as e:
-            print(f"Erro ao adicionar palavra à blacklist: {e}")
-            print(traceback.format_exc())
+            log.exception("Erro ao adicionar palavra à blacklist")
             self.add_message((datetime.now(), f"Erro ao adicionar palavra à blacklist: {e}"))
 
+    def request_history(self):
+        """Pede a página seguinte (mais antiga) do histórico da sala atual."""
+        try:
+            self.session.request_history()
+        except Exception as e:
+            log.exception("Erro ao solicitar histórico")
+            self.add_message((datetime.now(), f"Erro ao solicitar histórico: {e}"))
+
     def request_blocked_words(self):
         try:
-            self.client_socket.send(json.dumps({
-                "type": "get_blocked_words"
-            }).encode('utf-8'))
+            self.session.request_blocked_words()
         except Exception as e:
-            print(f"Erro ao solicitar palavras bloqueadas: {e}")
-            print(traceback.format_exc())
+            log.exception("Erro ao solicitar palavras bloqueadas")
             self.add_message((datetime.now(), f"Erro ao solicitar palavras bloqueadas: {e}"))
 
     def shutdown(self):
@@ -546,38 +604,50 @@ class ChatClient:
                 curses.nocbreak()
                 curses.echo()
                 curses.endwin()
-            except Exception as e:
-                print(f"Erro ao restaurar configurações do terminal: {e}")
-                print(traceback.format_exc())
+            except Exception:
+                log.exception("Erro ao restaurar configurações do terminal")
         
-        # Fechar socket
+        # Fechar a conexão
         try:
-            self.client_socket.close()
-        except Exception as e:
-            print(f"Erro ao fechar socket: {e}")
-            print(traceback.format_exc())
+            if self.session is not None:
+                self.session.close()
+        except Exception:
+            log.exception("Erro ao fechar socket")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cliente de chat (curses)")
+    parser.add_argument("username", help="nome de usuário")
+    parser.add_argument("--scrollback", type=int, default=DEFAULT_SCROLLBACK,
+                        help="mensagens guardadas na memória para rolar com PageUp/PageDown")
+    parser.add_argument("--scrollback-spill", action="store_true",
+                        help="guardar as mensagens mais antigas num arquivo temporário em vez de descartá-las")
+    parser.add_argument("--fps", type=int, default=DEFAULT_FPS,
+                        help="limite de quadros por segundo ao redesenhar a tela")
+    parser.add_argument("--log-level", choices=logs.LEVELS, default="INFO")
+    parser.add_argument("--log-file",
+                        help="arquivo de log em JSON (sem ele, avisos e erros são mostrados ao sair do chat)")
+    args = parser.parse_args(argv)
+    if args.fps < 1:
+        parser.error("--fps precisa ser >= 1")
+    return args
+
 
 if __name__ == "__main__":
+    args = parse_args()
+    logs.setup(level=args.log_level, file=args.log_file, console=False, deferred=not args.log_file)
     try:
-        if len(sys.argv) < 2:
-            print("Uso: python client.py <nome_de_usuario>")
-            sys.exit(1)
-        
-        username = sys.argv[1]
-        client = ChatClient()
+        client = ChatClient(scrollback=args.scrollback, spill=args.scrollback_spill, fps=args.fps)
         
-        if client.connect(username):
+        if client.connect(args.username):
             try:
                 client.start_ui()
             except KeyboardInterrupt:
                 pass
-            except Exception as e:
-                print(f"Erro no cliente: {e}")
-                print(traceback.format_exc())
+            except Exception:
+                log.exception("Erro no cliente")
             finally:
                 client.shutdown()
         else:
             print("Falha ao conectar ao servidor.")
-    except Exception as e:
-        print(f"Erro não tratado: {e}")
-        print(traceback.format_exc()) 
\ No newline at end of file
+    except Exception:
+        log.exception("Erro não tratado") 
\ No newline at end of file
@@ -0,0 +1,322 @@
+import json
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+
+import logs
+
+DEFAULT_SEGMENT_BYTES = 8 * 1024 * 1024
+DEFAULT_FSYNC_INTERVAL = 1.0
+MAX_PAGE = 100
+DEFAULT_BACKFILL = 50
+DEFAULT_BACKFILL_TOTAL = 100000
+CLEAN_MARKER = "closed"  # Criado por close(); quem abre o diretório o consome
+
+log = logs.get_logger("chat.history")
+
+
+class RoomIndex:
+    """Posição de cada mensagem de uma sala no log: seq -> (segmento, offset).
+
+    Arrays compactos em vez de listas de tuplas: uma sala com milhões de
+    mensagens custa poucos bytes por entrada. As seqs são crescentes, então
+    uma página é encontrada com bisect.
+    """
+
+    __slots__ = ('seqs', 'segments', 'offsets')
+
+    def __init__(self):
+        self.seqs = array('q')
+        self.segments = array('q')
+        self.offsets = array('q')
+
+    def append(self, seq, segment, offset):
+        self.seqs.append(seq)
+        self.segments.append(segment)
+        self.offsets.append(offset)
+
+    def drop_before_segment(self, segment):
+        """Esquece as entradas que estão em segmentos anteriores a `segment` (retenção)."""
+        cut = bisect_left(self.segments, segment)
+        if cut:
+            del self.seqs[:cut]
+            del self.segments[:cut]
+            del self.offsets[:cut]
+
+
+class HistoryStore:
+    """Log append-only do histórico das salas, dividido em segmentos.
+
+    Cada linha de um segmento é um registro JSON {"room", "seq", "ts", "content"}.
+    As seqs são por sala e servem de cursor na paginação: buscar uma página
+    custa O(tamanho da página), não importa há quanto tempo a sala existe.
+    Cada registro vai para o kernel na hora (sobrevive à morte do processo); só o
+    fsync, que protege de uma queda da máquina, é feito em lote por uma thread a
+    cada `fsync_interval` segundos. Segmentos acima de `segment_bytes` são fechados
+    e os mais antigos que `retention` segundos são apagados na rotação.
+
+    `epoch` identifica a numeração das seqs deste diretório: sobrevive a um
+    reinício limpo (close() deixa um marcador) e muda se o diretório for recriado
+    ou se o processo anterior morreu sem close() ou deixou um registro cortado.
+    Nesses casos as últimas seqs podem ter se perdido e seriam reemitidas; um
+    cliente retomando com elas acharia que já viu as mensagens novas.
+    """
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL, retention=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.retention = retention
+        self.rooms = {}     # {room: RoomIndex}
+        self.next_seq = {}  # {room: próxima seq}
+        self._lock = threading.Lock()
+        self._segments = []  # ids dos segmentos existentes, em ordem
+        self._writer = None
+        self._writer_size = 0
+        self._readers = {}  # {segmento: arquivo aberto para leitura}
+        self._dirty = False
+        self._handoff = []  # fds (dup) de segmentos fechados na rotação, à espera do fsync
+        self._stop = threading.Event()
+        self._thread = None
+
+        os.makedirs(directory, exist_ok=True)
+        clean = self._take_clean_marker()
+        torn = self._load()
+        self.epoch = self._load_epoch(renew=not clean or torn)
+        self._open_writer(self._segments[-1] if self._segments else 1)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sync_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            fds = self._unsynced()
+            self._writer.close()
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
+        self._fsync(fds)
+        with open(os.path.join(self.directory, CLEAN_MARKER), "w"):
+            pass
+
+    def append(self, room, content):
+        """Grava uma mensagem da sala e retorna o registro com a seq atribuída."""
+        with self._lock:
+            seq = self.next_seq.get(room, 1)
+            self.next_seq[room] = seq + 1
+            record = {"room": room, "seq": seq, "ts": time.time(), "content": content}
+            line = (json.dumps(record) + "\n").encode('utf-8')
+
+            if self._writer_size and self._writer_size + len(line) > self.segment_bytes:
+                self._rotate()
+            offset = self._writer_size
+            self._writer.write(line)
+            self._writer.flush()
+            self._writer_size += len(line)
+            self._dirty = True
+
+            index = self.rooms.get(room)
+            if index is None:
+                index = self.rooms[room] = RoomIndex()
+            index.append(seq, self._segments[-1], offset)
+            return record
+
+    def page(self, room, before=None, limit=50):
+        """Retorna (mensagens, cursor) com até `limit` mensagens anteriores à seq `before`.
+
+        Sem `before`, retorna as mais recentes. As mensagens vêm em ordem cronológica;
+        o cursor é a seq a passar como `before` para a página seguinte (None no fim).
+        """
+        limit = max(1, min(limit, MAX_PAGE))
+        with self._lock:
+            index = self.rooms.get(room)
+            if index is None:
+                return [], None
+            end = len(index.seqs) if before is None else bisect_left(index.seqs, before)
+            start = max(0, end - limit)
+            messages = []
+            for i in range(start, end):
+                record = self._read(index.segments[i], index.offsets[i])
+                messages.append({"seq": record["seq"], "ts": record["ts"], "content": record["content"]})
+            cursor = index.seqs[start] if start > 0 else None
+            return messages, cursor
+
+    def since(self, room, after, limit=MAX_PAGE):
+        """As mensagens com seq maior que `after`, em ordem cronológica (as `limit` mais recentes)."""
+        with self._lock:
+            index = self.rooms.get(room)
+            if index is None:
+                return []
+            start = max(bisect_left(index.seqs, after + 1), len(index.seqs) - limit)
+            messages = []
+            for i in range(start, len(index.seqs)):
+                record = self._read(index.segments[i], index.offsets[i])
+                messages.append({"seq": record["seq"], "ts": record["ts"], "content": record["content"]})
+            return messages
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:010d}.log")
+
+    def _read(self, segment, offset):
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = self._readers[segment] = open(self._path(segment), 'rb')
+        reader.seek(offset)
+        return json.loads(reader.readline())
+
+    def _take_clean_marker(self):
+        """Consome o marcador do último close(); sem ele, o processo anterior não fechou o log."""
+        try:
+            os.remove(os.path.join(self.directory, CLEAN_MARKER))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _load_epoch(self, renew=False):
+        path = os.path.join(self.directory, "epoch")
+        if not renew:
+            try:
+                with open(path) as file:
+                    return file.read().strip()
+            except FileNotFoundError:
+                pass
+        elif os.path.exists(path):
+            log.warning("Histórico não foi fechado corretamente; seqs ganham um novo epoch", path=self.directory)
+        epoch = os.urandom(8).hex()
+        with open(path, "w") as file:
+            file.write(epoch)
+        return epoch
+
+    def _load(self):
+        """Reconstrói os índices a partir dos segmentos existentes. Retorna True se achou um registro cortado."""
+        torn = False
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(".log"))
+        for name in names:
+            segment = int(name[:-4])
+            self._segments.append(segment)
+            path = self._path(segment)
+            offset = 0
+            with open(path, 'rb') as file:
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break  # Registro cortado por uma queda no meio da escrita
+                    record = json.loads(line)
+                    room = record["room"]
+                    index = self.rooms.get(room)
+                    if index is None:
+                        index = self.rooms[room] = RoomIndex()
+                    index.append(record["seq"], segment, offset)
+                    self.next_seq[room] = record["seq"] + 1
+                    offset += len(line)
+            if offset != os.path.getsize(path):
+                torn = True
+                with open(path, 'r+b') as file:
+                    file.truncate(offset)
+        if names:
+            log.info("Histórico carregado", rooms=len(self.rooms), segments=len(names), path=self.directory)
+        return torn
+
+    def _open_writer(self, segment):
+        if not self._segments or self._segments[-1] != segment:
+            self._segments.append(segment)
+        self._writer = open(self._path(segment), 'ab')
+        self._writer_size = self._writer.tell()
+
+    def _rotate(self):
+        # O fsync do segmento que fecha fica para a thread de sync, fora do lock
+        self._handoff.extend(self._unsynced())
+        self._writer.close()
+        self._open_writer(self._segments[-1] + 1)
+        self._apply_retention()
+
+    def _apply_retention(self):
+        if self.retention is None:
+            return
+        limit = time.time() - self.retention
+        removed = False
+        # O segmento atual nunca é apagado
+        while len(self._segments) > 1 and os.path.getmtime(self._path(self._segments[0])) < limit:
+            segment = self._segments.pop(0)
+            reader = self._readers.pop(segment, None)
+            if reader is not None:
+                reader.close()
+            os.remove(self._path(segment))
+            removed = True
+        if removed:
+            oldest = self._segments[0]
+            for room in list(self.rooms):
+                index = self.rooms[room]
+                index.drop_before_segment(oldest)
+                if not index.seqs:
+                    del self.rooms[room]
+
+    def _unsynced(self):
+        """Com o lock: retorna cópias (dup) dos fds que ainda precisam de fsync."""
+        fds, self._handoff = self._handoff, []
+        if self._dirty:
+            fds.append(os.dup(self._writer.fileno()))
+            self._dirty = False
+        return fds
+
+    def _fsync(self, fds):
+        # Sem o lock: um fsync pode levar centenas de ms e append() não espera por ele
+        for fd in fds:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _sync_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            with self._lock:
+                fds = self._unsynced()
+            self._fsync(fds)
+
+
+class RecentMessages:
+    """Últimas mensagens de cada sala, guardadas já codificadas (EncodedMessage).
+
+    Quem entra numa sala recebe essas mensagens sem ler o disco nem serializar de
+    novo. Cada sala guarda no máximo `per_room` mensagens e todas juntas no máximo
+    `total`; passando disso, as salas sem mensagens há mais tempo são esquecidas.
+    """
+
+    def __init__(self, per_room=DEFAULT_BACKFILL, total=DEFAULT_BACKFILL_TOTAL):
+        self.per_room = per_room
+        self.total = total
+        self._rooms = OrderedDict()  # {room: deque}, da sala parada há mais tempo para a mais ativa
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def add(self, room, encoded):
+        if self.per_room <= 0:
+            return
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is None:
+                buffer = self._rooms[room] = deque(maxlen=self.per_room)
+            else:
+                self._rooms.move_to_end(room)
+            if len(buffer) == self.per_room:
+                self._size -= 1  # O append descarta a mais antiga
+            buffer.append(encoded)
+            self._size += 1
+            while self._size > self.total and len(self._rooms) > 1:
+                _, evicted = self._rooms.popitem(last=False)
+                self._size -= len(evicted)
+
+    def snapshot(self, room):
+        with self._lock:
+            return list(self._rooms.get(room, ()))
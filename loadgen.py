@@ -0,0 +1,419 @@
+"""Gerador de carga para o servidor de chat.
+
+Simula milhares de usuários sem interface, falando o mesmo protocolo do client.py,
+num único event loop asyncio. Cada usuário envia mensagens, sussurros e trocas de
+sala na proporção de --mix; o conteúdo leva o instante do envio, então quem recebe
+mede a latência ponta a ponta. No fim são mostrados os percentis de latência, a
+vazão e a memória (RSS) do servidor.
+
+Uso: python loadgen.py --users 1000 --rooms 10 --rate 1 --duration 30
+     python loadgen.py --spawn "python server.py --engine asyncio --no-rate-limit" --users 2000
+
+Os limites de taxa padrão do servidor recusam boa parte de uma carga sintética;
+para medir o servidor em si, suba-o com --no-rate-limit. Se a CPU do gerador
+ficar perto de 100%, os números medem o gerador, não o servidor.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shlex
+import signal
+import socket
+import subprocess
+import time
+
+from metrics import Histogram, PERCENTILES
+from protocol import Codec, PROTOCOL_VERSION, JSON, MSGPACK, DEFLATE
+
+KINDS = ("message", "whisper", "join")
+MARKER = re.compile(r"\[lg:(\d+)\]")
+DEFAULT_MIX = "message=80,whisper=15,join=5"
+
+
+def parse_mix(spec):
+    """Converte "message=80,whisper=15,join=5" em ([tipos], [pesos])."""
+    kinds, weights = [], []
+    for part in spec.split(","):
+        try:
+            kind, weight = part.split("=", 1)
+            weight = float(weight)
+        except ValueError:
+            raise SystemExit(f"mix inválido: {part!r} (esperado tipo=peso)")
+        if kind not in KINDS:
+            raise SystemExit(f"tipo inválido no mix: {kind!r}; use {', '.join(KINDS)}")
+        if weight > 0:
+            kinds.append(kind)
+            weights.append(weight)
+    if not kinds:
+        raise SystemExit("o mix precisa de pelo menos um tipo com peso > 0")
+    return kinds, weights
+
+
+def read_rss(pid):
+    """RSS em bytes do processo `pid` e de todos os seus filhos (workers). None fora do Linux."""
+    total = 0
+    pending = [pid]
+    try:
+        while pending:
+            current = pending.pop()
+            with open(f"/proc/{current}/status") as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for task in os.listdir(f"/proc/{current}/task"):
+                try:
+                    with open(f"/proc/{current}/task/{task}/children") as file:
+                        pending.extend(int(child) for child in file.read().split())
+                except OSError:
+                    pass
+    except OSError:
+        return None
+    return total
+
+
+class LoadStats:
+    """Contadores e histogramas (em ns) de uma rodada do gerador."""
+
+    def __init__(self):
+        self.latency = {"message": Histogram(), "whisper": Histogram()}
+        self.connect = Histogram()
+        self.sent = dict.fromkeys(KINDS, 0)
+        self.received = {}
+        self.connected = 0
+        self.failed = 0
+        self.disconnected = 0
+        self.rate_limited = 0
+        self.rss = []
+
+    def summary(self, elapsed, cpu):
+        result = {
+            "users": self.connected,
+            "failed": self.failed,
+            "disconnected": self.disconnected,
+            "duration": round(elapsed, 3),
+            "sent": dict(self.sent),
+            "sent_per_second": round(sum(self.sent.values()) / elapsed, 1),
+            "received": dict(self.received),
+            "delivered_per_second": round(sum(h.count for h in self.latency.values()) / elapsed, 1),
+            "rate_limited": self.rate_limited,
+            "latency_ms": {},
+            "connect_ms": _percentiles(self.connect),
+            "loadgen_cpu": round(cpu / elapsed, 3),
+        }
+        for kind, histogram in self.latency.items():
+            result["latency_ms"][kind] = _percentiles(histogram)
+        samples = [rss for rss in self.rss if rss is not None]
+        if samples:
+            result["server_rss_mib"] = {"start": _mib(samples[0]), "peak": _mib(max(samples)), "end": _mib(samples[-1])}
+        return result
+
+
+def _percentiles(histogram):
+    summary = {"count": histogram.count}
+    for percent in PERCENTILES:
+        summary[f"p{percent:g}"] = round(histogram.percentile(percent) / 1e6, 3)
+    summary["max"] = round(histogram.max / 1e6, 3)
+    return summary
+
+
+def _mib(value):
+    return round(value / (1024 * 1024), 1)
+
+
+class SimulatedUser:
+    """Uma conexão do gerador: faz o handshake, envia a carga e mede o que recebe."""
+
+    def __init__(self, name, room, args, stats):
+        self.name = name
+        self.room = room
+        self.args = args
+        self.stats = stats
+        self.codec = Codec()
+        self.reader = None
+        self.writer = None
+        self.closed = False
+        self.joined_at = 0  # Mensagens enviadas antes disso são backfill, não entram na latência
+
+    async def connect(self):
+        start = time.perf_counter_ns()
+        self.reader, self.writer = await asyncio.open_connection(self.args.host, self.args.port)
+        self.writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        hello = {"username": self.name, "version": PROTOCOL_VERSION, "encodings": [self.args.encoding]}
+        if not self.args.no_compression:
+            hello["compression"] = [DEFLATE]
+        self.writer.write(self.codec.encode(hello))
+
+        welcome = None
+        while welcome is None:
+            data = await self.reader.read(65536)
+            if not data:
+                raise ConnectionError("servidor encerrou a conexão no handshake")
+            self.codec.feed(data)
+            welcome = self.codec.next_message()
+        if welcome.get("type") != "welcome":
+            raise ConnectionError("servidor não fala o protocolo com frames (versão 2)")
+        self.codec.upgrade(welcome["version"], welcome.get("encoding", JSON), welcome.get("compression"))
+        self.name = welcome.get("username", self.name)
+        self.joined_at = time.perf_counter_ns()
+        self.stats.connect.record(self.joined_at - start)
+        if self.room != "general":
+            self.send({"type": "join_room", "room": self.room})
+
+    def send(self, message):
+        self.writer.write(self.codec.encode(message))
+
+    async def receive(self):
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                now = time.perf_counter_ns()
+                self.codec.feed(data)
+                for message in self.codec:
+                    self.handle(message, now)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        if not self.closed:
+            self.stats.disconnected += 1
+
+    def handle(self, message, now):
+        kind = message.get("type")
+        self.stats.received[kind] = self.stats.received.get(kind, 0) + 1
+        if kind == "message" or kind == "whisper":
+            match = MARKER.search(message.get("content", ""))
+            if match is not None:
+                sent = int(match.group(1))
+                if sent >= self.joined_at:
+                    self.stats.latency[kind].record(now - sent)
+        elif kind == "error" and message.get("code") == "rate_limited":
+            self.stats.rate_limited += 1
+
+    async def run(self, users, stop_at):
+        """Envia a carga em intervalos exponenciais (processo de Poisson) até `stop_at`."""
+        args = self.args
+        kinds, weights = args.mix
+        while True:
+            delay = random.expovariate(args.rate)
+            if time.perf_counter() + delay >= stop_at:
+                return
+            await asyncio.sleep(delay)
+            if self.writer.is_closing():
+                return
+            kind = random.choices(kinds, weights)[0]
+            if kind == "join":
+                self.room = random.choice(args.room_names)
+                self.joined_at = time.perf_counter_ns()
+                self.send({"type": "join_room", "room": self.room})
+            else:
+                content = self.content()
+                if kind == "whisper":
+                    target = random.choice(users).name
+                    self.send({"type": "whisper", "target": target, "content": content})
+                else:
+                    self.send({"type": "message", "content": content})
+            self.stats.sent[kind] += 1
+
+    def content(self):
+        words = ["mensagem"] * self.args.words
+        if self.args.profanity and random.random() < self.args.profanity:
+            # Exercita o censor_message com palavras que ele precisa trocar
+            words[random.randrange(len(words))] = random.choice(self.args.bad_words)
+        return f"{' '.join(words)} [lg:{time.perf_counter_ns()}]"
+
+    def close(self):
+        self.closed = True
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def sample_rss(pid, stats, interval=1.0):
+    while True:
+        stats.rss.append(read_rss(pid))
+        await asyncio.sleep(interval)
+
+
+async def run(args, server_pid=None):
+    stats = LoadStats()
+    room_names = ["general"] + [f"sala{i}" for i in range(1, args.rooms)]
+    args.room_names = room_names
+    users = [SimulatedUser(f"{args.prefix}{i}", room_names[i % len(room_names)], args, stats)
+             for i in range(args.users)]
+
+    sampler = None
+    if server_pid is not None:
+        sampler = asyncio.get_running_loop().create_task(sample_rss(server_pid, stats))
+
+    # Conectar aos poucos: o servidor com threads tem backlog de listen pequeno
+    gate = asyncio.Semaphore(args.connect_concurrency)
+
+    async def connect(user):
+        async with gate:
+            try:
+                await user.connect()
+                stats.connected += 1
+                return user
+            except (ConnectionError, OSError, ValueError) as e:
+                stats.failed += 1
+                if stats.failed == 1:
+                    print(f"Falha ao conectar {user.name}: {e}")
+                return None
+
+    start = time.perf_counter()
+    connected = [user for user in await asyncio.gather(*(connect(u) for u in users)) if user is not None]
+    print(f"{len(connected)} usuários conectados em {time.perf_counter() - start:.2f}s ({stats.failed} falhas)")
+    if not connected:
+        raise SystemExit("nenhum usuário conseguiu conectar")
+
+    receivers = [asyncio.get_running_loop().create_task(user.receive()) for user in connected]
+    await asyncio.sleep(args.settle)  # Backfill e listas de usuários da entrada não contam
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    stop_at = start + args.duration
+    await asyncio.gather(*(user.run(connected, stop_at) for user in connected))
+    await asyncio.sleep(args.drain)  # Esperar as mensagens ainda no caminho
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    if server_pid is not None:
+        stats.rss.append(read_rss(server_pid))
+        sampler.cancel()
+    for user in connected:
+        user.close()
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    return stats.summary(elapsed, cpu)
+
+
+def report(summary):
+    print(f"\nDuração: {summary['duration']:.1f}s | usuários: {summary['users']}"
+          f" | desconectados durante o teste: {summary['disconnected']}")
+    sent = ", ".join(f"{kind} {count}" for kind, count in summary["sent"].items())
+    print(f"Enviadas: {sent} ({summary['sent_per_second']:.0f}/s)")
+    print(f"Entregues com marca de tempo: {summary['delivered_per_second']:.0f}/s"
+          f" | recusadas pelo limite de taxa: {summary['rate_limited']}")
+    columns = [f"p{p:g}" for p in PERCENTILES] + ["max"]
+    print(f"\n{'latência (ms)':<14} {'amostras':>9} " + " ".join(f"{c:>8}" for c in columns))
+    rows = list(summary["latency_ms"].items()) + [("conexão", summary["connect_ms"])]
+    for name, row in rows:
+        print(f"{name:<14} {row['count']:>9} " + " ".join(f"{row[c]:>8.2f}" for c in columns))
+    if "server_rss_mib" in summary:
+        rss = summary["server_rss_mib"]
+        print(f"\nRSS do servidor: início {rss['start']} MiB | pico {rss['peak']} MiB | fim {rss['end']} MiB")
+    print(f"CPU do gerador: {summary['loadgen_cpu']:.0%}")
+
+
+def wait_for_port(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def raise_fd_limit(needed):
+    """Sobe o limite de descritores abertos até o máximo permitido, se preciso (Unix)."""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def load_bad_words(path):
+    try:
+        with open(path, encoding='utf-8') as file:
+            return [word.strip() for word in file if word.strip()]
+    except OSError:
+        return []
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Gerador de carga para o servidor de chat")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--users", type=int, default=500, help="usuários simulados")
+    parser.add_argument("--rooms", type=int, default=10, help="salas (general e sala1..salaN-1)")
+    parser.add_argument("--rate", type=float, default=0.5, help="ações por segundo de cada usuário")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"proporção das ações (padrão: {DEFAULT_MIX})")
+    parser.add_argument("--duration", type=float, default=20.0, help="segundos de carga")
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="segundos entre conectar todos e começar a medir")
+    parser.add_argument("--drain", type=float, default=1.0,
+                        help="segundos esperando entregas depois do último envio")
+    parser.add_argument("--words", type=int, default=8, help="palavras por mensagem")
+    parser.add_argument("--profanity", type=float, default=0.1,
+                        help="fração das mensagens com uma palavra da blacklist (exercita o censor)")
+    parser.add_argument("--blacklist", default="palavras_bloqueadas.txt",
+                        help="de onde tirar as palavras de --profanity")
+    parser.add_argument("--encoding", choices=[JSON, MSGPACK], default=JSON)
+    parser.add_argument("--no-compression", action="store_true", help="não pedir deflate no handshake")
+    parser.add_argument("--connect-concurrency", type=int, default=50, help="conexões abertas ao mesmo tempo")
+    parser.add_argument("--prefix", default="lg", help="prefixo dos nomes dos usuários simulados")
+    parser.add_argument("--spawn", metavar="COMANDO",
+                        help='sobe o servidor com esse comando (ex.: "python server.py --no-rate-limit") e mede seu RSS')
+    parser.add_argument("--server-pid", type=int, help="pid de um servidor já rodando, para medir o RSS")
+    parser.add_argument("--seed", type=int, help="semente do gerador aleatório (carga reproduzível)")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON (para comparar rodadas)")
+    args = parser.parse_args(argv)
+    args.mix = parse_mix(args.mix)
+    args.rooms = max(1, args.rooms)
+    if args.rate <= 0:
+        parser.error("--rate precisa ser > 0")
+    args.bad_words = load_bad_words(args.blacklist)
+    if not args.bad_words:
+        args.profanity = 0
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    raise_fd_limit(args.users + 256)
+
+    server = None
+    server_pid = args.server_pid
+    if args.spawn:
+        command = shlex.split(args.spawn)
+        if "--port" not in command:
+            command += ["--port", str(args.port)]
+        # Grupo de processos próprio: o SIGINT do fim chega também aos workers, como o Ctrl+C no terminal
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL, start_new_session=hasattr(os, "killpg"))
+        server_pid = server.pid
+        if not wait_for_port(args.host, args.port):
+            server.kill()
+            raise SystemExit("o servidor não abriu a porta a tempo")
+    try:
+        summary = asyncio.run(run(args, server_pid))
+    finally:
+        if server is not None:
+            if hasattr(os, "killpg"):
+                os.killpg(server.pid, signal.SIGINT)
+            else:
+                server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        report(summary)
+
+
+if __name__ == "__main__":
+    main()
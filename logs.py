@@ -0,0 +1,189 @@
+"""Logs estruturados e não bloqueantes do servidor e do cliente.
+
+Quem loga só enfileira o registro (QueueHandler); uma thread (QueueListener)
+formata e escreve no terminal e/ou num arquivo com rotação, então uma conexão
+nunca espera pelo lock do stdout nem pelo disco. Os campos passados como
+argumentos nomeados viram chaves do JSON:
+
+    log = get_logger("chat.server")
+    log.info("Conexão estabelecida", event="connect", address=address)
+
+Eventos frequentes podem ser amostrados pelo campo `event` (ver SamplingFilter).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from collections import deque
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+FORMATS = ("text", "json")
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+
+_listener = None
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Logger que aceita campos como argumentos nomeados: log.info("msg", room=room)."""
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs)
+                  if key not in ("exc_info", "stack_info", "stacklevel", "extra")}
+        kwargs["extra"] = {"fields": fields}
+        return msg, kwargs
+
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(name), {})
+
+
+class JsonFormatter(logging.Formatter):
+    """Um objeto JSON por linha: ts, level, logger, msg, campos e o traceback (exc)."""
+
+    def format(self, record):
+        entry = {"ts": round(record.created, 6), "level": record.levelname,
+                 "logger": record.name, "msg": record.getMessage()}
+        entry.update(getattr(record, "fields", ()))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Para o terminal: a mensagem seguida de chave=valor, como os prints de antes."""
+
+    def format(self, record):
+        text = record.getMessage()
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.levelno >= logging.WARNING:
+            text = f"[{record.levelname}] {text}"
+        if record.exc_text:
+            text += "\n" + record.exc_text
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar só 1 de cada N registros de um evento frequente.
+
+    `rates` é {evento: N}; o evento é o campo `event` do registro. Os registros
+    que passam ganham o campo sampled=N, para quem lê saber multiplicar.
+    A contagem não tem lock: sob concorrência a taxa é aproximada.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.counts = {}
+
+    def filter(self, record):
+        fields = getattr(record, "fields", None)
+        rate = self.rates.get(fields.get("event")) if fields else None
+        if not rate or rate <= 1:
+            return True
+        event = fields["event"]
+        seen = self.counts.get(event, 0)
+        self.counts[event] = seen + 1
+        if seen % rate:
+            return False
+        fields["sampled"] = rate
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # A formatação fica para a thread do listener; só o traceback vira texto
+        # aqui, enquanto os frames ainda existem
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class DeferredHandler(logging.Handler):
+    """Guarda os últimos registros e só os escreve no fim do programa.
+
+    Para o cliente: escrever no terminal com o curses ativo estraga a tela.
+    """
+
+    def __init__(self, stream=None, capacity=200, level=logging.WARNING):
+        super().__init__(level)
+        self.stream = stream
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+
+    def close(self):
+        stream = self.stream or sys.stderr
+        for text in self.records:
+            stream.write(text + "\n")
+        self.records.clear()
+        stream.flush()
+        super().close()
+
+
+def parse_samples(specs):
+    """Converte ["connect=100", ...] em {"connect": 100}."""
+    rates = {}
+    for spec in specs:
+        try:
+            event, rate = spec.split("=", 1)
+            rates[event] = int(rate)
+        except ValueError:
+            raise SystemExit(f"amostragem inválida: {spec!r} (esperado evento=N)")
+    return rates
+
+
+def setup(level="INFO", console_format="text", file=None, max_bytes=DEFAULT_MAX_BYTES,
+          backups=DEFAULT_BACKUPS, sample=None, console=True, deferred=False):
+    """Liga o pipeline: logger raiz -> fila -> thread que escreve no terminal e/ou no arquivo.
+
+    O arquivo (com rotação por tamanho) é sempre JSON. `deferred` guarda os avisos e
+    erros para mostrar no stderr quando o programa terminar, em vez do terminal.
+    Chamar de novo (ex.: num worker recém-criado) substitui a configuração anterior.
+    """
+    global _listener
+    shutdown()
+    handlers = []
+    if console:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter() if console_format == "json" else TextFormatter())
+        handlers.append(handler)
+    if deferred:
+        handler = DeferredHandler()
+        handler.setFormatter(TextFormatter())
+        handlers.append(handler)
+    if file:
+        handler = logging.handlers.RotatingFileHandler(file, maxBytes=max_bytes, backupCount=backups,
+                                                       encoding="utf-8")
+        handler.setFormatter(JsonFormatter())
+        handlers.append(handler)
+
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    if sample:
+        # Filtrar antes de enfileirar: o registro descartado não custa nada à thread de escrita
+        handler.addFilter(SamplingFilter(sample))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown():
+    """Escreve o que ainda está na fila, para a thread de escrita e fecha os destinos."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,194 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import logs
+
+now_ns = time.perf_counter_ns
+
+# Limites (em segundos) dos buckets exportados para o Prometheus
+EXPORT_BUCKETS = [m * 10 ** e for e in range(-6, 1) for m in (1, 2.5, 5)]
+PERCENTILES = (50, 90, 99, 99.9)
+
+log = logs.get_logger("chat.metrics")
+
+
+class Histogram:
+    """Histograma log-linear no estilo HDR para durações em nanossegundos.
+
+    Cada potência de 2 é dividida em 2**precision sub-buckets, então o erro
+    relativo de um percentil fica abaixo de 1/2**precision (12,5% com 3 bits)
+    e registrar um valor é O(1), sem alocar nada.
+    """
+
+    def __init__(self, precision=3, max_bits=40):
+        self.precision = precision
+        self.sub = 1 << precision
+        self.counts = [0] * ((max_bits - precision + 1) * self.sub)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self._lock = threading.Lock()
+
+    def index(self, value):
+        if value < self.sub:
+            return value
+        shift = value.bit_length() - self.precision - 1
+        return min((shift + 1) * self.sub + (value >> shift) - self.sub, len(self.counts) - 1)
+
+    def upper_bound(self, index):
+        """Maior valor que cai no bucket `index`."""
+        if index < self.sub:
+            return index
+        shift = index // self.sub - 1
+        mantissa = self.sub + index % self.sub
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        index = self.index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        with self._lock:
+            counts, count, top = list(self.counts), self.count, self.max
+        if not count:
+            return 0
+        target = max(1, int(count * percent / 100 + 0.5))
+        seen = 0
+        for index, n in enumerate(counts):
+            seen += n
+            if seen >= target:
+                return min(self.upper_bound(index), top)
+        return top
+
+    def cumulative(self, bounds_ns):
+        """Contagem acumulada de valores <= cada limite (aproximada pelos buckets)."""
+        with self._lock:
+            counts = list(self.counts)
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds_ns:
+            while index < len(counts) and self.upper_bound(index) <= bound:
+                seen += counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+
+class Metrics:
+    """Contadores e histogramas de latência do servidor.
+
+    O servidor só chama estes métodos quando as métricas estão ligadas
+    (ChatServer.metrics não é None); desligadas, custam um `if` por etapa.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._counters = {}    # {(nome, (("rótulo", valor), ...)): valor}
+        self._histograms = {}  # {etapa: Histogram}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, stage, elapsed_ns):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram())
+        histogram.record(elapsed_ns)
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def latencies(self):
+        """{etapa: {"count", "p50", "p90", "p99", "p99.9", "max"}} em microssegundos."""
+        result = {}
+        for stage, histogram in list(self._histograms.items()):
+            summary = {"count": histogram.count, "max": histogram.max / 1000}
+            for percent in PERCENTILES:
+                summary[f"p{percent:g}"] = histogram.percentile(percent) / 1000
+            result[stage] = summary
+        return result
+
+    def render(self, gauges=(), totals=()):
+        """Texto no formato de exposição do Prometheus.
+
+        `gauges` são (nome, ajuda, rótulos, valor) calculados na hora pelo servidor;
+        `totals` são (nome, valor) de contadores que o servidor já mantém por conta própria.
+        """
+        lines = []
+        by_name = {}
+        for (name, labels), value in sorted(self.counters().items()):
+            by_name.setdefault(name, []).append((dict(labels), value))
+        for name, value in totals:
+            by_name.setdefault(name, []).append(({}, value))
+        for name, samples in by_name.items():
+            lines.append(f"# TYPE chat_{name}_total counter")
+            for labels, value in samples:
+                lines.append(f"chat_{name}_total{_labels(labels)} {value}")
+
+        gauge_names = set()
+        for name, help_text, labels, value in gauges:
+            if name not in gauge_names:
+                gauge_names.add(name)
+                lines.append(f"# HELP chat_{name} {help_text}")
+                lines.append(f"# TYPE chat_{name} gauge")
+            lines.append(f"chat_{name}{_labels(labels)} {value}")
+
+        lines.append("# HELP chat_stage_seconds Latência de cada etapa do processamento de mensagens")
+        lines.append("# TYPE chat_stage_seconds histogram")
+        bounds = [int(b * 1e9) for b in EXPORT_BUCKETS]
+        for stage, histogram in sorted(self._histograms.items()):
+            for bound, count in zip(EXPORT_BUCKETS, histogram.cumulative(bounds)):
+                lines.append(f'chat_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {count}')
+            lines.append(f'chat_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'chat_stage_seconds_sum{{stage="{stage}"}} {histogram.total / 1e9}')
+            lines.append(f'chat_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def serve(host, port, render):
+    """Sobe um endpoint HTTP (GET /metrics) numa thread; `render()` gera o texto a cada coleta."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Uma linha por coleta só poluiria o log do servidor
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    log.info("Endpoint de métricas no ar", url=f"http://{host}:{port}/metrics")
+    return httpd
@@ -0,0 +1,315 @@
+import asyncio
+import socket
+import threading
+import time
+from collections import deque
+
+# Políticas aplicadas quando a fila de um cliente atinge o limite (high-water mark)
+DROP_OLDEST = "drop_oldest"   # descarta a mensagem mais antiga da fila
+COALESCE = "coalesce"         # substitui snapshots obsoletos (ex.: users_list); senão descarta a mais antiga
+DISCONNECT = "disconnect"     # desconecta o cliente com uma mensagem do sistema
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+DEFAULT_LIMIT = 1000
+FINAL_TIMEOUT = 1.0  # Tempo máximo para entregar a mensagem de despedida
+MAX_BATCH = 512  # Mensagens por sendmsg; o limite de iovecs do kernel costuma ser 1024
+
+
+def send_buffers(sock, buffers):
+    """sendall para uma lista de buffers, com um sendmsg (writev) por tentativa.
+
+    Retorna o número de syscalls. Sem sendmsg (Windows), junta tudo num sendall.
+    """
+    if not hasattr(sock, "sendmsg"):
+        sock.sendall(b"".join(buffers))
+        return 1
+    calls = 0
+    start = 0
+    while start < len(buffers):
+        sent = sock.sendmsg(buffers[start:start + MAX_BATCH])
+        calls += 1
+        # Envio parcial: pular os buffers completos e cortar o primeiro que sobrou
+        while start < len(buffers) and sent >= len(buffers[start]):
+            sent -= len(buffers[start])
+            start += 1
+        if sent:
+            buffers[start] = memoryview(buffers[start])[sent:]
+    return calls
+
+
+class BaseOutbox:
+    """Fila de saída limitada de uma conexão.
+
+    Quem envia (broadcast, whisper...) só enfileira bytes já codificados e segue
+    em frente. Mensagens com a mesma chave (key) são snapshots que se substituem
+    na política COALESCE. Quando a fila está cheia e a política é DISCONNECT,
+    on_evict é chamado para o servidor desconectar o cliente.
+
+    O escritor manda tudo o que estiver na fila numa única escrita. Com `window`
+    (segundos) ele ainda espera esse tempo depois da primeira mensagem para juntar
+    mais; com 0, escreve assim que fica livre. `messages`/`writes` medem o agrupamento.
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT, policy=DROP_OLDEST, on_error=None, on_evict=None, window=0):
+        if policy not in POLICIES:
+            raise ValueError(f"política de fila desconhecida: {policy}")
+        self.limit = limit
+        self.policy = policy
+        self.on_error = on_error
+        self.on_evict = on_evict
+        self.window = window
+        self.closed = False
+        self.dropped = 0
+        self.coalesced = 0
+        self.messages = 0
+        self.writes = 0
+        self._queue = deque()  # (dados, chave)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _admit(self, data, key):
+        """Coloca um item na fila aplicando a política. Retorna False se o cliente deve ser desconectado."""
+        queue = self._queue
+        if key is not None and self.policy == COALESCE:
+            for i, (_, queued_key) in enumerate(queue):
+                if queued_key == key:
+                    queue[i] = (data, key)
+                    self.coalesced += 1
+                    return True
+
+        if len(queue) >= self.limit:
+            if self.policy == DISCONNECT:
+                self.dropped += len(queue) + 1
+                queue.clear()
+                return False
+            queue.popleft()
+            self.dropped += 1
+
+        queue.append((data, key))
+        return True
+
+
+class Outbox(BaseOutbox):
+    """Fila de saída esvaziada por uma thread própria; um cliente lento bloqueia
+    apenas a sua própria thread de escrita.
+
+    A thread também é dona do fechamento do socket: close() a acorda para tentar
+    enviar a mensagem final e derrubar a conexão.
+    """
+
+    def __init__(self, sock, **kwargs):
+        super().__init__(**kwargs)
+        self.sock = sock
+        self._cond = threading.Condition()
+        self._sending = False
+        self._final = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, data, key=None):
+        """Enfileira bytes para envio. Retorna False se a fila já foi fechada."""
+        with self._cond:
+            if self.closed:
+                return False
+            admitted = self._admit(data, key)
+            self._cond.notify()
+        if not admitted and self.on_evict:
+            self.on_evict()
+        return admitted
+
+    def close(self, final=None):
+        """Descarta a fila, tenta enviar `final` e fecha o socket."""
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self._queue.clear()
+            busy = self._sending
+            self._final = None if busy else final
+            self._cond.notify()
+        if busy:
+            # A thread está presa num sendall: derrubar o socket para liberá-la
+            self._shutdown()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self.closed:
+                    self._cond.wait()
+                if self.window:
+                    deadline = time.monotonic() + self.window
+                    while not self.closed and len(self._queue) < MAX_BATCH:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                if self.closed:
+                    final = self._final
+                    break
+                batch = [self._queue.popleft()[0] for _ in range(min(len(self._queue), MAX_BATCH))]
+                self._sending = True
+
+            try:
+                self.writes += send_buffers(self.sock, batch)
+                self.messages += len(batch)
+            except OSError:
+                self._fail()
+                return
+            finally:
+                self._sending = False
+
+        if final:
+            try:
+                self.sock.settimeout(FINAL_TIMEOUT)
+                self.sock.sendall(final)
+            except OSError:
+                pass
+        self._shutdown()
+
+    def _fail(self):
+        with self._cond:
+            already_closed = self.closed
+            self.closed = True
+            self._queue.clear()
+        self._shutdown()
+        if not already_closed and self.on_error:
+            self.on_error()
+
+    def _shutdown(self):
+        shutdown_socket(self.sock)
+
+
+def shutdown_socket(sock):
+    # shutdown acorda a thread de leitura presa no recv; close sozinho não garante isso
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    try:
+        sock.close()
+    except OSError:
+        pass
+
+
+class SelectorOutbox(BaseOutbox):
+    """Fila de saída sem thread, para um socket não bloqueante num laço com selectors.
+
+    put() só enfileira; quem roda o laço chama flush(), que escreve o que couber
+    no buffer do kernel numa única chamada, e fica esperando EVENT_WRITE enquanto
+    `pending` for verdadeiro. `window` é ignorado: o laço decide quando escrever.
+    Se a escrita falhar, on_error roda antes de o socket ser fechado.
+    """
+
+    def __init__(self, sock, **kwargs):
+        super().__init__(**kwargs)
+        self.sock = sock
+        self._buffer = bytearray()  # Já saiu da fila mas ainda não coube no socket
+
+    @property
+    def pending(self):
+        return bool(self._queue or self._buffer)
+
+    def put(self, data, key=None):
+        if self.closed:
+            return False
+        admitted = self._admit(data, key)
+        if not admitted and self.on_evict:
+            self.on_evict()
+        return admitted
+
+    def flush(self):
+        """Escreve o que der sem bloquear. Retorna False se a conexão caiu."""
+        if self.closed:
+            return False
+        while self._queue:
+            self._buffer += self._queue.popleft()[0]
+            self.messages += 1
+        try:
+            while self._buffer:
+                sent = self.sock.send(self._buffer)
+                self.writes += 1
+                del self._buffer[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass  # Buffer do kernel cheio: o resto sai no próximo EVENT_WRITE
+        except OSError:
+            self.closed = True
+            self._queue.clear()
+            self._buffer.clear()
+            # Antes de fechar: o dono ainda precisa tirar o fd do selector
+            if self.on_error:
+                self.on_error()
+            shutdown_socket(self.sock)
+            return False
+        return True
+
+    def close(self, final=None):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._buffer.clear()
+        if final:
+            try:
+                self.sock.send(final)
+            except OSError:
+                pass
+        shutdown_socket(self.sock)
+
+
+class AsyncOutbox(BaseOutbox):
+    """Equivalente do Outbox para o AsyncChatServer: uma task por conexão
+    escreve no StreamWriter e aguarda o drain sem segurar o resto do loop.
+    """
+
+    def __init__(self, writer, **kwargs):
+        super().__init__(**kwargs)
+        self.writer = writer
+        self._ready = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def put(self, data, key=None):
+        if self.closed:
+            return False
+        admitted = self._admit(data, key)
+        self._ready.set()
+        if not admitted and self.on_evict:
+            self.on_evict()
+        return admitted
+
+    def close(self, final=None):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._task.cancel()
+        if final and not self.writer.is_closing():
+            self.writer.write(final)
+        self.writer.close()
+        # Se o cliente não consumir o buffer, abortar em vez de esperar para sempre
+        asyncio.get_running_loop().call_later(FINAL_TIMEOUT, self.writer.transport.abort)
+
+    async def _run(self):
+        try:
+            while True:
+                await self._ready.wait()
+                if self.window:
+                    await asyncio.sleep(self.window)
+                self._ready.clear()
+                # Tudo o que acumulou vai ao transporte numa escrita só, antes de um único drain
+                batch = [data for data, _ in self._queue]
+                if not batch:
+                    continue
+                self._queue.clear()
+                self.writer.writelines(batch)
+                self.writes += 1
+                self.messages += len(batch)
+                await self.writer.drain()
+        except (ConnectionError, OSError):
+            if not self.closed:
+                self.closed = True
+                self._queue.clear()
+                self.writer.transport.abort()
+                if self.on_error:
+                    self.on_error()
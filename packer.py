@@ -0,0 +1,277 @@
+"""Codificação binária compacta no formato MessagePack (subconjunto usado pelo chat).
+
+Tipos suportados: None, bool, int (64 bits), float, str, bytes, list/tuple e dict.
+Se o pacote `msgpack` (extensão em C) estiver instalado ele é usado; senão vale a
+implementação em Python puro abaixo. Os bytes são os mesmos nos dois casos, então
+cliente e servidor não precisam ter a mesma instalação.
+"""
+import struct
+
+try:
+    import msgpack as _msgpack
+except ImportError:
+    _msgpack = None
+
+ACCELERATED = _msgpack is not None
+
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+_I8 = struct.Struct('>b')
+_I16 = struct.Struct('>h')
+_I32 = struct.Struct('>i')
+_I64 = struct.Struct('>q')
+_F64 = struct.Struct('>d')
+
+# As chaves dos dicts se repetem em toda mensagem ("type", "content"...): guardar os bytes prontos
+_KEY_CACHE = {}
+_KEY_CACHE_SIZE = 256
+
+
+def _pack_str(data, out):
+    n = len(data)
+    if n < 32:
+        out.append(0xa0 | n)
+    elif n < 0x100:
+        out.append(0xd9)
+        out.append(n)
+    elif n < 0x10000:
+        out.append(0xda)
+        out += _U16.pack(n)
+    else:
+        out.append(0xdb)
+        out += _U32.pack(n)
+    out += data
+
+
+def _pack_int(n, out):
+    if 0 <= n < 0x80:
+        out.append(n)
+    elif -32 <= n < 0:
+        out.append(n & 0xff)
+    elif n >= 0:
+        if n < 0x100:
+            out.append(0xcc)
+            out.append(n)
+        elif n < 0x10000:
+            out.append(0xcd)
+            out += _U16.pack(n)
+        elif n < 0x100000000:
+            out.append(0xce)
+            out += _U32.pack(n)
+        else:
+            out.append(0xcf)
+            out += _U64.pack(n)
+    elif n >= -0x80:
+        out.append(0xd0)
+        out += _I8.pack(n)
+    elif n >= -0x8000:
+        out.append(0xd1)
+        out += _I16.pack(n)
+    elif n >= -0x80000000:
+        out.append(0xd2)
+        out += _I32.pack(n)
+    else:
+        out.append(0xd3)
+        out += _I64.pack(n)
+
+
+def _pack_header(n, fix, tag16, tag32, out):
+    if n < 16:
+        out.append(fix | n)
+    elif n < 0x10000:
+        out.append(tag16)
+        out += _U16.pack(n)
+    else:
+        out.append(tag32)
+        out += _U32.pack(n)
+
+
+def _pack(obj, out):
+    # Caminho rápido: str e dict são quase tudo o que o chat envia
+    kind = type(obj)
+    if kind is str:
+        _pack_str(obj.encode('utf-8'), out)
+    elif kind is dict:
+        _pack_header(len(obj), 0x80, 0xde, 0xdf, out)
+        for key, value in obj.items():
+            packed = _KEY_CACHE.get(key)
+            if packed is None:
+                if type(key) is not str:
+                    _pack(key, out)
+                    _pack(value, out)
+                    continue
+                key_out = bytearray()
+                _pack_str(key.encode('utf-8'), key_out)
+                packed = bytes(key_out)
+                if len(_KEY_CACHE) < _KEY_CACHE_SIZE:
+                    _KEY_CACHE[key] = packed
+            out += packed
+            _pack(value, out)
+    elif kind is list or kind is tuple:
+        _pack_header(len(obj), 0x90, 0xdc, 0xdd, out)
+        for item in obj:
+            if type(item) is str:
+                _pack_str(item.encode('utf-8'), out)
+            else:
+                _pack(item, out)
+    elif obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif kind is int:
+        if not -0x8000000000000000 <= obj < 0x10000000000000000:
+            raise OverflowError(f"inteiro grande demais para o formato: {obj}")
+        _pack_int(obj, out)
+    elif kind is float:
+        out.append(0xcb)
+        out += _F64.pack(obj)
+    elif kind is bytes or kind is bytearray:
+        n = len(obj)
+        if n < 0x100:
+            out.append(0xc4)
+            out.append(n)
+        elif n < 0x10000:
+            out.append(0xc5)
+            out += _U16.pack(n)
+        else:
+            out.append(0xc6)
+            out += _U32.pack(n)
+        out += obj
+    else:
+        raise TypeError(f"tipo não suportado: {kind.__name__}")
+
+
+def _take(data, pos, n):
+    end = pos + n
+    if end > len(data):
+        raise ValueError("dados truncados")
+    return data[pos:end], end
+
+
+def _unpack(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag < 0x80:
+        return tag, pos
+    if 0xa0 <= tag <= 0xbf:
+        raw, pos = _take(data, pos, tag & 0x1f)
+        return raw.decode('utf-8'), pos
+    if tag <= 0x8f:
+        return _unpack_map(data, pos, tag & 0x0f)
+    if tag <= 0x9f:
+        return _unpack_array(data, pos, tag & 0x0f)
+    if tag >= 0xe0:
+        return tag - 0x100, pos
+    if tag == 0xc0:
+        return None, pos
+    if tag == 0xc2:
+        return False, pos
+    if tag == 0xc3:
+        return True, pos
+    if tag == 0xd9:
+        raw, pos = _take(data, pos + 1, data[pos])
+        return raw.decode('utf-8'), pos
+    if tag == 0xda or tag == 0xdb:
+        size = _U16 if tag == 0xda else _U32
+        (n,) = size.unpack_from(data, pos)
+        raw, pos = _take(data, pos + size.size, n)
+        return raw.decode('utf-8'), pos
+    if tag == 0xde or tag == 0xdf:
+        size = _U16 if tag == 0xde else _U32
+        (n,) = size.unpack_from(data, pos)
+        return _unpack_map(data, pos + size.size, n)
+    if tag == 0xdc or tag == 0xdd:
+        size = _U16 if tag == 0xdc else _U32
+        (n,) = size.unpack_from(data, pos)
+        return _unpack_array(data, pos + size.size, n)
+    if tag == 0xc4:
+        raw, pos = _take(data, pos + 1, data[pos])
+        return bytes(raw), pos
+    if tag == 0xc5 or tag == 0xc6:
+        size = _U16 if tag == 0xc5 else _U32
+        (n,) = size.unpack_from(data, pos)
+        raw, pos = _take(data, pos + size.size, n)
+        return bytes(raw), pos
+    number = _NUMBERS.get(tag)
+    if number is not None:
+        (value,) = number.unpack_from(data, pos)
+        return value, pos + number.size
+    raise ValueError(f"tipo MessagePack não suportado: 0x{tag:02x}")
+
+
+_NUMBERS = {
+    0xca: struct.Struct('>f'), 0xcb: _F64,
+    0xcc: struct.Struct('>B'), 0xcd: _U16, 0xce: _U32, 0xcf: _U64,
+    0xd0: _I8, 0xd1: _I16, 0xd2: _I32, 0xd3: _I64,
+}
+
+
+def _unpack_map(data, pos, n):
+    result = {}
+    size = len(data)
+    for _ in range(n):
+        tag = data[pos]
+        if 0xa0 <= tag <= 0xbf:
+            # Chave curta (o caso comum): sem passar pelo _unpack
+            end = pos + 1 + (tag & 0x1f)
+            if end > size:
+                raise ValueError("dados truncados")
+            key = data[pos + 1:end].decode('utf-8')
+            pos = end
+        else:
+            key, pos = _unpack(data, pos)
+        value, pos = _unpack(data, pos)
+        result[key] = value
+    return result, pos
+
+
+def _unpack_array(data, pos, n):
+    result = []
+    append = result.append
+    size = len(data)
+    for _ in range(n):
+        tag = data[pos]
+        if 0xa0 <= tag <= 0xbf:
+            # Listas de nomes (users_list, blacklist): mesmo atalho das chaves
+            end = pos + 1 + (tag & 0x1f)
+            if end > size:
+                raise ValueError("dados truncados")
+            append(data[pos + 1:end].decode('utf-8'))
+            pos = end
+        else:
+            item, pos = _unpack(data, pos)
+            append(item)
+    return result, pos
+
+
+def py_packb(obj):
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def py_unpackb(data):
+    try:
+        obj, pos = _unpack(data, 0)
+    except (IndexError, struct.error, UnicodeDecodeError, TypeError) as e:
+        raise ValueError(f"MessagePack inválido: {e}")
+    if pos != len(data):
+        raise ValueError("bytes sobrando depois da mensagem")
+    return obj
+
+
+if _msgpack is not None:
+    def packb(obj):
+        return _msgpack.packb(obj, use_bin_type=True)
+
+    def unpackb(data):
+        try:
+            return _msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except Exception as e:
+            raise ValueError(f"MessagePack inválido: {e}")
+else:
+    packb = py_packb
+    unpackb = py_unpackb
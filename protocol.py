@@ -0,0 +1,316 @@
+import json
+import re
+import struct
+import zlib
+from collections import deque
+
+from packer import packb, unpackb
+
+# Versão 1: objetos JSON concatenados sem delimitador (clientes antigos)
+# Versão 2: cada mensagem vai num frame com prefixo de 4 bytes (big-endian) com o tamanho
+PROTOCOL_VERSION = 2
+HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# No modo legado o fim da mensagem só aparece quando o objeto fecha; o handshake e as
+# mensagens de clientes antigos são pequenos, então o limite é bem menor que o dos frames
+MAX_LEGACY_SIZE = 64 * 1024
+# Varredura do modo legado: fora de strings só interessam chaves e aspas; uma string
+# completa é pulada de uma vez, e uma cortada no fim da leitura é seguida por aspas e escapes
+_LEGACY_TOKENS = re.compile(rb'[{}"]')
+_STRING_REST = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_STRING_TOKENS = re.compile(rb'["\\]')
+
+# Codificação do conteúdo dos frames (só na versão 2), escolhida no handshake:
+# o cliente lista as que entende em "encodings", por ordem de preferência
+JSON = "json"
+MSGPACK = "msgpack"
+
+
+def _json_dumps(message):
+    return json.dumps(message).encode('utf-8')
+
+
+ENCODINGS = {JSON: (_json_dumps, json.loads), MSGPACK: (packb, unpackb)}
+
+# Compressão (versão 2, negociada no handshake com "compression": ["deflate"]).
+# Um frame com o bit COMPRESSED no cabeçalho carrega, comprimidos com deflate,
+# um ou mais frames normais: uma mensagem grande ou uma rajada de mensagens
+# (backfill) viajam num frame só. Cada frame é comprimido sozinho, sem estado
+# entre mensagens, para o fan-out continuar comprimindo uma vez por formato.
+DEFLATE = "deflate"
+COMPRESSED = 0x80000000
+DEFAULT_COMPRESS_THRESHOLD = 1024  # Frames menores que isso vão sem comprimir
+COMPRESS_LEVEL = 6
+# Dicionário inicial comum aos dois lados: as mensagens curtas do chat são quase só
+# essas chaves e valores, e o deflate as encontra já na primeira mensagem
+PRESET_DICTIONARY = (
+    b'"history", "room": "general", "messages": [{"seq": , "ts": , "content": "'
+    b'{"type": "blocked_words_list", "words": ["'
+    b'{"type": "users_list", "room": "general", "users": ["'
+    b'{"type": "presence_join", "presence_leave", "username": "version": '
+    b'{"type": "whisper", "sender": "'
+    b' entrou na sala geral!"}{"type": "message", "content": "'
+    + packb({"type": "message", "content": "", "room": "general", "seq": 0, "ts": 0.0})
+)
+
+
+class ProtocolError(ValueError):
+    """Dados recebidos que não respeitam o protocolo."""
+
+
+def negotiate_version(hello):
+    """Escolhe a versão do protocolo a partir do handshake {"username": ...} do cliente."""
+    try:
+        version = int(hello.get("version", 1))
+    except (TypeError, ValueError):
+        version = 1
+    return max(1, min(version, PROTOCOL_VERSION))
+
+
+def negotiate_encoding(hello):
+    """Primeira codificação da lista "encodings" do cliente que o servidor conhece; senão JSON."""
+    offered = hello.get("encodings")
+    if isinstance(offered, list):
+        for encoding in offered:
+            if encoding in ENCODINGS:
+                return encoding
+    return JSON
+
+
+def negotiate_compression(hello):
+    offered = hello.get("compression")
+    if isinstance(offered, list) and DEFLATE in offered:
+        return DEFLATE
+    return None
+
+
+def compress_frames(frames, threshold=DEFAULT_COMPRESS_THRESHOLD):
+    """Comprime um ou mais frames num frame COMPRESSED, se forem grandes e isso valer a pena."""
+    if len(frames) < threshold:
+        return frames
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15, zdict=PRESET_DICTIONARY)
+    data = compressor.compress(frames) + compressor.flush()
+    if len(data) + HEADER.size >= len(frames):
+        return frames
+    return HEADER.pack(len(data) | COMPRESSED) + data
+
+
+def encode_message(message, version, encoding=JSON):
+    """Serializa uma mensagem para o formato de fio da versão e codificação indicadas."""
+    if version < 2:
+        return _json_dumps(message)
+    payload = ENCODINGS[encoding][0](message)
+    return HEADER.pack(len(payload)) + payload
+
+
+class EncodedMessage:
+    """Mensagem serializada uma única vez por formato de fio.
+
+    Usada no fan-out: uma sala com N clientes custa uma serialização por formato
+    negociado (no máximo algumas), não uma por cliente.
+    """
+
+    __slots__ = ('message', '_frames', '_encoded')
+
+    def __init__(self, message):
+        self.message = message
+        self._frames = {}
+        self._encoded = {}
+
+    def frame(self, codec):
+        """O frame sem compressão, para juntar a outros numa rajada comprimida de uma vez só."""
+        key = (codec.version, codec.encoding)
+        data = self._frames.get(key)
+        if data is None:
+            data = self._frames[key] = encode_message(self.message, codec.version, codec.encoding)
+        return data
+
+    def for_codec(self, codec):
+        data = self._encoded.get(codec.wire)
+        if data is None:
+            data = self._encoded[codec.wire] = codec.compress(self.frame(codec))
+        return data
+
+
+class Codec:
+    """Estado de codificação de uma conexão.
+
+    Começa no modo legado (JSON concatenado) porque é assim que chega o handshake;
+    depois da negociação, upgrade() passa a ler frames a partir do mesmo buffer,
+    então bytes que já chegaram depois do handshake não se perdem.
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.version = 1
+        self.encoding = JSON
+        self.compression = None
+        self.compress_threshold = DEFAULT_COMPRESS_THRESHOLD
+        self._loads = json.loads
+        self._inflated = deque()  # Mensagens já extraídas de um frame comprimido
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+        self._pos = 0
+        # Varredura do objeto legado incompleto, retomada na próxima leitura em vez de recomeçar
+        self._scanned = 0  # Bytes depois de _pos já varridos
+        self._depth = 0
+        self._in_string = False
+
+    def upgrade(self, version, encoding=JSON, compression=None):
+        self.version = version
+        self.encoding = encoding
+        self.compression = compression
+        self._loads = ENCODINGS[encoding][1]
+
+    @property
+    def wire(self):
+        """Chave do formato de fio: conexões com a mesma chave recebem os mesmos bytes."""
+        return (self.version, self.encoding, self.compression)
+
+    def encode(self, message):
+        return self.compress(encode_message(message, self.version, self.encoding))
+
+    def compress(self, frames):
+        """Comprime frames já codificados se a conexão negociou compressão."""
+        if self.compression is None:
+            return frames
+        return compress_frames(frames, self.compress_threshold)
+
+    def feed(self, data):
+        """Acrescenta bytes recebidos do socket ao buffer."""
+        if self._pos:
+            # Compactar uma vez por leitura, não a cada mensagem extraída
+            del self._buffer[:self._pos]
+            self._pos = 0
+        self._buffer += data
+
+    def __iter__(self):
+        while True:
+            message = self.next_message()
+            if message is None:
+                return
+            yield message
+
+    def next_message(self):
+        """Retorna a próxima mensagem completa do buffer, ou None se ainda faltam dados."""
+        if self._inflated:
+            return self._inflated.popleft()
+        if self.version < 2:
+            return self._next_legacy()
+        payload, compressed = self._next_frame()
+        if payload is None:
+            return None
+        if compressed:
+            self._inflated.extend(self._inflate(payload))
+            return self.next_message()
+        try:
+            return self._loads(payload)
+        except ValueError as e:
+            raise ProtocolError(f"frame com {self.encoding} inválido: {e}")
+
+    def _inflate(self, data):
+        """Descomprime um frame COMPRESSED e decodifica os frames que ele carrega."""
+        decompressor = zlib.decompressobj(-15, zdict=PRESET_DICTIONARY)
+        try:
+            frames = decompressor.decompress(data, self.max_frame_size)
+        except zlib.error as e:
+            raise ProtocolError(f"frame comprimido inválido: {e}")
+        if decompressor.unconsumed_tail:
+            raise ProtocolError(f"frame descomprimido excede o limite de {self.max_frame_size}")
+        inner = Codec(self.max_frame_size)
+        inner.upgrade(self.version, self.encoding)  # Sem compressão: frames comprimidos não se aninham
+        inner.feed(frames)
+        messages = list(inner)
+        if inner._pos != len(inner._buffer):
+            raise ProtocolError("frame comprimido termina no meio de um frame")
+        return messages
+
+    def _next_frame(self):
+        buffer = self._buffer
+        start = self._pos + HEADER.size
+        if len(buffer) < start:
+            return None, False
+        (size,) = HEADER.unpack_from(buffer, self._pos)
+        compressed = size & COMPRESSED
+        if compressed:
+            if self.compression is None:
+                raise ProtocolError("frame comprimido sem compressão negociada")
+            size ^= COMPRESSED
+        if size > self.max_frame_size:
+            raise ProtocolError(f"frame de {size} bytes excede o limite de {self.max_frame_size}")
+        end = start + size
+        if len(buffer) < end:
+            return None, False
+        self._pos = end
+        return bytes(memoryview(buffer)[start:end]), compressed
+
+    def _next_legacy(self):
+        """Extrai o próximo objeto JSON do buffer legado.
+
+        O fim do objeto é achado contando chaves fora das strings, continuando de
+        onde a leitura anterior parou; só os bytes do objeto são decodificados, e o
+        que vem depois dele (ex.: frames logo após o welcome) fica no buffer.
+        """
+        buffer = self._buffer
+        if not self._scanned:
+            # Ignorar espaços entre objetos
+            while self._pos < len(buffer) and buffer[self._pos] in b' \t\r\n':
+                self._pos += 1
+            if self._pos >= len(buffer):
+                return None
+            if buffer[self._pos] != ord('{'):
+                raise ProtocolError("esperado um objeto JSON")
+        end = self._scan_legacy()
+        if end is None:
+            if len(buffer) - self._pos > MAX_LEGACY_SIZE:
+                raise ProtocolError(f"mensagem excede o limite de {MAX_LEGACY_SIZE} bytes do modo legado")
+            return None
+        raw = buffer[self._pos:end]
+        self._pos = end
+        try:
+            return json.loads(raw.decode('utf-8'))
+        except ValueError as e:
+            raise ProtocolError(f"JSON inválido: {e}")
+
+    def _scan_legacy(self):
+        """Avança a varredura do objeto atual; retorna a posição logo depois dele, ou None se ainda não fechou."""
+        buffer = self._buffer
+        limit = min(len(buffer), self._pos + MAX_LEGACY_SIZE)
+        i = self._pos + self._scanned
+        depth, in_string = self._depth, self._in_string
+        while True:
+            if in_string:
+                match = _STRING_TOKENS.search(buffer, i, limit)
+                if match is None:
+                    i = limit
+                    break
+                i = match.end()
+                if buffer[match.start()] == ord('"'):
+                    in_string = False
+                elif i < limit:
+                    i += 1  # Pula o caractere escapado
+                else:
+                    i -= 1  # Escape no fim do que chegou: revarrer a partir da barra
+                    break
+            else:
+                match = _LEGACY_TOKENS.search(buffer, i, limit)
+                if match is None:
+                    i = limit
+                    break
+                i = match.end()
+                token = buffer[match.start()]
+                if token == ord('"'):
+                    rest = _STRING_REST.match(buffer, i, limit)
+                    if rest is not None:
+                        i = rest.end()
+                    else:
+                        in_string = True
+                elif token == ord('{'):
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        self._scanned, self._depth, self._in_string = 0, 0, False
+                        return i
+        self._scanned = i - self._pos
+        self._depth, self._in_string = depth, in_string
+        return None
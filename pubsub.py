@@ -0,0 +1,401 @@
+import json
+import os
+import socket
+import threading
+from abc import ABC, abstractmethod
+
+from protocol import Codec, PROTOCOL_VERSION, encode_message
+import logs
+
+log = logs.get_logger("chat.pubsub")
+
+
+def frame(message):
+    return encode_message(message, PROTOCOL_VERSION)
+
+
+def read_frames(sock):
+    """Itera sobre as mensagens de um socket que fala o protocolo em frames."""
+    codec = Codec()
+    codec.upgrade(PROTOCOL_VERSION)
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return
+        codec.feed(data)
+        for message in codec:
+            yield message
+
+
+class PubSubBackend(ABC):
+    """Interface dos backends de pub/sub usados pelo ChatServer (atributo `bus`).
+
+    Canais usados pelo servidor:
+      room:<sala>  mensagens da sala
+      user:<nome>  sussurros; só o nó onde o usuário está conectado assina
+      presence     entradas e saídas de usuários e estado dos nós
+
+    on_message(canal, dados) pode ser chamado de outra thread. Uma publicação
+    nunca é entregue de volta ao nó que a publicou.
+    """
+
+    @abstractmethod
+    def start(self, node_id, on_message):
+        pass
+
+    @abstractmethod
+    def subscribe(self, channel):
+        pass
+
+    @abstractmethod
+    def unsubscribe(self, channel):
+        pass
+
+    @abstractmethod
+    def publish(self, channel, data):
+        pass
+
+    def stop(self):
+        pass
+
+
+class Hub:
+    """Roteador de mensagens entre os workers de um mesmo host.
+
+    Escuta num Unix domain socket; cada worker se conecta, assina canais
+    ("room:<sala>", "presence"...) e publica neles. Uma publicação é repassada
+    a todos os outros workers que assinam o canal, nunca de volta a quem publicou.
+    Quando um worker cai, os demais recebem {"event": "down"} no canal "presence".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sock = None
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # {canal: set(conexões)}
+        self._send_locks = {}     # {conexão: lock}; sendall de threads diferentes não pode se misturar
+        self._nodes = {}          # {conexão: id do worker}
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen()
+        thread = threading.Thread(target=self._accept_loop)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        try:
+            self.sock.close()
+        finally:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._send_locks[conn] = threading.Lock()
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, conn):
+        try:
+            for message in read_frames(conn):
+                op = message.get("op")
+                if op == "hello":
+                    self._nodes[conn] = message["node"]
+                elif op == "sub":
+                    with self._lock:
+                        self._subscriptions.setdefault(message["channel"], set()).add(conn)
+                elif op == "unsub":
+                    with self._lock:
+                        self._subscriptions.get(message["channel"], set()).discard(conn)
+                elif op == "pub":
+                    self._route(conn, message["channel"], message)
+        except OSError:
+            pass
+        finally:
+            self._drop(conn)
+
+    def _route(self, origin, channel, message):
+        data = frame(message)
+        with self._lock:
+            targets = [c for c in self._subscriptions.get(channel, ()) if c is not origin]
+        for conn in targets:
+            lock = self._send_locks.get(conn)
+            if lock is None:
+                continue
+            try:
+                with lock:
+                    conn.sendall(data)
+            except OSError:
+                pass
+
+    def _drop(self, conn):
+        with self._lock:
+            for members in self._subscriptions.values():
+                members.discard(conn)
+            self._send_locks.pop(conn, None)
+        node = self._nodes.pop(conn, None)
+        if node is not None:
+            self._route(conn, "presence", {"op": "pub", "channel": "presence",
+                                           "data": {"event": "down", "node": node}})
+        conn.close()
+
+
+class HubBackend(PubSubBackend):
+    """Lado do worker na conexão com o Hub."""
+
+    def __init__(self, path):
+        self.path = path
+        self.node_id = None
+        self.sock = None
+        self._send_lock = threading.Lock()
+
+    def start(self, node_id, on_message):
+        self.node_id = node_id
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+        self._send({"op": "hello", "node": node_id})
+        thread = threading.Thread(target=self._read_loop, args=(on_message,))
+        thread.daemon = True
+        thread.start()
+
+    def subscribe(self, channel):
+        self._send({"op": "sub", "channel": channel})
+
+    def unsubscribe(self, channel):
+        self._send({"op": "unsub", "channel": channel})
+
+    def publish(self, channel, data):
+        self._send({"op": "pub", "channel": channel, "data": data})
+
+    def stop(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def _send(self, message):
+        with self._send_lock:
+            self.sock.sendall(frame(message))
+
+    def _read_loop(self, on_message):
+        try:
+            for message in read_frames(self.sock):
+                try:
+                    on_message(message["channel"], message["data"])
+                except Exception:
+                    log.exception("Erro ao processar mensagem do hub", channel=message.get("channel"))
+        except OSError as e:
+            log.error("Conexão com o hub perdida", error=repr(e))
+
+
+class LoopbackBroker:
+    """Broker em memória: liga vários servidores dentro do mesmo processo (testes).
+
+    Como o Hub, avisa os demais com {"event": "down"} quando um nó se desliga.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # {canal: set(backends)}
+
+    def subscribe(self, backend, channel):
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(backend)
+
+    def unsubscribe(self, backend, channel):
+        with self._lock:
+            self._subscriptions.get(channel, set()).discard(backend)
+
+    def publish(self, origin, channel, data):
+        # Ida e volta pelo JSON, como num backend de verdade: ninguém compartilha objetos
+        payload = json.dumps(data)
+        with self._lock:
+            targets = [b for b in self._subscriptions.get(channel, ()) if b is not origin]
+        for backend in targets:
+            backend.on_message(channel, json.loads(payload))
+
+    def detach(self, backend):
+        with self._lock:
+            for members in self._subscriptions.values():
+                members.discard(backend)
+        if backend.node_id is not None:
+            self.publish(backend, "presence", {"event": "down", "node": backend.node_id})
+
+
+class LoopbackBackend(PubSubBackend):
+    """Backend que entrega as publicações de forma síncrona via um LoopbackBroker."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.node_id = None
+        self.on_message = None
+
+    def start(self, node_id, on_message):
+        self.node_id = node_id
+        self.on_message = on_message
+
+    def subscribe(self, channel):
+        self.broker.subscribe(self, channel)
+
+    def unsubscribe(self, channel):
+        self.broker.unsubscribe(self, channel)
+
+    def publish(self, channel, data):
+        self.broker.publish(self, channel, data)
+
+    def stop(self):
+        self.broker.detach(self)
+
+
+class RespError(Exception):
+    """Erro retornado pelo servidor Redis."""
+
+
+def resp_command(*args):
+    """Codifica um comando no protocolo do Redis (RESP)."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode('utf-8')
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+class RespReader:
+    """Lê respostas RESP de um socket bloqueante."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._buffer = bytearray()
+        self._pos = 0
+
+    def _fill(self):
+        data = self.sock.recv(65536)
+        if not data:
+            raise ConnectionError("servidor Redis encerrou a conexão")
+        if self._pos:
+            del self._buffer[:self._pos]
+            self._pos = 0
+        self._buffer += data
+
+    def _line(self):
+        while True:
+            end = self._buffer.find(b"\r\n", self._pos)
+            if end != -1:
+                line = bytes(self._buffer[self._pos:end])
+                self._pos = end + 2
+                return line
+            self._fill()
+
+    def _exactly(self, size):
+        while len(self._buffer) - self._pos < size + 2:
+            self._fill()
+        data = bytes(self._buffer[self._pos:self._pos + size])
+        self._pos += size + 2
+        return data
+
+    def read(self):
+        line = self._line()
+        kind, rest = line[:1], line[1:]
+        if kind == b"+":
+            return rest.decode('utf-8')
+        if kind == b"-":
+            return RespError(rest.decode('utf-8'))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            return None if size < 0 else self._exactly(size)
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self.read() for _ in range(count)]
+        raise RespError(f"resposta RESP inválida: {line!r}")
+
+
+class RedisBackend(PubSubBackend):
+    """Pub/sub via qualquer servidor compatível com o protocolo do Redis.
+
+    Usa duas conexões, como exige o Redis: uma fica em modo SUBSCRIBE e é lida
+    por uma thread; a outra só publica, e as respostas são descartadas por
+    outra thread para o PUBLISH não esperar a ida e volta. Cada publicação leva
+    o id do nó de origem, já que o Redis entrega ao próprio publicador se ele
+    assinar o mesmo canal.
+    """
+
+    def __init__(self, host='localhost', port=6379, prefix="chat:"):
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.node_id = None
+        self._sub = None
+        self._pub = None
+        self._sub_lock = threading.Lock()
+        self._pub_lock = threading.Lock()
+
+    def start(self, node_id, on_message):
+        self.node_id = node_id
+        self._sub = socket.create_connection((self.host, self.port))
+        self._pub = socket.create_connection((self.host, self.port))
+        for target, args in ((self._read_messages, (on_message,)), (self._drain_replies, ())):
+            thread = threading.Thread(target=target, args=args)
+            thread.daemon = True
+            thread.start()
+
+    def subscribe(self, channel):
+        with self._sub_lock:
+            self._sub.sendall(resp_command("SUBSCRIBE", self.prefix + channel))
+
+    def unsubscribe(self, channel):
+        with self._sub_lock:
+            self._sub.sendall(resp_command("UNSUBSCRIBE", self.prefix + channel))
+
+    def publish(self, channel, data):
+        payload = json.dumps({"origin": self.node_id, "data": data})
+        with self._pub_lock:
+            self._pub.sendall(resp_command("PUBLISH", self.prefix + channel, payload))
+
+    def stop(self):
+        for sock in (self._sub, self._pub):
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _read_messages(self, on_message):
+        reader = RespReader(self._sub)
+        try:
+            while True:
+                reply = reader.read()
+                # Confirmações de (un)subscribe também chegam aqui e são ignoradas
+                if not isinstance(reply, list) or len(reply) != 3 or reply[0] != b"message":
+                    continue
+                channel = reply[1].decode('utf-8')[len(self.prefix):]
+                envelope = json.loads(reply[2])
+                if envelope.get("origin") == self.node_id:
+                    continue
+                try:
+                    on_message(channel, envelope["data"])
+                except Exception:
+                    log.exception("Erro ao processar mensagem do Redis", channel=channel)
+        except (OSError, ConnectionError) as e:
+            log.error("Conexão de assinatura com o Redis perdida", error=repr(e))
+
+    def _drain_replies(self):
+        reader = RespReader(self._pub)
+        try:
+            while True:
+                reply = reader.read()
+                if isinstance(reply, RespError):
+                    log.error("Erro do Redis", reply=str(reply))
+        except (OSError, ConnectionError):
+            pass
@@ -0,0 +1,124 @@
+import threading
+import time
+
+CONNECTION = "connection"
+USER = "user"
+ROOM = "room"
+SCOPES = (CONNECTION, USER, ROOM)
+
+# {tipo de mensagem: {escopo: (tokens por segundo, rajada)}}
+DEFAULT_LIMITS = {
+    "message": {CONNECTION: (5, 10), USER: (5, 10), ROOM: (50, 100)},
+    "whisper": {CONNECTION: (5, 10), USER: (5, 10)},
+    "join_room": {CONNECTION: (1, 5), USER: (1, 5), ROOM: (20, 40)},
+    "add_blocked_word": {CONNECTION: (0.2, 3), USER: (0.2, 3)},
+}
+SWEEP_INTERVAL = 60.0  # Segundos entre limpezas dos baldes de usuários e salas parados
+
+
+class TokenBucket:
+    """Balde de tokens reabastecido sob demanda: cada verificação é O(1)."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'stamp')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def retry_after(self):
+        """Segundos até haver um token, supondo refill() recente."""
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate > 0 else float('inf')
+
+
+class RateLimiter:
+    """Limites de taxa por conexão, por usuário e por sala para cada tipo de mensagem.
+
+    Uma mensagem só passa se houver token em todos os baldes que se aplicam a ela;
+    nesse caso um token é tirado de cada um. Baldes de conexão são esquecidos
+    quando a conexão fecha; os de usuários e salas, quando ficam cheios (parados).
+    """
+
+    def __init__(self, limits=DEFAULT_LIMITS, clock=time.monotonic):
+        self.limits = limits
+        self.clock = clock
+        self._buckets = {}  # {(escopo, chave, tipo): TokenBucket}
+        self._lock = threading.Lock()
+        self._next_sweep = clock() + SWEEP_INTERVAL
+
+    def check(self, kind, connection, username, room):
+        """Consome um token de cada balde de `kind`. Retorna None se a mensagem pode
+        passar, ou (escopo, segundos até tentar de novo) do balde que estourou."""
+        scopes = self.limits.get(kind)
+        if not scopes:
+            return None
+        keys = {CONNECTION: connection, USER: username, ROOM: room}
+        now = self.clock()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            buckets = []
+            for scope, (rate, burst) in scopes.items():
+                key = (scope, keys[scope], kind)
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+                else:
+                    bucket.refill(now)
+                if bucket.tokens < 1:
+                    return scope, bucket.retry_after()
+                buckets.append(bucket)
+            for bucket in buckets:
+                bucket.tokens -= 1
+        return None
+
+    def forget(self, connection):
+        """Descarta os baldes de uma conexão que foi fechada."""
+        with self._lock:
+            for kind in self.limits:
+                self._buckets.pop((CONNECTION, connection, kind), None)
+
+    def _sweep(self, now):
+        # Um balde que já teria enchido de novo se comporta igual a um balde novo
+        for key in [k for k, b in self._buckets.items()
+                    if k[0] != CONNECTION and b.tokens + (now - b.stamp) * b.rate >= b.capacity]:
+            del self._buckets[key]
+        self._next_sweep = now + SWEEP_INTERVAL
+
+
+def parse_limit(spec):
+    """Converte "tipo:escopo=taxa/rajada" (ex.: "message:room=100/200") em (tipo, escopo, (taxa, rajada)).
+
+    "tipo:escopo=off" tira o limite daquele escopo e retorna None no lugar do par.
+    """
+    try:
+        target, value = spec.split("=", 1)
+        kind, scope = target.split(":", 1)
+        if value == "off" and scope in SCOPES:
+            return kind, scope, None
+        rate, burst = value.split("/", 1)
+        rate, burst = float(rate), float(burst)
+    except ValueError:
+        raise ValueError(f"limite inválido: {spec!r} (esperado tipo:escopo=taxa/rajada)")
+    if scope not in SCOPES:
+        raise ValueError(f"escopo inválido em {spec!r}: use {', '.join(SCOPES)}")
+    if rate < 0 or burst < 1:
+        raise ValueError(f"limite inválido: {spec!r} (taxa >= 0 e rajada >= 1)")
+    return kind, scope, (rate, burst)
+
+
+def build_limits(specs, base=DEFAULT_LIMITS):
+    """Aplica as especificações de parse_limit() sobre uma cópia de `base`."""
+    limits = {kind: dict(scopes) for kind, scopes in base.items()}
+    for spec in specs:
+        kind, scope, limit = parse_limit(spec)
+        if limit is None:
+            limits.get(kind, {}).pop(scope, None)
+        else:
+            limits.setdefault(kind, {})[scope] = limit
+    return limits
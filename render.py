@@ -0,0 +1,58 @@
+import curses
+import time
+
+DEFAULT_FPS = 30
+
+# Regiões da tela do cliente, na ordem em que são desenhadas. A entrada vem por
+# último: o cursor do terminal fica onde a última janela desenhada deixou o dela.
+CHAT = "chat"
+USERS = "users"
+STATUS = "status"
+INPUT = "input"
+REGIONS = (CHAT, USERS, STATUS, INPUT)
+
+
+class RenderScheduler:
+    """Junta os pedidos de redesenho e desenha no máximo `fps` quadros por segundo.
+
+    O laço do cliente marca regiões como sujas com invalidate() ao tratar cada
+    evento e chama render() quando o selector acorda; render() redesenha cada
+    região suja uma vez com noutrefresh e manda tudo ao terminal num único
+    doupdate. Uma rajada de 500 mensagens vira poucos quadros. Tudo roda nesse
+    mesmo laço, então não há lock.
+    """
+
+    def __init__(self, painters, fps=DEFAULT_FPS, clock=time.monotonic):
+        self.painters = painters  # {região: função que desenha a janela e chama noutrefresh}
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.clock = clock
+        self.frames = 0
+        self._dirty = set()
+        self._last = 0.0
+
+    def invalidate(self, *regions):
+        """Marca regiões para o próximo quadro; sem argumentos, a tela inteira."""
+        self._dirty.update(regions or self.painters)
+
+    def render(self, force=False):
+        """Desenha as regiões sujas se já passou o intervalo do quadro. Retorna True se desenhou."""
+        now = self.clock()
+        if not self._dirty or (not force and now - self._last < self.interval):
+            return False
+        dirty, self._dirty = self._dirty, set()
+        self._last = now
+        for region in REGIONS:
+            if region in dirty or region == INPUT:
+                self.painters[region]()
+        curses.doupdate()
+        self.frames += 1
+        return True
+
+    @property
+    def dirty(self):
+        """Se há alguma região esperando o próximo quadro."""
+        return bool(self._dirty)
+
+    def wait(self):
+        """Segundos até o próximo quadro poder ser desenhado."""
+        return max(0.0, self._last + self.interval - self.clock())
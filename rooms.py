@@ -0,0 +1,153 @@
+import threading
+
+DEFAULT_SHARDS = 16
+
+
+class Room:
+    """Membros de uma sala: {cliente: username} mais um snapshot imutável para iterar.
+
+    Entradas e saídas mexem no dict sob o lock do shard e só invalidam o snapshot;
+    o primeiro leitor depois de uma mudança copia o dict uma vez e os seguintes
+    reaproveitam a cópia. Quem itera (broadcast, users_list) nunca vê o dict mudar.
+    """
+
+    __slots__ = ('members', 'snapshot')
+
+    def __init__(self):
+        self.members = {}
+        self.snapshot = None
+
+
+class RoomRegistry:
+    """Índice das salas deste processo, dividido em shards com um lock cada.
+
+    A sala decide o shard (hash do nome), então entradas e saídas em salas
+    diferentes raramente disputam o mesmo lock. Leituras devolvem snapshots
+    (dicts que ninguém mais altera) e não seguram lock durante a iteração.
+
+    O shard guarda também, sob o mesmo lock, a última seq e a versão do roster
+    de cada sala e os deltas de presença ainda não enviados; nem o broadcast
+    nem a presença passam por um lock do processo inteiro.
+    """
+
+    def __init__(self, shards=DEFAULT_SHARDS, permanent=("general",)):
+        self._shards = [{} for _ in range(shards)]  # [{room: Room}]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        # Seqs sobrevivem à sala: quem retoma uma sala recriada não pode ver seqs repetidas
+        self._seqs = [{} for _ in range(shards)]  # [{room: última seq}]
+        self._versions = [{} for _ in range(shards)]  # [{room: versão do roster}]
+        self._pending = [{} for _ in range(shards)]  # [{room: [deltas de presença]}]
+        self.permanent = frozenset(permanent)  # Salas que existem mesmo vazias
+        for room in self.permanent:
+            self._shard(room)[room] = Room()
+
+    def _index(self, room):
+        return hash(room) % len(self._shards)
+
+    def _shard(self, room):
+        return self._shards[self._index(room)]
+
+    def join(self, room, client, username):
+        """Coloca o cliente na sala. Retorna True se a sala acabou de ser criada."""
+        index = self._index(room)
+        with self._locks[index]:
+            rooms = self._shards[index]
+            entry = rooms.get(room)
+            created = entry is None
+            if created:
+                entry = rooms[room] = Room()
+            entry.members[client] = username
+            entry.snapshot = None
+        return created
+
+    def leave(self, room, client):
+        """Tira o cliente da sala. Retorna (username ou None se ele não estava lá, se a sala foi apagada)."""
+        index = self._index(room)
+        with self._locks[index]:
+            rooms = self._shards[index]
+            entry = rooms.get(room)
+            if entry is None:
+                return None, False
+            username = entry.members.pop(client, None)
+            if username is None:
+                return None, False
+            entry.snapshot = None
+            removed = not entry.members and room not in self.permanent
+            if removed:
+                del rooms[room]
+        return username, removed
+
+    def members(self, room):
+        """Snapshot {cliente: username} da sala; vazio se ela não existe. Não deve ser alterado."""
+        entry = self._shard(room).get(room)
+        if entry is None:
+            return {}
+        snapshot = entry.snapshot
+        if snapshot is None:
+            with self._locks[self._index(room)]:
+                snapshot = self._snapshot(entry)
+        return snapshot
+
+    def _snapshot(self, entry):
+        # Com o lock do shard
+        snapshot = entry.snapshot
+        if snapshot is None:
+            snapshot = entry.snapshot = dict(entry.members)
+        return snapshot
+
+    def next_seq(self, room):
+        index = self._index(room)
+        with self._locks[index]:
+            seqs = self._seqs[index]
+            seq = seqs[room] = seqs.get(room, 0) + 1
+        return seq
+
+    def roster(self, room):
+        """(versão do roster, snapshot dos membros) da sala, lidos juntos."""
+        index = self._index(room)
+        with self._locks[index]:
+            entry = self._shards[index].get(room)
+            return self._versions[index].get(room, 0), {} if entry is None else self._snapshot(entry)
+
+    def queue_presence(self, room, delta, keep=False):
+        """Incrementa a versão do roster e enfileira `delta` com ela em "version".
+
+        Retorna o shard se a fila dele estava vazia (quem chama agenda take_presence),
+        senão None. Se a sala não existe mais aqui e `keep` é falso (sem membros em
+        outros nós), a versão é esquecida e o delta descartado.
+        """
+        index = self._index(room)
+        with self._locks[index]:
+            versions = self._versions[index]
+            if room not in self._shards[index] and not keep:
+                versions.pop(room, None)
+                return None
+            delta["version"] = versions[room] = versions.get(room, 0) + 1
+            pending = self._pending[index]
+            first = not pending
+            pending.setdefault(room, []).append(delta)
+        return index if first else None
+
+    def take_presence(self, shard):
+        """Retira os deltas pendentes do shard: {sala: [deltas]}."""
+        with self._locks[shard]:
+            pending, self._pending[shard] = self._pending[shard], {}
+        return pending
+
+    def __contains__(self, room):
+        return room in self._shard(room)
+
+    def __len__(self):
+        return sum(len(rooms) for rooms in self._shards)
+
+    def names(self):
+        """Nomes das salas existentes (cópia)."""
+        result = []
+        for index, rooms in enumerate(self._shards):
+            with self._locks[index]:
+                result.extend(rooms)
+        return result
+
+    def items(self):
+        """[(sala, snapshot dos membros)] de todas as salas."""
+        return [(room, self.members(room)) for room in self.names()]
@@ -0,0 +1,137 @@
+import json
+import tempfile
+from array import array
+from collections import deque
+from datetime import datetime
+
+DEFAULT_LIMIT = 5000  # Linhas guardadas na memória
+
+# Pares de cor do curses definidos em ChatClient.start_ui
+COLOR_USER = 1
+COLOR_WHISPER = 2
+COLOR_SYSTEM = 3
+COLOR_TEXT = 4
+WHISPER_PREFIX = "SUSSURRO "
+
+
+class ChatLine:
+    """Uma mensagem do chat com os trechos coloridos e as linhas quebradas já calculados.
+
+    O parse e a quebra só acontecem quando a linha aparece na tela, e ficam
+    guardados: redesenhar a janela não reprocessa as mensagens.
+    """
+
+    __slots__ = ('timestamp', 'content', '_segments', '_width', '_rows')
+
+    def __init__(self, timestamp, content):
+        self.timestamp = timestamp
+        self.content = content
+        self._segments = None
+        self._width = None
+        self._rows = None
+
+    def segments(self):
+        """[(texto, par de cor)] da linha inteira."""
+        if self._segments is None:
+            content = self.content
+            segments = [(f"[{self.timestamp.strftime('%H:%M:%S')}] ", COLOR_SYSTEM)]
+            if content.startswith(WHISPER_PREFIX) and ":" in content:
+                sender, text = content[len(WHISPER_PREFIX):].split(":", 1)
+                segments += [(WHISPER_PREFIX, COLOR_WHISPER), (f"{sender}:", COLOR_USER), (text, COLOR_TEXT)]
+            elif ":" in content:
+                username, text = content.split(":", 1)
+                segments += [(f"{username}:", COLOR_USER), (text, COLOR_TEXT)]
+            else:
+                segments.append((content, COLOR_SYSTEM))
+            self._segments = segments
+        return self._segments
+
+    def rows(self, width):
+        """A linha quebrada em linhas de tela de até `width` caracteres."""
+        if self._width != width:
+            self._rows = wrap(self.segments(), width)
+            self._width = width
+        return self._rows
+
+
+def wrap(segments, width):
+    rows = [[]]
+    free = width
+    for text, color in segments:
+        text = text.replace("\n", " ").replace("\t", " ")
+        while text:
+            if free == 0:
+                rows.append([])
+                free = width
+            piece, text = text[:free], text[free:]
+            rows[-1].append((piece, color))
+            free -= len(piece)
+    return rows
+
+
+class Scrollback:
+    """Histórico de mensagens do cliente com tamanho limitado e rolagem virtual.
+
+    As últimas `limit` linhas ficam na memória (ring buffer); as mais antigas são
+    descartadas ou, com `spill`, gravadas num arquivo temporário e lidas de volta
+    só quando a rolagem chega nelas. Desenhar a janela custa O(linhas visíveis),
+    não importa quantas mensagens a sessão já recebeu.
+
+    `scroll` é quantas mensagens a tela está acima da mais recente (0 = acompanhando).
+    Só o laço do cliente (run_loop) mexe nele, por isso não há lock.
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT, spill=False):
+        self.limit = max(1, limit)
+        self.lines = deque()
+        self.scroll = 0
+        self.visible = 1  # Mensagens que couberam na última tela, para o tamanho da página
+        self._spill = tempfile.TemporaryFile() if spill else None
+        self._spilled = array('q')  # Offsets das linhas no arquivo
+
+    def __len__(self):
+        return len(self._spilled) + len(self.lines)
+
+    def append(self, timestamp, content):
+        self.lines.append(ChatLine(timestamp, content))
+        if len(self.lines) > self.limit:
+            evicted = self.lines.popleft()
+            if self._spill is not None:
+                self._spill.seek(0, 2)
+                self._spilled.append(self._spill.tell())
+                record = [evicted.timestamp.timestamp(), evicted.content]
+                self._spill.write((json.dumps(record) + "\n").encode('utf-8'))
+        if self.scroll:
+            # Quem está lendo mensagens antigas continua vendo as mesmas
+            self.scroll = min(self.scroll + 1, len(self) - 1)
+
+    def _line(self, index):
+        spilled = len(self._spilled)
+        if index >= spilled:
+            return self.lines[index - spilled]
+        self._spill.seek(self._spilled[index])
+        timestamp, content = json.loads(self._spill.readline())
+        return ChatLine(datetime.fromtimestamp(timestamp), content)
+
+    def visible_rows(self, height, width):
+        """As linhas de tela da janela atual, de cima para baixo."""
+        rows = []
+        index = len(self) - 1 - self.scroll
+        shown = 0
+        while index >= 0 and len(rows) < height:
+            line_rows = self._line(index).rows(width)
+            rows[:0] = line_rows[-(height - len(rows)):]
+            index -= 1
+            shown += 1
+        self.visible = max(1, shown)
+        return rows
+
+    def page_up(self):
+        self.scroll = max(0, min(self.scroll + max(1, self.visible - 1), len(self) - 1))
+
+    def page_down(self):
+        self.scroll = max(0, self.scroll - max(1, self.visible - 1))
+
+    def follow(self):
+        """Volta para as mensagens mais recentes."""
+        self.scroll = 0
@@ -1,19 +1,84 @@
 import socket
 import threading
-import json
-import re
+import asyncio
+import argparse
+import multiprocessing
 import os
+import tempfile
+import time
+from urllib.parse import urlparse
+from protocol import (Codec, EncodedMessage, negotiate_version, negotiate_encoding, negotiate_compression,
+                      DEFAULT_COMPRESS_THRESHOLD)
+from censor import Censor, BlacklistWatcher
+from outbox import Outbox, AsyncOutbox, POLICIES, DEFAULT_LIMIT, DROP_OLDEST
+from pubsub import Hub, HubBackend, RedisBackend
+from rooms import RoomRegistry
+from metrics import Metrics, now_ns, serve as serve_metrics
+import logs
+from ratelimit import RateLimiter, DEFAULT_LIMITS, build_limits
+from history import (HistoryStore, RecentMessages, DEFAULT_SEGMENT_BYTES, DEFAULT_FSYNC_INTERVAL,
+                     DEFAULT_BACKFILL, DEFAULT_BACKFILL_TOTAL, MAX_PAGE)
+
+# Tipos de mensagem contados pelas métricas; qualquer outro vira "other" para não criar séries à toa
+MESSAGE_TYPES = ("message", "whisper", "join_room", "get_users", "add_blocked_word",
+                 "get_blocked_words", "get_history", "get_stats")
+ROOM_GAUGE_LIMIT = 50  # Salas exportadas uma a uma (as mais cheias)
+DEFAULT_PRESENCE_WINDOW = 0.05  # Segundos agrupando entradas/saídas antes de avisar a sala
+
+log = logs.get_logger("chat.server")
 
 class ChatServer:
-    def __init__(self, host='localhost', port=9999):
+    def __init__(self, host='localhost', port=9999, outbox_limit=DEFAULT_LIMIT, outbox_policy=DROP_OLDEST,
+                 censor_accents=False, censor_leetspeak=False, blacklist_path="palavras_bloqueadas.txt",
+                 blacklist_interval=1.0, backfill=DEFAULT_BACKFILL, backfill_total=DEFAULT_BACKFILL_TOTAL,
+                 presence_window=DEFAULT_PRESENCE_WINDOW, write_window=0,
+                 compress_threshold=DEFAULT_COMPRESS_THRESHOLD, rate_limits=DEFAULT_LIMITS):
         self.host = host
         self.port = port
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.clients = {}  # {client_socket: {"username": username, "room": room}}
-        self.rooms = {"general": set()}  # Sala padrão
-        self.bad_words = self.load_bad_words("palavras_bloqueadas.txt")
-        print(f"Carregadas {len(self.bad_words)} palavras para a blacklist")
+        self.server_socket = None
+        self.outbox_limit = outbox_limit
+        self.outbox_policy = outbox_policy
+        self.write_window = write_window  # Segundos que o escritor espera para juntar mensagens
+        self.compress_threshold = compress_threshold  # Bytes a partir dos quais frames são comprimidos; 0 desliga
+        # Totais das filas de saída já fechadas; as abertas são somadas em outbox_counters()
+        self.outbox_stats = {"dropped": 0, "coalesced": 0, "evicted": 0, "messages": 0, "writes": 0}
+        # clients e usernames só recebem operações atômicas (get/set/pop) e são iterados
+        # sobre cópias; as salas ficam no RoomRegistry, com locks por shard e snapshots
+        self.clients = {}  # {client_socket: {"username": username, "room": room, "codec": codec, "outbox": outbox}}
+        self.rooms = RoomRegistry()  # Salas deste processo; "general" é a sala padrão e nunca é apagada
+        self.usernames = {}  # {username: client_socket}
+        self.names_lock = threading.Lock()  # Dois handshakes com o mesmo nome não podem ganhar os dois
+        # Modo multi-processo/cluster: nós trocam salas, sussurros e presença pelo bus
+        self.bus = None  # pubsub.PubSubBackend; None quando o servidor roda sozinho
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.reuse_port = False
+        self.remote_rooms = {}  # {room: {username: node_id}} usuários conectados em outros nós
+        self.remote_users = {}  # {username: node_id}
+        self.history = None  # history.HistoryStore; None quando o histórico está desligado
+        self.recent = RecentMessages(backfill, backfill_total)  # Reenviadas a quem entra na sala
+        # Seqs por sala quando não há histórico (com ele, quem numera é o HistoryStore),
+        # guardadas no shard da sala no RoomRegistry. Clientes que reconectam mandam a
+        # última seq vista e recebem só o que perderam; o epoch muda quando a numeração
+        # recomeça, e aí eles recebem o backfill normal
+        self.epoch = os.urandom(8).hex()
+        # Presença: cada mudança no roster de uma sala (local ou remota) incrementa a versão
+        # e vira um delta presence_join/presence_leave, enviado em lote a cada presence_window.
+        # Versões e deltas também ficam nos shards do RoomRegistry
+        self.presence_window = presence_window
+        # Token buckets por conexão, usuário e sala, verificados antes da censura e do fan-out
+        self.limiter = RateLimiter(rate_limits) if rate_limits else None
+        # Instrumentação (metrics.Metrics); desligada, cada etapa custa só um `if`
+        self.metrics = None
+        self.metrics_address = None  # (host, porta) do endpoint HTTP; None não sobe o endpoint
+        self.metrics_server = None
+        self.censor_accents = censor_accents
+        self.censor_leetspeak = censor_leetspeak
+        # Blacklist compilada (censor.Censor); a lista original fica em self.bad_words.words.
+        # O watcher troca a referência inteira quando o arquivo muda.
+        self.bad_words = self.build_censor(self.load_bad_words(blacklist_path))
+        self.blacklist = BlacklistWatcher(blacklist_path, self.load_bad_words, self.build_censor,
+                                          self.swap_censor, interval=blacklist_interval)
+        log.info("Blacklist compilada", words=len(self.bad_words))
 
     def load_bad_words(self, filename):
         """Carrega a lista de palavras impróprias do arquivo."""
@@ -22,212 +87,934 @@ class ChatServer:
             if os.path.exists(filename):
                 with open(filename, 'r', encoding='utf-8') as file:
                     bad_words = [word.strip().lower() for word in file.readlines() if word.strip()]
-                print(f"Arquivo de blacklist carregado: {filename}")
+                log.info("Arquivo de blacklist carregado", path=filename)
             else:
-                print(f"Arquivo de blacklist não encontrado: {filename}")
-        except Exception as e:
-            print(f"Erro ao carregar a blacklist: {e}")
+                log.warning("Arquivo de blacklist não encontrado", path=filename)
+        except Exception:
+            log.exception("Erro ao carregar a blacklist", path=filename)
         return bad_words
         
-    def censor_message(self, message):
-        """Censura palavras impróprias na mensagem."""
-        if not self.bad_words:
-            return message
+    def build_censor(self, words):
+        return Censor(words, accents=self.censor_accents, leetspeak=self.censor_leetspeak)
 
-        words = re.findall(r'\b\w+\b|\W+', message)
+    def swap_censor(self, censor):
+        # Troca atômica: quem já pegou a referência antiga termina com ela
+        self.bad_words = censor
 
-        for i, word in enumerate(words):
-            if word.lower() in self.bad_words:
-                words[i] = '*' * len(word)
-        
-        return ''.join(words)
+    def censor_message(self, message):
+        """Censura palavras impróprias na mensagem."""
+        if self.metrics is None:
+            return self.bad_words.censor(message)
+        start = now_ns()
+        censored = self.bad_words.censor(message)
+        self.metrics.observe("censor", now_ns() - start)
+        return censored
 
     def start(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen(5)
-        print(f"Servidor iniciado em {self.host}:{self.port}")
+        log.info("Servidor iniciado", engine="threads", host=self.host, port=self.port)
+        self.blacklist.start()
+        self.start_history()
+        self.start_metrics()
+        self.start_bus()
         
         try:
             while True:
                 client_socket, address = self.server_socket.accept()
-                print(f"Conexão de {address} foi estabelecida!")
+                log.info("Conexão estabelecida", event="connect", address=address)
+                # As mensagens já saem agrupadas pela fila de saída; o Nagle só atrasaria
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 
                 # Iniciar uma nova thread para cada cliente
                 client_thread = threading.Thread(target=self.handle_client, args=(client_socket,))
                 client_thread.daemon = True
                 client_thread.start()
         except KeyboardInterrupt:
-            print("Servidor desligando...")
+            log.info("Servidor desligando")
         finally:
             self.server_socket.close()
+            self.stop_bus()
+            self.blacklist.stop()
+            self.stop_history()
+            self.stop_metrics()
 
     def handle_client(self, client_socket):
+        codec = Codec()
         try:
             # Obter nome de usuário do cliente
-            username_data = client_socket.recv(1024).decode('utf-8')
-            username = json.loads(username_data)["username"]
-            
-            # Adicionar cliente à sala geral por padrão
-            self.clients[client_socket] = {"username": username, "room": "general"}
-            self.rooms["general"].add(client_socket)
-            
-            # Notificar todos na sala
-            self.broadcast(f"{username} entrou na sala geral!", "general")
-            
-            # Enviar lista de usuários atual para o novo cliente
-            self.send_users_list(client_socket, "general")
+            hello = None
+            while hello is None:
+                data = client_socket.recv(4096)
+                if not data:
+                    raise ConnectionError("conexão encerrada antes do handshake")
+                codec.feed(data)
+                hello = codec.next_message()
+            self.register_client(client_socket, hello, codec)
+            # Mensagens que chegaram na mesma leitura do handshake já estão no buffer
+            for message in codec:
+                self.handle_message(client_socket, message)
             
             while True:
-                data = client_socket.recv(1024).decode('utf-8')
+                data = client_socket.recv(4096)
                 if not data:
                     break
                 
-                message = json.loads(data)
-                
-                if message["type"] == "message":
-                    room = self.clients[client_socket]["room"]
-                    sender = self.clients[client_socket]["username"]
-                    
-                    # Censurar a mensagem antes de enviar
-                    censored_content = self.censor_message(message['content'])
-                    self.broadcast(f"{sender}: {censored_content}", room)
-                
-                elif message["type"] == "whisper":
-                    target = message["target"]
-                    sender = self.clients[client_socket]["username"]
-                    
-                    # Censurar a mensagem privada antes de enviar
-                    censored_content = self.censor_message(message['content'])
-                    self.whisper(sender, target, censored_content)
-                
-                elif message["type"] == "join_room":
-                    self.change_room(client_socket, message["room"])
-                
-                elif message["type"] == "get_users":
-                    room = message.get("room", self.clients[client_socket]["room"])
-                    self.send_users_list(client_socket, room)
-                    
-                elif message["type"] == "add_blocked_word":
-                    word = message.get("word", "").strip().lower()
-                    if word and word not in self.bad_words:
-                        self.add_bad_word(word)
-                        username = self.clients[client_socket]["username"]
-                        room = self.clients[client_socket]["room"]
-                        self.broadcast(f"Sistema: {username} adicionou uma palavra à blacklist.", room)
-                
-                elif message["type"] == "get_blocked_words":
-                    self.send_blocked_words_list(client_socket)
+                self.process_data(client_socket, codec, data)
         
         except Exception as e:
-            print(f"Erro: {e}")
+            log.warning("Conexão encerrada por erro", event="connection_error", error=repr(e))
         finally:
             self.remove_client(client_socket)
 
-    def broadcast(self, message, room):
-        for client in self.rooms.get(room, set()):
-            try:
-                client.send(json.dumps({"type": "message", "content": message}).encode('utf-8'))
-            except:
-                self.remove_client(client)
+    def process_data(self, client_socket, codec, data):
+        """Decodifica e trata as mensagens completas que chegaram num recv."""
+        metrics = self.metrics
+        if metrics is None:
+            codec.feed(data)
+            for message in codec:
+                self.handle_message(client_socket, message)
+            return
+        
+        received = now_ns()
+        metrics.inc("bytes_received", len(data))
+        codec.feed(data)
+        while True:
+            start = now_ns()
+            message = codec.next_message()
+            if message is None:
+                break
+            parsed = now_ns()
+            metrics.observe("parse", parsed - start)
+            self.handle_message(client_socket, message)
+            metrics.observe("handle", now_ns() - parsed)
+            kind = message["type"]
+            metrics.inc("messages_received", type=kind if kind in MESSAGE_TYPES else "other")
+        metrics.observe("receive", now_ns() - received)
+
+    def register_client(self, client_socket, hello, codec):
+        """Negocia o protocolo, adiciona o cliente à sala geral e avisa os demais.
+
+        Um cliente reconectando manda "resume": {"room", "after", "epoch"} e volta
+        direto para a sala dele, recebendo só as mensagens com seq maior que `after`.
+        """
+        requested = hello["username"]
+        version = negotiate_version(hello)
+        room, after = self.parse_resume(hello.get("resume"))
+        with self.names_lock:
+            username = self.unique_username(requested)
+            self.usernames[username] = client_socket
+        outbox = self.create_outbox(client_socket)
+        if version >= 2:
+            # O welcome ainda vai no formato legado; depois dele os dois lados usam frames.
+            # Clientes antigos não mandam "version" e nunca recebem o welcome.
+            welcome = {"type": "welcome", "version": version, "username": username,
+                       "encoding": negotiate_encoding(hello), "room": room, "epoch": self.seq_epoch()}
+            compression = negotiate_compression(hello) if self.compress_threshold > 0 else None
+            if compression:
+                welcome["compression"] = compression
+                codec.compress_threshold = self.compress_threshold
+            outbox.put(codec.encode(welcome))
+            codec.upgrade(version, welcome["encoding"], compression)
+        
+        self.clients[client_socket] = {"username": username, "room": room, "codec": codec, "outbox": outbox}
+        if self.metrics is not None:
+            self.metrics.inc("connections")
+        if self.bus is not None:
+            self.bus.subscribe(f"user:{username}")
+        self.enter_room(client_socket, room, username)
+        
+        if username != requested:
+            self.send(client_socket, {
+                "type": "message",
+                "content": f"Sistema: o nome {requested} já está em uso; você entrou como {username}."
+            })
+        
+        # Notificar todos na sala
+        if after is not None:
+            self.broadcast(f"{username} reconectou.", room)
+        elif room == "general":
+            self.broadcast(f"{username} entrou na sala geral!", room)
+        else:
+            self.broadcast(f"{username} entrou na sala!", room)
+        
+        # Enviar lista de usuários atual para o novo cliente
+        self.send_users_list(client_socket, room)
+        self.send_backfill(client_socket, room, after)
+
+    def parse_resume(self, resume):
+        """Retorna (sala, última seq vista) de um pedido de resume; a seq é None se não der para retomar."""
+        if not isinstance(resume, dict) or not isinstance(resume.get("room"), str) or not resume["room"]:
+            return "general", None
+        after = resume.get("after")
+        if resume.get("epoch") != self.seq_epoch() or not isinstance(after, int):
+            return resume["room"], None
+        return resume["room"], after
+
+    def seq_epoch(self):
+        return self.history.epoch if self.history is not None else self.epoch
+
+    def next_seq(self, room):
+        return self.rooms.next_seq(room)
+
+    def unique_username(self, username):
+        """Retorna `username` ou, se já estiver em uso, a primeira variação livre (nome2, nome3...)."""
+        candidate = username
+        suffix = 2
+        while candidate in self.usernames or candidate in self.remote_users:
+            candidate = f"{username}{suffix}"
+            suffix += 1
+        return candidate
+
+    def handle_message(self, client_socket, message):
+        """Processa uma mensagem do protocolo recebida de um cliente."""
+        if self.limiter is not None and message["type"] in self.limiter.limits:
+            info = self.clients[client_socket]
+            room = message.get("room") if message["type"] == "join_room" else info["room"]
+            throttled = self.limiter.check(message["type"], client_socket, info["username"], room)
+            if throttled is not None:
+                if self.metrics is not None:
+                    self.metrics.inc("rate_limited", type=message["type"], scope=throttled[0])
+                self.send_rate_limited(client_socket, message["type"], *throttled)
+                return
+        
+        if message["type"] == "message":
+            room = self.clients[client_socket]["room"]
+            sender = self.clients[client_socket]["username"]
+            
+            # Censurar a mensagem antes de enviar
+            censored_content = self.censor_message(message['content'])
+            self.broadcast(f"{sender}: {censored_content}", room, record=True)
+        
+        elif message["type"] == "whisper":
+            target = message["target"]
+            sender = self.clients[client_socket]["username"]
+            
+            # Censurar a mensagem privada antes de enviar
+            censored_content = self.censor_message(message['content'])
+            self.whisper(sender, target, censored_content)
+        
+        elif message["type"] == "join_room":
+            self.change_room(client_socket, message["room"])
+        
+        elif message["type"] == "get_users":
+            room = message.get("room", self.clients[client_socket]["room"])
+            self.send_users_list(client_socket, room)
+            
+        elif message["type"] == "add_blocked_word":
+            word = message.get("word", "").strip().lower()
+            if word and self.add_bad_word(word):
+                username = self.clients[client_socket]["username"]
+                room = self.clients[client_socket]["room"]
+                self.broadcast(f"Sistema: {username} adicionou uma palavra à blacklist.", room)
+        
+        elif message["type"] == "get_blocked_words":
+            self.send_blocked_words_list(client_socket)
+        
+        elif message["type"] == "get_history":
+            room = message.get("room", self.clients[client_socket]["room"])
+            self.send_history(client_socket, room, message.get("before"), message.get("limit", 50))
+        
+        elif message["type"] == "get_stats":
+            self.send_stats(client_socket)
+
+    def send_rate_limited(self, client_socket, kind, scope, retry_after):
+        """Avisa o cliente de que a mensagem foi recusada pelo limite de taxa."""
+        scopes = {"connection": "você está", "user": "você está", "room": "a sala está"}
+        try:
+            # A chave deixa a política coalesce juntar os avisos de um flood num só
+            self.send(client_socket, {
+                "type": "error",
+                "code": "rate_limited",
+                "request": kind,
+                "scope": scope,
+                "retry_after": round(retry_after, 3),
+                "message": f"Sistema: {scopes[scope]} enviando rápido demais; tente de novo em {retry_after:.1f}s."
+            }, key="rate_limited")
+        except:
+            self.remove_client(client_socket)
+
+    def create_outbox(self, client_socket):
+        """Cria a fila de saída da conexão; falhas de escrita desconectam o cliente."""
+        return Outbox(client_socket, **self.outbox_options(client_socket))
+
+    def outbox_options(self, client):
+        return {
+            "limit": self.outbox_limit,
+            "policy": self.outbox_policy,
+            "on_error": lambda: self.on_send_error(client),
+            "on_evict": lambda: self.evict_client(client),
+            "window": self.write_window,
+        }
+
+    def on_send_error(self, client):
+        """Falha de escrita no socket: contar e desconectar o cliente."""
+        if self.metrics is not None and client in self.clients:
+            self.metrics.inc("send_errors")
+        self.remove_client(client)
+
+    def send(self, client, message, key=None):
+        """Codifica uma mensagem no formato negociado pelo cliente e a envia.
+
+        `key` marca snapshots (ex.: "users_list") que podem ser substituídos na fila.
+        """
+        self.send_raw(client, self.clients[client]["codec"].encode(message), key)
+
+    def send_raw(self, client, data, key=None):
+        """Enfileira bytes já codificados na fila de saída do cliente."""
+        if not self.clients[client]["outbox"].put(data, key):
+            raise ConnectionError("conexão fechada")
+
+    def evict_client(self, client_socket):
+        """Desconecta um cliente cuja fila de saída estourou (política disconnect)."""
+        info = self.clients.get(client_socket)
+        if info is None:
+            return
+        self.outbox_stats["evicted"] += 1
+        log.warning("Cliente desconectado: fila de saída cheia", event="evict", username=info["username"])
+        farewell = info["codec"].encode({
+            "type": "message",
+            "content": "Sistema: você foi desconectado por não acompanhar as mensagens da sala."
+        })
+        self.remove_client(client_socket, farewell=farewell, reason="saiu do chat (conexão lenta).")
+
+    def outbox_counters(self):
+        """Mensagens descartadas/coalescidas, clientes desconectados por filas cheias
+        e mensagens enviadas por escrita no socket."""
+        counters = dict(self.outbox_stats)
+        for info in list(self.clients.values()):
+            for name in ("dropped", "coalesced", "messages", "writes"):
+                counters[name] += getattr(info["outbox"], name)
+        counters["messages_per_write"] = counters["messages"] / counters["writes"] if counters["writes"] else 0.0
+        return counters
+
+    def broadcast(self, message, room, record=False):
+        """Envia a mensagem à sala. `record` grava no histórico (mensagens dos usuários)."""
+        self.broadcast_local(message, room, record)
+        if self.bus is not None:
+            self.bus.publish(f"room:{room}", {"content": message, "record": record})
+
+    def broadcast_local(self, message, room, record=False):
+        """Entrega a mensagem só aos membros da sala conectados neste processo."""
+        payload = {"type": "message", "content": message}
+        if record:
+            payload["room"] = room
+            if self.history is not None:
+                entry = self.history.append(room, message)
+                payload["seq"] = entry["seq"]
+                payload["ts"] = entry["ts"]
+            else:
+                payload["seq"] = self.next_seq(room)
+                payload["ts"] = time.time()
+        start = now_ns() if self.metrics is not None else 0
+        # Serializar uma vez só; cada cliente recebe os bytes do seu formato de fio
+        encoded = EncodedMessage(payload)
+        if record:
+            self.recent.add(room, encoded)
+        members = self.rooms.members(room)
+        for client in members:
+            info = self.clients.get(client)
+            if info is not None:
+                info["outbox"].put(encoded.for_codec(info["codec"]))
+        if self.metrics is not None:
+            self.metrics.observe("fanout", now_ns() - start)
+            self.metrics.inc("deliveries", len(members))
 
     def whisper(self, sender, target, message):
-        for client, info in self.clients.items():
-            if info["username"] == target:
-                try:
-                    client.send(json.dumps({
-                        "type": "whisper", 
-                        "sender": sender, 
-                        "content": message
-                    }).encode('utf-8'))
-                    return True
-                except:
-                    self.remove_client(client)
-                    return False
-        return False
+        client = self.usernames.get(target)
+        if client is None:
+            # Usuário em outro nó: publicar no canal dele, que só aquele nó assina
+            if self.bus is not None and target in self.remote_users:
+                self.bus.publish(f"user:{target}", {"sender": sender, "content": message})
+                return True
+            return False
+        return self.deliver_whisper(client, sender, message)
+
+    def deliver_whisper(self, client, sender, message):
+        try:
+            self.send(client, {
+                "type": "whisper", 
+                "sender": sender, 
+                "content": message
+            })
+            return True
+        except:
+            self.remove_client(client)
+            return False
 
     def change_room(self, client_socket, new_room):
-        if client_socket not in self.clients:
+        info = self.clients.get(client_socket)
+        if info is None:
             return
         
-        # Criar sala se não existir
-        if new_room not in self.rooms:
-            self.rooms[new_room] = set()
-        
         # Remover da sala antiga
-        old_room = self.clients[client_socket]["room"]
-        if old_room in self.rooms and client_socket in self.rooms[old_room]:
-            self.rooms[old_room].remove(client_socket)
-            username = self.clients[client_socket]["username"]
+        username = info["username"]
+        old_room = info["room"]
+        if self.leave_room(client_socket, old_room):
             self.broadcast(f"{username} saiu da sala.", old_room)
         
-        # Adicionar à nova sala
-        self.rooms[new_room].add(client_socket)
-        self.clients[client_socket]["room"] = new_room
-        username = self.clients[client_socket]["username"]
+        # Adicionar à nova sala, criando-a se não existir
+        info["room"] = new_room
+        self.enter_room(client_socket, new_room, username)
+        if self.clients.get(client_socket) is not info:
+            # remove_client rodou no meio da troca (ex.: falha de escrita) e pode não ter visto a sala nova
+            self.leave_room(client_socket, new_room)
+            return
         self.broadcast(f"{username} entrou na sala!", new_room)
         
         # Enviar lista de usuários atualizada para o cliente
         self.send_users_list(client_socket, new_room)
+        self.send_backfill(client_socket, new_room)
+
+    def enter_room(self, client_socket, room, username):
+        """Coloca o cliente no índice da sala, criando-a se preciso."""
+        if self.rooms.join(room, client_socket, username) and self.bus is not None:
+            self.bus.subscribe(f"room:{room}")
+        self.queue_presence("join", room, username)
+        self.publish_presence("join", room, username)
+
+    def leave_room(self, client_socket, room):
+        """Tira o cliente do índice da sala, apagando salas vazias. Retorna False se ele não estava lá."""
+        username, removed = self.rooms.leave(room, client_socket)
+        if username is None:
+            return False
+        if removed and self.bus is not None:
+            self.bus.unsubscribe(f"room:{room}")
+            if room in self.rooms:
+                # Alguém recriou a sala enquanto isso; a assinatura dele pode ter vindo antes
+                self.bus.subscribe(f"room:{room}")
+        self.queue_presence("leave", room, username)
+        self.publish_presence("leave", room, username)
+        return True
+
+    def send_backfill(self, client_socket, room, after=None):
+        """Envia ao cliente que acabou de entrar as últimas mensagens da sala, numa única escrita.
+
+        Com `after` (cliente reconectando), só as que têm seq maior: do histórico, se
+        ligado, senão do que ainda está no buffer de mensagens recentes.
+        """
+        if after is not None and self.history is not None:
+            recent = [EncodedMessage(dict(entry, type="message", room=room))
+                      for entry in self.history.since(room, after, max(self.recent.per_room, MAX_PAGE))]
+        else:
+            recent = self.recent.snapshot(room)
+            if after is not None:
+                recent = [encoded for encoded in recent if encoded.message["seq"] > after]
+        info = self.clients.get(client_socket)
+        if not recent or info is None:
+            return
+        codec = info["codec"]
+        try:
+            # A rajada inteira vira um único frame comprimido quando passa do limite; os frames
+            # entram sem compressão porque um frame comprimido não pode conter outro
+            self.send_raw(client_socket, codec.compress(b"".join(encoded.frame(codec) for encoded in recent)))
+        except:
+            self.remove_client(client_socket)
 
     def send_users_list(self, client_socket, room):
-        if room not in self.rooms:
+        if room not in self.rooms and room not in self.remote_rooms:
             return
             
-        users = []
-        for client, info in self.clients.items():
-            if info["room"] == room:
-                users.append(info["username"])
-                
+        version, members = self.rooms.roster(room)
+        users = list(members.values())
+        users.extend(self.remote_rooms.get(room, ()))
+        
         try:
-            client_socket.send(json.dumps({
+            self.send(client_socket, {
                 "type": "users_list",
-                "users": users
-            }).encode('utf-8'))
+                "room": room,
+                "users": users,
+                "version": version
+            }, key="users_list")
         except:
             self.remove_client(client_socket)
 
-    def remove_client(self, client_socket):
-        if client_socket in self.clients:
-            username = self.clients[client_socket]["username"]
-            room = self.clients[client_socket]["room"]
+    def queue_presence(self, event, room, username):
+        """Registra uma entrada/saída na sala; o delta sai no próximo lote do shard dela."""
+        # Sala apagada aqui e sem membros em outros nós: o registry esquece a versão
+        shard = self.rooms.queue_presence(room, {"type": f"presence_{event}", "room": room, "username": username},
+                                          keep=room in self.remote_rooms)
+        if shard is not None:
+            if self.presence_window > 0:
+                self.call_later(self.presence_window, lambda: self.flush_presence(shard))
+            else:
+                self.flush_presence(shard)
+
+    def flush_presence(self, shard):
+        """Envia os deltas acumulados no shard: uma escrita por cliente com todos os eventos da sua sala."""
+        for room, deltas in self.rooms.take_presence(shard).items():
+            encoded = [EncodedMessage(delta) for delta in deltas]
+            for client in self.rooms.members(room):
+                info = self.clients.get(client)
+                # Clientes do protocolo legado só entendem as mensagens de texto
+                if info is not None and info["codec"].version >= 2:
+                    codec = info["codec"]
+                    info["outbox"].put(b"".join(delta.for_codec(codec) for delta in encoded))
+
+    def call_later(self, delay, callback):
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+
+    def remove_client(self, client_socket, farewell=None, reason="saiu do chat."):
+        # pop garante que só quem removeu primeiro (leitura ou escrita) faz a limpeza
+        info = self.clients.pop(client_socket, None)
+        if info is not None:
+            username = info["username"]
+            room = info["room"]
             
-            # Remover da sala
-            if room in self.rooms and client_socket in self.rooms[room]:
-                self.rooms[room].remove(client_socket)
-                self.broadcast(f"{username} saiu do chat.", room)
+            # Fechar a fila de saída; ela envia `farewell` (se houver) e fecha o socket
+            outbox = info["outbox"]
+            outbox.close(farewell)
+            if self.limiter is not None:
+                self.limiter.forget(client_socket)
+            for name in ("dropped", "coalesced", "messages", "writes"):
+                self.outbox_stats[name] += getattr(outbox, name)
             
-            # Remover dos clientes
-            del self.clients[client_socket]
+            if self.usernames.get(username) is client_socket:
+                del self.usernames[username]
+                if self.bus is not None:
+                    self.bus.unsubscribe(f"user:{username}")
             
-            # Fechar socket
-            try:
-                client_socket.close()
-            except:
-                pass
+            # Remover da sala
+            if self.leave_room(client_socket, room):
+                self.broadcast(f"{username} {reason}", room)
+            log.info("Cliente saiu", event="disconnect", username=username, room=room)
+
+    def start_history(self):
+        if self.history is not None:
+            self.history.start()
+
+    def stop_history(self):
+        if self.history is not None:
+            self.history.close()
+
+    def send_history(self, client_socket, room, before=None, limit=50):
+        """Envia uma página do histórico da sala; `before` é o cursor devolvido na página anterior."""
+        if self.history is None or not isinstance(before, (int, type(None))) or not isinstance(limit, int):
+            messages, cursor = [], None
+        else:
+            messages, cursor = self.history.page(room, before, limit)
+        try:
+            self.send(client_socket, {
+                "type": "history",
+                "room": room,
+                "messages": messages,
+                "next_cursor": cursor
+            })
+        except:
+            self.remove_client(client_socket)
+
+    def start_metrics(self):
+        if self.metrics is not None and self.metrics_address is not None:
+            host, port = self.metrics_address
+            self.metrics_server = serve_metrics(host, port, self.render_metrics)
+
+    def stop_metrics(self):
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+
+    def render_metrics(self):
+        totals = [(f"outbox_{name}", value) for name, value in self.outbox_counters().items()
+                  if name != "messages_per_write"]
+        return self.metrics.render(self.metrics_gauges(), totals)
+
+    def metrics_gauges(self):
+        """Valores instantâneos: conexões, conexões por sala e profundidade das filas de saída."""
+        clients = list(self.clients.values())
+        depths = [len(info["outbox"]) for info in clients]
+        rooms = sorted(((len(members), room) for room, members in self.rooms.items()), reverse=True)
+        gauges = [
+            ("connected_clients", "Conexões abertas neste processo", {}, len(clients)),
+            ("rooms", "Salas com membros neste processo", {}, len(rooms)),
+            ("remote_users", "Usuários conectados em outros nós", {}, len(self.remote_users)),
+            ("outbox_depth", "Mensagens esperando nas filas de saída (soma)", {}, sum(depths)),
+            ("outbox_depth_max", "Maior fila de saída", {}, max(depths, default=0)),
+            ("recent_messages", "Mensagens guardadas para o backfill", {}, len(self.recent)),
+        ]
+        for count, room in rooms[:ROOM_GAUGE_LIMIT]:
+            gauges.append(("room_connections", "Conexões por sala (as mais cheias)", {"room": room}, count))
+        return gauges
+
+    def send_stats(self, client_socket):
+        """Responde ao /stats: estado atual, contadores e percentis de latência (em µs) das etapas."""
+        stats = {name: value for name, _, labels, value in self.metrics_gauges() if not labels}
+        stats["outbox"] = self.outbox_counters()
+        if self.metrics is not None:
+            stats["uptime"] = round(time.time() - self.metrics.started, 1)
+            stats["counters"] = {name + "".join(f" {k}={v}" for k, v in labels): value
+                                 for (name, labels), value in sorted(self.metrics.counters().items())}
+            stats["latency_us"] = self.metrics.latencies()
+        try:
+            self.send(client_socket, {"type": "stats", "node": self.node_id, "stats": stats}, key="stats")
+        except:
+            self.remove_client(client_socket)
+
+    def stop_bus(self):
+        if self.bus is None:
+            return
+        try:
+            self.bus.publish("presence", {"event": "down", "node": self.node_id})
+        except OSError:
+            pass
+        self.bus.stop()
+
+    def start_bus(self):
+        """Conecta ao bus entre processos, se houver, e pede o estado dos outros workers."""
+        if self.bus is None:
+            return
+        self.bus.start(self.node_id, lambda channel, data: self.call_soon(self.on_bus_message, channel, data))
+        self.bus.subscribe("presence")
+        for room in self.rooms.names():
+            self.bus.subscribe(f"room:{room}")
+        self.bus.publish("presence", {"event": "sync", "node": self.node_id})
+
+    def call_soon(self, callback, *args):
+        """Executa um callback vindo de outra thread (o bus). No ChatServer isso é direto."""
+        callback(*args)
+
+    def on_bus_message(self, channel, data):
+        if channel.startswith("room:"):
+            self.broadcast_local(data["content"], channel[len("room:"):], data.get("record", False))
+        elif channel.startswith("user:"):
+            client = self.usernames.get(channel[len("user:"):])
+            if client is not None:
+                self.deliver_whisper(client, data["sender"], data["content"])
+        elif channel == "presence":
+            self.on_presence(data)
+
+    def publish_presence(self, event, room, username):
+        if self.bus is not None:
+            self.bus.publish("presence", {"event": event, "node": self.node_id, "room": room, "username": username})
+
+    def on_presence(self, data):
+        """Atualiza remote_rooms/remote_users com entradas e saídas de usuários de outros nós."""
+        event, node = data["event"], data["node"]
+        if event == "join":
+            self.remote_rooms.setdefault(data["room"], {})[data["username"]] = node
+            self.remote_users[data["username"]] = node
+            self.queue_presence("join", data["room"], data["username"])
+        elif event == "leave":
+            members = self.remote_rooms.get(data["room"], {})
+            if members.get(data["username"]) == node:
+                del members[data["username"]]
+                if not members:
+                    del self.remote_rooms[data["room"]]
+                self.queue_presence("leave", data["room"], data["username"])
+            # change_room manda leave seguido de join; o join recoloca o usuário
+            if self.remote_users.get(data["username"]) == node:
+                del self.remote_users[data["username"]]
+        elif event == "sync":
+            # Um nó novo pediu o estado: responder com todos os usuários locais
+            local = [[room, username] for room, members in self.rooms.items() for username in members.values()]
+            self.bus.publish("presence", {"event": "roster", "node": self.node_id, "members": local})
+        elif event == "roster":
+            for room, username in data["members"]:
+                self.remote_rooms.setdefault(room, {})[username] = node
+                self.remote_users[username] = node
+                self.queue_presence("join", room, username)
+        elif event == "down":
+            # Nó caiu ou foi desligado: esquecer todos os usuários dele
+            for room in list(self.remote_rooms):
+                members = self.remote_rooms[room]
+                for username in [u for u, n in members.items() if n == node]:
+                    del members[username]
+                    self.queue_presence("leave", room, username)
+                if not members:
+                    del self.remote_rooms[room]
+            for username in [u for u, n in self.remote_users.items() if n == node]:
+                del self.remote_users[username]
 
     def add_bad_word(self, word):
-        """Adiciona uma palavra à blacklist e atualiza o arquivo."""
-        if word not in self.bad_words:
-            self.bad_words.append(word)
-            try:
-                with open("palavras_bloqueadas.txt", "a", encoding="utf-8") as file:
-                    file.write(f"\n{word}")
-                print(f"Palavra adicionada à blacklist: {word}")
-            except Exception as e:
-                print(f"Erro ao salvar palavra na blacklist: {e}")
+        """Adiciona uma palavra à blacklist e agenda a gravação no arquivo. Retorna False se ela já existia."""
+        with self.blacklist.lock:
+            if not self.bad_words.add(word):
+                return False
+            self.blacklist.append(word)
+        log.info("Palavra adicionada à blacklist", word=word)
+        return True
 
     def send_blocked_words_list(self, client_socket):
         """Envia a lista de palavras bloqueadas para o cliente."""
         try:
-            client_socket.send(json.dumps({
+            self.send(client_socket, {
                 "type": "blocked_words_list",
-                "words": self.bad_words
-            }).encode('utf-8'))
-            print(f"Lista de palavras bloqueadas enviada para o cliente.")
+                "words": self.bad_words.words
+            }, key="blocked_words_list")
+            log.debug("Lista de palavras bloqueadas enviada", words=len(self.bad_words.words))
         except Exception as e:
-            print(f"Erro ao enviar lista de palavras bloqueadas: {e}")
+            log.warning("Erro ao enviar lista de palavras bloqueadas", error=repr(e))
             self.remove_client(client_socket)
 
+class AsyncChatServer(ChatServer):
+    """Servidor de chat com um único event loop asyncio em vez de uma thread por conexão.
+
+    Usa o mesmo protocolo JSON e as mesmas regras de salas, sussurros e blacklist
+    do ChatServer; os clientes são identificados pelo seu StreamWriter.
+    """
+
+    def __init__(self, host='localhost', port=9999, backlog=1024, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.backlog = backlog
+
+    def start(self):
+        log.info("Servidor iniciado", engine="asyncio", host=self.host, port=self.port)
+        self.blacklist.start()
+        self.start_history()
+        self.start_metrics()
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            log.info("Servidor desligando")
+        finally:
+            self.blacklist.stop()
+            self.stop_history()
+            self.stop_metrics()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(
+            self.handle_client, self.host, self.port,
+            reuse_address=True, reuse_port=self.reuse_port, backlog=self.backlog)
+        self.start_bus()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            # Com o loop ainda de pé: o bus entrega mensagens por call_soon_threadsafe
+            self.stop_bus()
+
+    async def handle_client(self, reader, writer):
+        log.info("Conexão estabelecida", event="connect", address=writer.get_extra_info('peername'))
+        codec = Codec()
+        try:
+            # Obter nome de usuário do cliente
+            hello = None
+            while hello is None:
+                data = await reader.read(4096)
+                if not data:
+                    raise ConnectionError("conexão encerrada antes do handshake")
+                codec.feed(data)
+                hello = codec.next_message()
+            self.register_client(writer, hello, codec)
+            # Mensagens que chegaram na mesma leitura do handshake já estão no buffer
+            for message in codec:
+                self.handle_message(writer, message)
+            
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                
+                self.process_data(writer, codec, data)
+        
+        except asyncio.CancelledError:
+            # Servidor desligando: asyncio.run cancela as conexões abertas
+            pass
+        except Exception as e:
+            log.warning("Conexão encerrada por erro", event="connection_error", error=repr(e))
+        finally:
+            self.remove_client(writer)
+
+    def create_outbox(self, writer):
+        return AsyncOutbox(writer, **self.outbox_options(writer))
+
+    def call_soon(self, callback, *args):
+        # O estado do servidor só é tocado pela thread do event loop
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass  # Loop já fechado: mensagem que chegou do bus durante o desligamento
+
+    def call_later(self, delay, callback):
+        self.loop.call_later(delay, callback)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de chat")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads",
+                        help="threads: uma thread por conexão; asyncio: um único event loop")
+    parser.add_argument("--outbox-limit", type=int, default=DEFAULT_LIMIT,
+                        help="mensagens pendentes por cliente antes de aplicar a política")
+    parser.add_argument("--outbox-policy", choices=POLICIES, default=DROP_OLDEST,
+                        help="o que fazer quando um cliente lento enche a fila de saída")
+    parser.add_argument("--write-window", type=int, default=0, metavar="MICROSSEGUNDOS",
+                        help="tempo que cada conexão espera para juntar mensagens numa escrita (0: só o que já está na fila)")
+    parser.add_argument("--compress-threshold", type=int, default=DEFAULT_COMPRESS_THRESHOLD, metavar="BYTES",
+                        help="comprimir (deflate) mensagens e rajadas a partir desse tamanho; 0 desliga")
+    parser.add_argument("--rate-limit", action="append", default=[], metavar="TIPO:ESCOPO=TAXA/RAJADA",
+                        help="limite por conexão, usuário ou sala, ex.: message:room=100/200 ou whisper:user=off")
+    parser.add_argument("--no-rate-limit", action="store_true", help="desliga todos os limites de taxa")
+    parser.add_argument("--fold-accents", action="store_true",
+                        help="censurar também variações sem acento (palavrao -> palavrão)")
+    parser.add_argument("--leetspeak", action="store_true",
+                        help="censurar também variações em leetspeak (p0rr4 -> porra)")
+    parser.add_argument("--blacklist", default="palavras_bloqueadas.txt",
+                        help="arquivo da blacklist, recarregado quando é alterado")
+    parser.add_argument("--blacklist-interval", type=float, default=1.0,
+                        help="segundos entre verificações e gravações do arquivo da blacklist")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processos dividindo a porta com SO_REUSEPORT (Linux/macOS)")
+    parser.add_argument("--pubsub", metavar="redis://HOST:PORTA",
+                        help="compartilhar salas com outros nós via um servidor compatível com Redis")
+    parser.add_argument("--node-id", help="identificador deste nó no cluster (padrão: host:pid)")
+    parser.add_argument("--backfill", type=int, default=DEFAULT_BACKFILL,
+                        help="mensagens recentes reenviadas a quem entra numa sala (0 desliga)")
+    parser.add_argument("--backfill-total", type=int, default=DEFAULT_BACKFILL_TOTAL,
+                        help="limite de mensagens recentes guardadas somando todas as salas")
+    parser.add_argument("--presence-window", type=float, default=DEFAULT_PRESENCE_WINDOW,
+                        help="segundos agrupando entradas/saídas numa sala antes de avisar os membros")
+    parser.add_argument("--history-dir",
+                        help="diretório do histórico persistente das salas (desligado se omitido)")
+    parser.add_argument("--history-segment-size", type=int, default=DEFAULT_SEGMENT_BYTES,
+                        help="bytes por segmento do histórico antes da rotação")
+    parser.add_argument("--history-fsync-interval", type=float, default=DEFAULT_FSYNC_INTERVAL,
+                        help="segundos entre fsyncs do histórico (gravações em lote)")
+    parser.add_argument("--history-retention", type=float, metavar="DIAS",
+                        help="apagar segmentos do histórico mais antigos que isso (padrão: nunca)")
+    parser.add_argument("--log-level", choices=logs.LEVELS, default="INFO")
+    parser.add_argument("--log-format", choices=logs.FORMATS, default="text",
+                        help="formato do log no terminal (o arquivo é sempre JSON)")
+    parser.add_argument("--log-file", help="arquivo de log em JSON, com rotação por tamanho")
+    parser.add_argument("--log-max-bytes", type=int, default=logs.DEFAULT_MAX_BYTES,
+                        help="tamanho do arquivo de log antes da rotação")
+    parser.add_argument("--log-backups", type=int, default=logs.DEFAULT_BACKUPS,
+                        help="arquivos de log antigos mantidos na rotação")
+    parser.add_argument("--log-sample", action="append", default=[], metavar="EVENTO=N",
+                        help="registrar só 1 de cada N eventos frequentes, ex.: connect=100 ou disconnect=100")
+    parser.add_argument("--metrics", action="store_true",
+                        help="liga contadores e histogramas de latência (também no /stats do cliente)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="porta do endpoint Prometheus (GET /metrics); implica --metrics")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                        help="endereço do endpoint de métricas (padrão: só local)")
+    args = parser.parse_args(argv)
+    if args.history_dir and (args.workers > 1 or args.pubsub):
+        # Cada processo só recebe as mensagens das salas em que tem membros: o histórico
+        # de cada um teria buracos, diferentes conforme o worker/nó que aceitou a conexão
+        parser.error("--history-dir só funciona com um único processo (sem --workers ou --pubsub)")
+    return args
+
+
+def build_server(args):
+    options = {
+        "outbox_limit": args.outbox_limit,
+        "outbox_policy": args.outbox_policy,
+        "censor_accents": args.fold_accents,
+        "censor_leetspeak": args.leetspeak,
+        "blacklist_path": args.blacklist,
+        "blacklist_interval": args.blacklist_interval,
+        "backfill": args.backfill,
+        "backfill_total": args.backfill_total,
+        "presence_window": args.presence_window,
+        "write_window": args.write_window / 1e6,
+        "compress_threshold": args.compress_threshold,
+        "rate_limits": None if args.no_rate_limit else parse_rate_limits(args.rate_limit),
+    }
+    if args.engine == "asyncio":
+        server = AsyncChatServer(args.host, args.port, **options)
+    else:
+        server = ChatServer(args.host, args.port, **options)
+    if args.node_id:
+        server.node_id = args.node_id
+    if args.pubsub:
+        server.bus = make_backend(args.pubsub)
+    if args.history_dir:
+        server.history = make_history(args, args.history_dir)
+    if args.metrics or args.metrics_port is not None:
+        server.metrics = Metrics()
+        if args.metrics_port is not None:
+            server.metrics_address = (args.metrics_host, args.metrics_port)
+    return server
+
+
+def setup_logging(args):
+    logs.setup(level=args.log_level, console_format=args.log_format, file=args.log_file,
+               max_bytes=args.log_max_bytes, backups=args.log_backups, sample=logs.parse_samples(args.log_sample))
+
+
+def parse_rate_limits(specs):
+    try:
+        return build_limits(specs)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+
+def make_history(args, directory):
+    retention = args.history_retention * 86400 if args.history_retention is not None else None
+    return HistoryStore(directory, segment_bytes=args.history_segment_size,
+                        fsync_interval=args.history_fsync_interval, retention=retention)
+
+
+def make_backend(url):
+    """Cria o backend de pub/sub a partir de uma URL (por enquanto só redis://host:porta)."""
+    parsed = urlparse(url)
+    if parsed.scheme != "redis":
+        raise SystemExit(f"backend de pub/sub não suportado: {url}")
+    return RedisBackend(parsed.hostname or "localhost", parsed.port or 6379)
+
+
+SHUTDOWN_TIMEOUT = 3.0
+
+
+def run_worker(index, args, hub_path):
+    if args.metrics_port is not None:
+        # Cada worker tem os próprios contadores: um endpoint por worker, em portas seguidas
+        args.metrics_port += index
+    if args.log_file:
+        # A rotação não é segura com vários processos no mesmo arquivo: um por worker
+        base, ext = os.path.splitext(args.log_file)
+        args.log_file = f"{base}.worker{index}{ext}"
+    # A thread de escrita dos logs não sobrevive ao fork; cada worker sobe a sua
+    setup_logging(args)
+    server = build_server(args)
+    server.node_id = f"{args.node_id or socket.gethostname()}/worker{index}"
+    server.reuse_port = True
+    # Com --pubsub cada worker fala direto com o Redis; senão, com o Hub local
+    if server.bus is None:
+        server.bus = HubBackend(hub_path)
+    server.start()
+
+
+def run_workers(args):
+    """Sobe um Hub neste processo e `args.workers` processos servindo a mesma porta."""
+    if not hasattr(socket, "SO_REUSEPORT") or not hasattr(socket, "AF_UNIX"):
+        raise SystemExit("--workers precisa de SO_REUSEPORT e Unix domain sockets (Linux/macOS)")
+    
+    hub_path = os.path.join(tempfile.gettempdir(), f"chat-hub-{args.port}.sock")
+    hub = Hub(hub_path)
+    hub.start()
+    workers = [multiprocessing.Process(target=run_worker, args=(i, args, hub_path))
+               for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # No terminal o Ctrl+C também chega aos workers, que encerram sozinhos;
+        # quem não encerrar a tempo (sinal enviado só ao processo principal) é terminado
+        log.info("Servidor desligando")
+        for worker in workers:
+            worker.join(timeout=SHUTDOWN_TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
+    finally:
+        hub.stop()
+
+
 if __name__ == "__main__":
-    server = ChatServer()
-    server.start() 
\ No newline at end of file
+    args = parse_args()
+    setup_logging(args)
+    if args.workers > 1:
+        run_workers(args)
+    else:
+        build_server(args).start()
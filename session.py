@@ -0,0 +1,570 @@
+"""Cliente do chat sem interface: conexão, protocolo, sala, roster e reconexão.
+
+Bots, integrações e a interface curses (client.py) usam a mesma sessão:
+
+    def show(message):
+        print(message["content"])
+
+    session = ChatSession("bot", on_message=show)
+    session.connect()
+    session.join_room("suporte")
+    session.run()
+
+A variante asyncio entrega as mensagens por callbacks e por `async for`, e
+centenas delas cabem num único event loop:
+
+    session = AsyncChatSession("bot")
+    await session.connect()
+    async for message in session:
+        ...
+"""
+import asyncio
+import random
+import selectors
+import socket
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+from protocol import Codec, PROTOCOL_VERSION, JSON, MSGPACK, DEFLATE
+from outbox import SelectorOutbox
+from packer import ACCELERATED
+import logs
+
+# O MessagePack em Python puro é menor no fio mas decodifica mais devagar que o json
+# do CPython; só é a preferência quando o pacote msgpack (em C) está instalado
+DEFAULT_ENCODINGS = (MSGPACK, JSON) if ACCELERATED else (JSON, MSGPACK)
+
+# Reconexão: espera aleatória entre 0 e base * 2^tentativa, limitada a RECONNECT_MAX
+# (backoff exponencial com jitter, para clientes derrubados juntos não voltarem juntos)
+RECONNECT_BASE = 0.5
+RECONNECT_MAX = 30.0
+CONNECT_TIMEOUT = 5.0  # Para conectar e receber o welcome
+DEFAULT_BACKLOG = 1000  # Mensagens guardadas para o `async for` da AsyncChatSession
+
+log = logs.get_logger("chat.session")
+
+
+class BaseSession(ABC):
+    """Estado e protocolo de uma conexão de cliente, sem E/S.
+
+    Acompanha a sala atual, a lista de usuários (snapshot + deltas de presença),
+    o cursor do /history e a última seq vista, usada para retomar a sessão depois
+    de uma reconexão. Cada mensagem recebida atualiza esse estado e então chama
+    o callback do tipo dela:
+
+    - on_message(message): mensagens da sala ("content", e "room"/"seq"/"ts" quando gravadas)
+    - on_whisper(message): sussurros ("sender", "content")
+    - on_presence(message): users_list ou presence_join/presence_leave já aplicados a `users`
+    - on_event(message): o resto (history, error, stats, blocked_words_list)
+    - on_connection(connected): False a cada queda ou tentativa frustrada, True ao reconectar
+    """
+
+    def __init__(self, username, host='localhost', port=9999, encodings=DEFAULT_ENCODINGS, reconnect=True,
+                 on_message=None, on_whisper=None, on_presence=None, on_event=None, on_connection=None):
+        self.username = username
+        self.host = host
+        self.port = port
+        self.encodings = list(encodings)  # Oferecidas ao servidor, por ordem de preferência
+        self.reconnect = reconnect
+        self.on_message = on_message
+        self.on_whisper = on_whisper
+        self.on_presence = on_presence
+        self.on_event = on_event
+        self.on_connection = on_connection
+        self.codec = Codec()
+        self.connected = False
+        self.closed = False
+        self.attempt = 0  # Tentativas de reconexão desde a última queda
+        self.room = "general"
+        self.users = [username]
+        self.roster_version = None  # Versão de `users`; None enquanto espera um snapshot
+        self.history_cursor = None  # Cursor da próxima página de /history na sala atual
+        self.history_done = False
+        # Retomada da sessão: última seq vista na sala atual e a numeração (epoch) dela
+        self.last_seq = None
+        self.epoch = None
+
+    def hello(self):
+        """Primeira mensagem da conexão; numa reconexão, pede para retomar a sala atual."""
+        hello = {"username": self.username, "version": PROTOCOL_VERSION, "encodings": self.encodings,
+                 "compression": [DEFLATE]}
+        if self.epoch is not None:
+            hello["resume"] = {"room": self.room, "after": self.last_seq, "epoch": self.epoch}
+        return hello
+
+    def accept_welcome(self, message):
+        """Aplica a primeira mensagem do servidor. Retorna False se não era um welcome (servidor antigo)."""
+        self.connected = True
+        self.users = [self.username]
+        self.roster_version = None
+        if message.get("type") != "welcome":
+            # Servidores antigos não retomam a sessão: todo cliente começa na sala geral
+            self.epoch = None
+            self.room = "general"
+            return False
+        # Servidores sem suporte a outras codificações não mandam "encoding"
+        self.codec.upgrade(message.get("version", PROTOCOL_VERSION), message.get("encoding", JSON),
+                           message.get("compression"))
+        # O servidor pode ter trocado o nome se ele já estava em uso
+        self.username = message.get("username", self.username)
+        self.users = [self.username]
+        epoch = message.get("epoch")
+        if epoch != self.epoch:
+            self.last_seq = None  # A numeração recomeçou (ex.: servidor sem histórico reiniciado)
+        self.epoch = epoch
+        self.room = message.get("room", "general")
+        return True
+
+    def next_delay(self):
+        """Espera até a próxima tentativa de reconexão (e conta a tentativa)."""
+        delay = random.uniform(0, min(RECONNECT_MAX, RECONNECT_BASE * 2 ** self.attempt))
+        self.attempt += 1
+        return delay
+
+    @abstractmethod
+    def send(self, message):
+        """Envia uma mensagem do protocolo; levanta ConnectionError se não houver conexão."""
+
+    def dispatch(self, message):
+        """Atualiza o estado da sessão com uma mensagem do servidor e chama o callback dela."""
+        kind = message.get("type")
+        if kind == "message":
+            if "seq" in message and message.get("room") == self.room:
+                self.last_seq = message["seq"]  # Ponto de retomada se a conexão cair
+            callback = self.on_message
+
+        elif kind == "whisper":
+            callback = self.on_whisper
+
+        elif kind == "users_list":
+            if message.get("room", self.room) != self.room:
+                return
+            self.users = list(message["users"])
+            self.roster_version = message.get("version")
+            callback = self.on_presence
+
+        elif kind in ("presence_join", "presence_leave"):
+            if not self.apply_presence(message):
+                return
+            callback = self.on_presence
+
+        elif kind == "history":
+            if message.get("room", self.room) != self.room:
+                return
+            self.history_cursor = message.get("next_cursor")
+            self.history_done = self.history_cursor is None
+            callback = self.on_event
+
+        else:
+            callback = self.on_event
+
+        if callback is not None:
+            callback(message)
+
+    def apply_presence(self, message):
+        """Aplica um delta de presença; se faltou algum, pede a lista completa de novo.
+
+        Retorna True se `users` mudou.
+        """
+        if message.get("room") != self.room or self.roster_version is None:
+            return False
+        version = message["version"]
+        if version <= self.roster_version:
+            return False  # Já incluído no snapshot
+        if version != self.roster_version + 1:
+            self.roster_version = None
+            self.request_users()
+            return False
+
+        self.roster_version = version
+        username = message["username"]
+        if message["type"] == "presence_join":
+            if username not in self.users:
+                self.users.append(username)
+        elif username in self.users:
+            self.users.remove(username)
+        return True
+
+    # Pedidos ao servidor; levantam ConnectionError se a sessão está sem conexão
+
+    def send_message(self, content):
+        self.send({"type": "message", "content": content})
+
+    def send_whisper(self, target, content):
+        self.send({"type": "whisper", "target": target, "content": content})
+
+    def join_room(self, room):
+        # O servidor responde ao join_room com a lista de usuários da nova sala
+        self.send({"type": "join_room", "room": room})
+        self.room = room
+        self.last_seq = None
+        self.history_cursor = None
+        self.history_done = False
+        self.users = [self.username]
+        self.roster_version = None
+
+    def request_users(self, room=None):
+        self.send({"type": "get_users", "room": room or self.room})
+
+    def request_history(self, limit=None):
+        """Pede a página seguinte (mais antiga) do histórico da sala atual."""
+        request = {"type": "get_history", "room": self.room}
+        if self.history_cursor is not None:
+            request["before"] = self.history_cursor
+        if limit is not None:
+            request["limit"] = limit
+        self.send(request)
+
+    def add_blocked_word(self, word):
+        self.send({"type": "add_blocked_word", "word": word})
+
+    def request_blocked_words(self):
+        self.send({"type": "get_blocked_words"})
+
+    def request_stats(self):
+        self.send({"type": "get_stats"})
+
+
+class ChatSession(BaseSession):
+    """Sessão síncrona, sem threads: um socket não bloqueante num selector.
+
+    Várias sessões (e outros arquivos, como o stdin da interface curses) podem
+    dividir o mesmo selector; a chave de cada socket aponta para a sessão dona
+    dele. Quem roda o laço chama on_ready(mask) quando o socket fica pronto e
+    tick() a cada volta, para as reconexões agendadas; timeout() diz quanto o
+    select pode esperar. Sem laço próprio, use run() ou run_sessions().
+    """
+
+    def __init__(self, username, selector=None, **kwargs):
+        super().__init__(username, **kwargs)
+        self.selector = selector or selectors.DefaultSelector()
+        self.sock = None
+        self.outbox = None
+        self.interest = 0  # Eventos pedidos ao selector para o socket
+        self.connecting = False  # connect() não bloqueante em andamento
+        self.handshaking = False  # hello enviado, esperando o welcome
+        self.connect_deadline = None
+        self.reconnect_at = None  # Instante (monotonic) da próxima tentativa; None se conectado
+
+    def connect(self, timeout=CONNECT_TIMEOUT):
+        """Conecta e faz o handshake bloqueando; depois disso tudo passa pelo selector.
+
+        Levanta OSError se não conseguir conectar.
+        """
+        sock = socket.create_connection((self.host, self.port), timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.codec = Codec()
+        sock.sendall(self.codec.encode(self.hello()))
+
+        # Servidores novos respondem com "welcome"; servidores antigos mandam direto
+        # as mensagens da sala, que são despachadas assim que o handshake termina
+        message = None
+        try:
+            while message is None:
+                data = sock.recv(4096)
+                if not data:
+                    raise ConnectionError("servidor encerrou a conexão")
+                self.codec.feed(data)
+                message = self.codec.next_message()
+        except socket.timeout:
+            pass
+        welcome = message is not None and self.accept_welcome(message)
+        self.connected = True
+
+        sock.setblocking(False)
+        self.outbox = SelectorOutbox(sock, on_error=lambda: self.lost("falha ao enviar"))
+        self.selector.register(sock, selectors.EVENT_READ, self)
+        self.interest = selectors.EVENT_READ
+        if message is not None and not welcome:
+            self.dispatch(message)
+        for message in self.codec:
+            self.dispatch(message)
+
+    def send(self, message):
+        if self.connecting or self.handshaking:
+            # Até o welcome o codec ainda está no formato legado
+            raise ConnectionError("reconectando ao servidor")
+        # Se a escrita falhar, o on_error da fila já chamou lost() e agendou a reconexão
+        if self.outbox is None or not (self.outbox.put(self.codec.encode(message)) and self.outbox.flush()):
+            raise ConnectionError("sem conexão com o servidor")
+        self.update_interest()
+
+    def update_interest(self):
+        """EVENT_WRITE só enquanto o connect não terminou ou algo não coube no socket."""
+        if self.reconnect_at is not None or self.closed:
+            return
+        events = selectors.EVENT_READ
+        if self.connecting or self.outbox.pending:
+            events |= selectors.EVENT_WRITE
+        if events != self.interest:
+            self.selector.modify(self.sock, events, self)
+            self.interest = events
+
+    def timeout(self):
+        """Segundos até a próxima reconexão ou prazo do handshake; None se não há nada agendado."""
+        deadline = self.reconnect_at if self.reconnect_at is not None else self.connect_deadline
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.monotonic())
+
+    def tick(self):
+        """Dispara a reconexão agendada ou desiste de uma tentativa que passou do prazo."""
+        now = time.monotonic()
+        if self.reconnect_at is not None and now >= self.reconnect_at:
+            self.start_reconnect()
+        elif self.connect_deadline is not None and now >= self.connect_deadline:
+            self.lost("tempo esgotado")
+
+    def on_ready(self, mask):
+        if self.closed:
+            return
+        if self.connecting:
+            error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self.lost(f"connect falhou (errno {error})")
+                return
+            self.connecting = False
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.outbox.put(self.codec.encode(self.hello()))
+            self.handshaking = True
+            mask |= selectors.EVENT_WRITE
+
+        if mask & selectors.EVENT_WRITE and not self.outbox.flush():
+            return  # on_error da fila já chamou lost()
+        if mask & selectors.EVENT_READ:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                data = None
+            except OSError as e:
+                self.lost(repr(e))
+                return
+            if data == b"":
+                self.lost("servidor encerrou a conexão")
+                return
+            if data:
+                self.receive(data)
+        self.update_interest()
+
+    def receive(self, data):
+        self.codec.feed(data)
+        # Processar todas as mensagens completas já recebidas
+        for message in self.codec:
+            if self.handshaking:
+                self.handshaking = False
+                self.connect_deadline = None
+                welcome = self.accept_welcome(message)
+                log.info("Reconectado", event="reconnect", attempts=self.attempt, room=self.room,
+                         after=self.last_seq)
+                self.attempt = 0
+                if self.on_connection is not None:
+                    self.on_connection(True)
+                if welcome:
+                    continue
+            self.dispatch(message)
+
+    def lost(self, reason):
+        """Fecha o socket morto e, com `reconnect`, agenda a próxima tentativa."""
+        if self.attempt == 0:
+            log.warning("Conexão com o servidor perdida", event="disconnect", reason=reason)
+        else:
+            log.info("Reconexão falhou", event="reconnect_failed", reason=reason, attempt=self.attempt)
+        self.selector.unregister(self.sock)
+        self.outbox.close()
+        self.connected = self.connecting = self.handshaking = False
+        self.connect_deadline = None
+        self.roster_version = None
+        if self.reconnect:
+            self.reconnect_at = time.monotonic() + self.next_delay()
+        else:
+            self.closed = True
+        if self.on_connection is not None:
+            self.on_connection(False)
+
+    def start_reconnect(self):
+        """Começa um connect não bloqueante; on_ready termina o handshake quando o socket responder."""
+        self.reconnect_at = None
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.codec = Codec()
+        self.outbox = SelectorOutbox(self.sock, on_error=lambda: self.lost("falha ao enviar"))
+        self.connecting = True
+        self.connect_deadline = time.monotonic() + CONNECT_TIMEOUT
+        self.interest = selectors.EVENT_READ | selectors.EVENT_WRITE
+        self.selector.register(self.sock, self.interest, self)
+        try:
+            # Endereços como "localhost" ainda passam por uma resolução de nome bloqueante
+            self.sock.connect((self.host, self.port))
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            self.lost(repr(e))
+
+    def run(self, duration=None):
+        """Despacha mensagens até close() (ou por `duration` segundos) no selector da sessão."""
+        run_sessions([self], duration)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.connected = False
+        if self.reconnect_at is None and self.sock is not None:
+            self.selector.unregister(self.sock)
+        self.reconnect_at = None
+        if self.outbox is not None:
+            self.outbox.close()
+        elif self.sock is not None:
+            self.sock.close()
+
+
+def run_sessions(sessions, duration=None):
+    """Laço para várias sessões síncronas que dividem um selector, até todas fecharem.
+
+    Outros arquivos registrados no mesmo selector precisam de data=None.
+    """
+    selector = sessions[0].selector
+    stop_at = time.monotonic() + duration if duration is not None else None
+    while any(not session.closed for session in sessions):
+        timeouts = [t for t in (session.timeout() for session in sessions) if t is not None]
+        if stop_at is not None:
+            timeouts.append(max(0.0, stop_at - time.monotonic()))
+        timeout = min(timeouts) if timeouts else None
+        if selector.get_map():
+            events = selector.select(timeout)
+        else:
+            # Todas esperando para reconectar; no Windows, select sem sockets falha
+            time.sleep(timeout or 0)
+            events = []
+        for key, mask in events:
+            if key.data is not None:
+                key.data.on_ready(mask)
+        for session in sessions:
+            session.tick()
+        if stop_at is not None and time.monotonic() >= stop_at:
+            return
+
+
+class AsyncChatSession(BaseSession):
+    """Equivalente da ChatSession para asyncio: uma task por sessão lê o socket.
+
+    Além dos callbacks, as mensagens ficam disponíveis para `async for`; quem não
+    consome a tempo perde as mais antigas depois de `backlog` mensagens.
+    """
+
+    def __init__(self, username, backlog=DEFAULT_BACKLOG, **kwargs):
+        super().__init__(username, **kwargs)
+        self.reader = None
+        self.writer = None
+        self._events = deque(maxlen=backlog)
+        self._ready = asyncio.Event()
+        self._task = None
+
+    async def connect(self, timeout=CONNECT_TIMEOUT):
+        """Conecta, faz o handshake e começa a ler. Levanta OSError se não conseguir conectar."""
+        await asyncio.wait_for(self._open(), timeout)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.codec = Codec()
+        self.writer.write(self.codec.encode(self.hello()))
+        message = None
+        while message is None:
+            data = await self.reader.read(65536)
+            if not data:
+                raise ConnectionError("servidor encerrou a conexão no handshake")
+            self.codec.feed(data)
+            message = self.codec.next_message()
+        if not self.accept_welcome(message):
+            self.dispatch(message)
+        for message in self.codec:
+            self.dispatch(message)
+
+    def send(self, message):
+        if not self.connected or self.writer.is_closing():
+            raise ConnectionError("sem conexão com o servidor")
+        self.writer.write(self.codec.encode(message))
+
+    async def drain(self):
+        """Espera o buffer de escrita esvaziar (controle de fluxo para quem envia muito)."""
+        if self.connected:
+            await self.writer.drain()
+
+    def dispatch(self, message):
+        super().dispatch(message)
+        self._events.append(message)
+        self._ready.set()
+
+    async def _run(self):
+        while not self.closed:
+            try:
+                data = await self.reader.read(65536)
+            except (ConnectionError, OSError):
+                data = b""
+            if data:
+                self.codec.feed(data)
+                for message in self.codec:
+                    self.dispatch(message)
+                continue
+            if self.closed:
+                break
+            log.warning("Conexão com o servidor perdida", event="disconnect")
+            self.connected = False
+            self.roster_version = None
+            self.writer.close()
+            if not self.reconnect:
+                self.closed = True
+            if self.on_connection is not None:
+                self.on_connection(False)
+            if self.closed:
+                break
+            await self._reconnect()
+        self._ready.set()
+
+    async def _reconnect(self):
+        while not self.closed:
+            await asyncio.sleep(self.next_delay())
+            try:
+                await asyncio.wait_for(self._open(), CONNECT_TIMEOUT)
+            except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+                log.info("Reconexão falhou", event="reconnect_failed", reason=repr(e), attempt=self.attempt)
+                if self.on_connection is not None:
+                    self.on_connection(False)
+                continue
+            log.info("Reconectado", event="reconnect", attempts=self.attempt, room=self.room, after=self.last_seq)
+            self.attempt = 0
+            if self.on_connection is not None:
+                self.on_connection(True)
+            return
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        while True:
+            while self._events:
+                yield self._events.popleft()
+            if self.closed:
+                return
+            self._ready.clear()
+            await self._ready.wait()
+
+    async def wait_closed(self):
+        """Espera a sessão terminar (close() ou queda sem `reconnect`)."""
+        if self._task is not None:
+            await asyncio.wait({self._task})
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.connected = False
+        self._ready.set()
+        if self._task is not None:
+            self._task.cancel()
+        if self.writer is not None:
+            self.writer.close()
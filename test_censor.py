@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from censor import BlacklistWatcher, Censor, fold_accents
+
+
+def read_words(path):
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+class CensorTest(unittest.TestCase):
+    def test_masks_whole_words_only(self):
+        censor = Censor(["feio"])
+        self.assertEqual(censor.censor("Feio, FEIO e feioso"), "****, **** e feioso")
+        self.assertEqual(Censor().censor("feio"), "feio")
+
+    def test_fold_accents(self):
+        self.assertEqual(fold_accents("palavrão çá"), "palavrao ca")
+        censor = Censor(["palavrão"], accents=True)
+        self.assertEqual(censor.censor("que palavrao, que PALAVRÃO"), "que ********, que ********")
+        self.assertNotIn("palavrao", Censor(["palavrão"]))
+
+    def test_leetspeak(self):
+        censor = Censor(["porra"], leetspeak=True)
+        self.assertEqual(censor.censor("p0rr4! P0RR@"), "*****! *****")
+        # Sem a opção, @ e $ separam palavras e dígitos não são trocados
+        self.assertEqual(Censor(["porra"]).censor("p0rr4"), "p0rr4")
+
+    def test_accents_and_leetspeak_together(self):
+        censor = Censor(["maçã"], accents=True, leetspeak=True)
+        self.assertIn("m4c4", censor)
+        self.assertIn("MAÇÃ", censor)
+
+    def test_add(self):
+        censor = Censor(["feio"], accents=True)
+        self.assertTrue(censor.add("  Chato "))
+        self.assertFalse(censor.add("chato"))
+        self.assertFalse(censor.add("   "))
+        # A forma normalizada já está na lista: não duplica
+        self.assertTrue(censor.add("vilão"))
+        self.assertFalse(censor.add("vilao"))
+        self.assertEqual(censor.words, ["feio", "chato", "vilão"])
+        self.assertEqual(censor.censor("que vilao chato"), "que ***** *****")
+
+
+class BlacklistWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "blacklist.txt")
+        self.write("feio")
+        self.censor = Censor(read_words(self.path))
+        self.reloaded = threading.Event()
+        self.watcher = BlacklistWatcher(self.path, read_words, Censor, self.swap, interval=0.01)
+
+    def tearDown(self):
+        self.watcher.stop()
+        shutil.rmtree(self.dir)
+
+    def swap(self, censor):
+        self.censor = censor
+        self.reloaded.set()
+
+    def write(self, *words):
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write("\n".join(words))
+
+    def touch_later(self):
+        # Garante um mtime diferente mesmo em sistemas de arquivos com resolução grossa
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def add(self, word):
+        with self.watcher.lock:
+            self.censor.add(word)
+            self.watcher.append(word)
+
+    def test_external_edit_swaps_censor(self):
+        self.watcher.start()
+        self.write("feio", "chato")
+        self.touch_later()
+        self.assertTrue(self.reloaded.wait(5))
+        self.assertEqual(self.censor.words, ["feio", "chato"])
+
+    def test_pending_words_survive_reload(self):
+        self.add("bobo")
+        self.write("chato")
+        self.watcher.reload()
+        self.assertEqual(self.censor.words, ["chato", "bobo"])
+
+    def test_flush_writes_pending_without_reloading(self):
+        self.add("bobo")
+        self.add("chato")
+        self.watcher.start()
+        # A própria gravação não pode disparar uma recarga
+        for _ in range(500):
+            if read_words(self.path) == ["feio", "bobo", "chato"]:
+                break
+            self.reloaded.wait(0.01)
+        self.assertEqual(read_words(self.path), ["feio", "bobo", "chato"])
+        self.assertFalse(self.reloaded.wait(0.1))
+
+    def test_stop_flushes_pending(self):
+        self.watcher.start()
+        self.watcher.stop()
+        self.add("bobo")
+        self.watcher.stop()
+        self.assertEqual(read_words(self.path), ["feio", "bobo"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from history import HistoryStore
+
+# Processo que grava e morre sem close(), como num SIGTERM/SIGKILL ou OOM
+APPEND_AND_DIE = """
+import os, sys
+from history import HistoryStore
+store = HistoryStore(sys.argv[1], fsync_interval=60)
+store.start()
+for i in range(3):
+    store.append("general", f"m{i}")
+os._exit(1)
+"""
+
+
+class HistoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_does_not_wait_for_fsync(self):
+        syncing = threading.Event()
+
+        def slow_fsync(fd):
+            syncing.set()
+            time.sleep(0.3)
+
+        store = HistoryStore(self.directory, fsync_interval=0.01)
+        with mock.patch("history.os.fsync", slow_fsync):
+            store.start()
+            store.append("general", "primeira")
+            self.assertTrue(syncing.wait(2))
+            start = time.monotonic()
+            store.append("general", "segunda")
+            elapsed = time.monotonic() - start
+            store.close()
+        self.assertLess(elapsed, 0.1)
+
+    def append_and_die(self):
+        subprocess.run([sys.executable, "-c", APPEND_AND_DIE, self.directory],
+                       cwd=os.path.dirname(os.path.abspath(__file__)), check=False)
+
+    def test_appends_survive_process_death(self):
+        self.append_and_die()
+        store = HistoryStore(self.directory)
+        try:
+            self.assertEqual([m["content"] for m in store.since("general", 0)], ["m0", "m1", "m2"])
+            self.assertEqual(store.append("general", "m3")["seq"], 4)
+        finally:
+            store.close()
+
+    def test_epoch_survives_clean_restart_only(self):
+        store = HistoryStore(self.directory)
+        epoch = store.epoch
+        store.close()
+        store = HistoryStore(self.directory)
+        self.assertEqual(store.epoch, epoch)
+        store.close()
+
+        self.append_and_die()
+        store = HistoryStore(self.directory)
+        self.assertNotEqual(store.epoch, epoch)
+        store.close()
+
+    def test_torn_record_renews_epoch(self):
+        store = HistoryStore(self.directory)
+        store.append("general", "inteira")
+        epoch = store.epoch
+        store.close()
+        with open(os.path.join(self.directory, "0000000001.log"), "ab") as file:
+            file.write(b'{"room": "general", "seq": 2')
+        store = HistoryStore(self.directory)
+        try:
+            self.assertNotEqual(store.epoch, epoch)
+            self.assertEqual(store.append("general", "depois")["seq"], 2)
+        finally:
+            store.close()
+
+    def test_rotation_keeps_messages_readable(self):
+        store = HistoryStore(self.directory, segment_bytes=200)
+        store.start()
+        for i in range(20):
+            store.append("general", f"mensagem {i}")
+        store.close()
+        self.assertGreater(len([n for n in os.listdir(self.directory) if n.endswith(".log")]), 1)
+
+        store = HistoryStore(self.directory)
+        try:
+            self.assertEqual([m["content"] for m in store.since("general", 15)],
+                             [f"mensagem {i}" for i in range(15, 20)])
+            self.assertEqual(store.append("general", "depois")["seq"], 21)
+        finally:
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import socket
+import unittest
+
+from outbox import Outbox, SelectorOutbox, send_buffers, DROP_OLDEST, COALESCE, DISCONNECT
+
+
+class PartialSocket:
+    """Aceita no máximo `chunk` bytes por sendmsg, como um socket com o buffer quase cheio."""
+
+    def __init__(self, chunk):
+        self.chunk = chunk
+        self.data = b""
+
+    def sendmsg(self, buffers):
+        sent = b"".join(bytes(b) for b in buffers)[:self.chunk]
+        self.data += sent
+        return len(sent)
+
+
+class PolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.sock, self.peer = socket.socketpair()
+
+    def tearDown(self):
+        self.sock.close()
+        self.peer.close()
+
+    def outbox(self, policy, limit=3, **kwargs):
+        # Sem flush(), a fila só muda por put(): dá para ver a política agir
+        return SelectorOutbox(self.sock, limit=limit, policy=policy, **kwargs)
+
+    def queued(self, outbox):
+        return [data for data, _ in outbox._queue]
+
+    def test_drop_oldest(self):
+        outbox = self.outbox(DROP_OLDEST)
+        for i in range(5):
+            self.assertTrue(outbox.put(b"%d" % i))
+        self.assertEqual(self.queued(outbox), [b"2", b"3", b"4"])
+        self.assertEqual(outbox.dropped, 2)
+
+    def test_coalesce_replaces_snapshot_in_place(self):
+        outbox = self.outbox(COALESCE)
+        outbox.put(b"users v1", key="users_list")
+        outbox.put(b"msg 1")
+        outbox.put(b"users v2", key="users_list")
+        self.assertEqual(self.queued(outbox), [b"users v2", b"msg 1"])
+        self.assertEqual(outbox.coalesced, 1)
+        # Sem chave repetida, a fila cheia volta a descartar a mais antiga
+        outbox.put(b"msg 2")
+        outbox.put(b"msg 3")
+        self.assertEqual(self.queued(outbox), [b"msg 1", b"msg 2", b"msg 3"])
+        self.assertEqual(outbox.dropped, 1)
+
+    def test_keys_are_ignored_outside_coalesce(self):
+        outbox = self.outbox(DROP_OLDEST)
+        outbox.put(b"users v1", key="users_list")
+        outbox.put(b"users v2", key="users_list")
+        self.assertEqual(self.queued(outbox), [b"users v1", b"users v2"])
+
+    def test_disconnect_evicts(self):
+        evicted = []
+        outbox = self.outbox(DISCONNECT, limit=2, on_evict=lambda: evicted.append(True))
+        self.assertTrue(outbox.put(b"a"))
+        self.assertTrue(outbox.put(b"b"))
+        self.assertFalse(outbox.put(b"c"))
+        self.assertEqual(evicted, [True])
+        self.assertEqual((len(outbox), outbox.dropped), (0, 3))
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            self.outbox("jogar_fora")
+
+    def test_flush_writes_queue_in_order(self):
+        outbox = self.outbox(DROP_OLDEST)
+        outbox.put(b"a")
+        outbox.put(b"bc")
+        self.assertTrue(outbox.flush())
+        self.assertFalse(outbox.pending)
+        self.assertEqual(self.peer.recv(10), b"abc")
+        self.assertEqual((outbox.messages, outbox.writes), (2, 1))
+
+
+class SendBuffersTest(unittest.TestCase):
+    def test_partial_sends_resume_mid_buffer(self):
+        sock = PartialSocket(chunk=3)
+        buffers = [b"ab", b"cdef", b"", b"g"]
+        calls = send_buffers(sock, list(buffers))
+        self.assertEqual(sock.data, b"abcdefg")
+        self.assertEqual(calls, 3)
+
+
+class ThreadedOutboxTest(unittest.TestCase):
+    def test_delivers_then_sends_final_and_closes(self):
+        sock, peer = socket.socketpair()
+        peer.settimeout(5)
+        outbox = Outbox(sock)
+        try:
+            outbox.put(b"um ")
+            outbox.put(b"dois ")
+            outbox.close(b"tchau")
+            data = b""
+            while True:
+                chunk = peer.recv(100)
+                if not chunk:
+                    break
+                data += chunk
+            # A fila é descartada no close; o que já tinha saído chega antes da despedida
+            self.assertTrue(data.endswith(b"tchau"))
+            self.assertIn(data[:-len(b"tchau")], (b"", b"um ", b"um dois "))
+            self.assertFalse(outbox.put(b"depois"))
+        finally:
+            peer.close()
+
+    def test_write_failure_calls_on_error_once(self):
+        sock, peer = socket.socketpair()
+        errors = []
+        peer.close()
+        outbox = Outbox(sock, on_error=lambda: errors.append(True))
+        for _ in range(3):
+            outbox.put(b"x" * 100000)
+        outbox._thread.join(5)
+        self.assertEqual(errors, [True])
+        self.assertTrue(outbox.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
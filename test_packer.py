@@ -0,0 +1,69 @@
+import math
+import unittest
+
+import packer
+from packer import py_packb, py_unpackb
+
+# Valores nas bordas de cada formato do MessagePack (fixint/uint8/int16..., fixstr/str8..., fixarray/array16...)
+INTEGERS = [0, 1, 127, 128, 255, 256, 65535, 65536, 2**32 - 1, 2**32, 2**64 - 1,
+            -1, -32, -33, -128, -129, -32768, -32769, -2**31, -2**31 - 1, -2**63]
+SIZES = [0, 1, 15, 16, 31, 32, 255, 256, 65535, 65536]
+
+
+class PackerTest(unittest.TestCase):
+    def assertRoundTrip(self, value, expected=None):
+        self.assertEqual(py_unpackb(py_packb(value)), value if expected is None else expected)
+
+    def test_integers(self):
+        for n in INTEGERS:
+            with self.subTest(n=n):
+                self.assertRoundTrip(n)
+
+    def test_integer_out_of_range(self):
+        for n in (2**64, -2**63 - 1):
+            with self.assertRaises(OverflowError):
+                py_packb(n)
+
+    def test_strings_and_bytes(self):
+        for size in SIZES:
+            with self.subTest(size=size):
+                self.assertRoundTrip("a" * size)
+                self.assertRoundTrip(b"\x00" * size)
+        self.assertRoundTrip("çãé 😀 \x00")
+
+    def test_containers(self):
+        for size in SIZES:
+            with self.subTest(size=size):
+                self.assertRoundTrip(list(range(size)))
+                self.assertRoundTrip({str(i): i for i in range(size)})
+        self.assertRoundTrip((1, "a"), [1, "a"])
+        self.assertRoundTrip({1: "chave inteira", "aninhado": {"lista": [None, True, False, 1.5]}})
+
+    def test_floats(self):
+        for value in (0.0, -1.5, 1e300, float("inf")):
+            self.assertRoundTrip(value)
+        self.assertTrue(math.isnan(py_unpackb(py_packb(float("nan")))))
+
+    def test_known_encodings(self):
+        self.assertEqual(py_packb(None), b"\xc0")
+        self.assertEqual(py_packb(-1), b"\xff")
+        self.assertEqual(py_packb(128), b"\xcc\x80")
+        self.assertEqual(py_packb({"a": 1}), b"\x81\xa1a\x01")
+        self.assertEqual(py_packb("a" * 32), b"\xd9\x20" + b"a" * 32)
+
+    def test_invalid_input(self):
+        with self.assertRaises(TypeError):
+            py_packb({1, 2})
+        for data in (b"", b"\x92\x01", b"\xa3ab", b"\x01\x02", b"\xc1", b"\xa2\xff\xfe"):
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                py_unpackb(data)
+
+    @unittest.skipUnless(packer.ACCELERATED, "pacote msgpack não instalado")
+    def test_same_bytes_as_msgpack(self):
+        values = INTEGERS + ["a" * size for size in SIZES] + [{"type": "message", "content": "oi", "seq": 1}]
+        for value in values:
+            self.assertEqual(py_packb(value), packer.packb(value))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+
+from protocol import (Codec, EncodedMessage, ProtocolError, encode_message, compress_frames,
+                      COMPRESSED, HEADER, JSON, MSGPACK, DEFLATE, MAX_LEGACY_SIZE)
+
+# Todos os formatos de fio que um servidor pode ter ao mesmo tempo numa sala
+WIRES = [(1, JSON, None)] + [(2, encoding, compression)
+                             for encoding in (JSON, MSGPACK) for compression in (None, DEFLATE)]
+
+
+def peer(version=2, encoding="json", compression=None):
+    codec = Codec()
+    codec.upgrade(version, encoding, compression)
+    return codec
+
+
+def decode_all(codec, data):
+    codec.feed(data)
+    return list(codec)
+
+
+class FrameTest(unittest.TestCase):
+    MESSAGES = [{"type": "message", "content": "oi", "seq": 1},
+                {"type": "users_list", "room": "general", "users": ["ana", "bia"], "version": 3},
+                {"type": "message", "content": "ç" * 3000}]
+
+    def test_coalesced_frames(self):
+        for encoding in (JSON, MSGPACK):
+            with self.subTest(encoding=encoding):
+                data = b"".join(encode_message(m, 2, encoding) for m in self.MESSAGES)
+                self.assertEqual(decode_all(peer(encoding=encoding), data), self.MESSAGES)
+
+    def test_frames_split_at_every_byte(self):
+        for encoding in (JSON, MSGPACK):
+            with self.subTest(encoding=encoding):
+                codec = peer(encoding=encoding)
+                messages = []
+                for byte in b"".join(encode_message(m, 2, encoding) for m in self.MESSAGES[:2]):
+                    messages += decode_all(codec, bytes([byte]))
+                self.assertEqual(messages, self.MESSAGES[:2])
+
+    def test_compressed_frame_split_across_reads(self):
+        data = compress_frames(b"".join(encode_message(m, 2) for m in self.MESSAGES), threshold=0)
+        codec = peer(compression=DEFLATE)
+        half = len(data) // 2
+        self.assertEqual(decode_all(codec, data[:half]), [])
+        self.assertEqual(decode_all(codec, data[half:]), self.MESSAGES)
+
+    def test_oversized_frame_is_rejected(self):
+        codec = Codec(max_frame_size=100)
+        codec.upgrade(2)
+        codec.feed(HEADER.pack(101))
+        with self.assertRaises(ProtocolError):
+            codec.next_message()
+
+    def test_compressed_frame_without_negotiation_is_rejected(self):
+        data = compress_frames(encode_message(self.MESSAGES[2], 2), threshold=0)
+        with self.assertRaises(ProtocolError):
+            decode_all(peer(), data)
+
+
+class EncodedMessageTest(unittest.TestCase):
+    def test_mixed_fan_out(self):
+        for message in ({"type": "message", "content": "curta", "seq": 7},
+                        {"type": "message", "content": "longa " * 500, "seq": 8}):
+            encoded = EncodedMessage(message)
+            for wire in WIRES:
+                with self.subTest(wire=wire, size=len(message["content"])):
+                    codec = peer(*wire)
+                    data = encoded.for_codec(codec)
+                    self.assertIs(encoded.for_codec(peer(*wire)), data)  # Uma serialização por formato
+                    self.assertEqual(decode_all(peer(*wire), data), [message])
+
+
+    def test_large_message_is_compressed_alone(self):
+        codec = peer(compression="deflate")
+        data = EncodedMessage({"type": "message", "content": "x" * 2000}).for_codec(codec)
+        self.assertTrue(HEADER.unpack_from(data)[0] & COMPRESSED)
+        self.assertEqual(decode_all(peer(compression="deflate"), data)[0]["content"], "x" * 2000)
+
+    def test_burst_compresses_uncompressed_frames_once(self):
+        codec = peer(compression="deflate")
+        burst = [EncodedMessage({"type": "message", "content": "x" * 2000})]
+        burst += [EncodedMessage({"type": "message", "content": f"oi {i}"}) for i in range(40)]
+        for encoded in burst:
+            encoded.for_codec(codec)  # Como no fan-out: a grande já está comprimida no cache
+        data = codec.compress(b"".join(encoded.frame(codec) for encoded in burst))
+        self.assertTrue(HEADER.unpack_from(data)[0] & COMPRESSED)
+        messages = decode_all(peer(compression="deflate"), data)
+        self.assertEqual([m["content"] for m in messages], [e.message["content"] for e in burst])
+
+
+class LegacyTest(unittest.TestCase):
+    MESSAGE = {"type": "message", "content": 'ç {"}\\ \u00e9 😀', "nested": {"list": [1, {"k": "}"}]}}
+
+    def test_coalesced_objects(self):
+        data = b" ".join(encode_message(self.MESSAGE, 1) for _ in range(3)) + b"\r\n"
+        self.assertEqual(decode_all(Codec(), data), [self.MESSAGE] * 3)
+
+    def test_objects_split_at_every_byte(self):
+        codec = Codec()
+        messages = []
+        for byte in encode_message(self.MESSAGE, 1) * 2:
+            messages += decode_all(codec, bytes([byte]))
+        self.assertEqual(messages, [self.MESSAGE] * 2)
+
+    def test_welcome_followed_by_frames(self):
+        codec = Codec()
+        codec.feed(encode_message({"type": "welcome"}, 1) + encode_message({"content": "é"}, 2))
+        self.assertEqual(codec.next_message(), {"type": "welcome"})
+        codec.upgrade(2)
+        self.assertEqual(codec.next_message(), {"content": "é"})
+
+    def test_oversized_handshake_is_rejected(self):
+        codec = Codec()
+        codec.feed(b'{"username": "' + b"a" * MAX_LEGACY_SIZE)
+        with self.assertRaises(ProtocolError):
+            codec.next_message()
+
+    def test_invalid_json_is_rejected(self):
+        for data in (b'{"username": x}', b'{"username": "\xff"}', b'[1]'):
+            with self.assertRaises(ProtocolError):
+                decode_all(Codec(), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
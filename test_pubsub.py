@@ -0,0 +1,65 @@
+import unittest
+
+from pubsub import LoopbackBroker, LoopbackBackend
+from test_server import Connection, make_server
+
+
+def users_list(room):
+    return lambda m: m["type"] == "users_list" and m["room"] == room
+
+
+class LoopbackClusterTest(unittest.TestCase):
+    """Dois ChatServers ligados por um LoopbackBroker, como dois workers ou dois nós."""
+
+    def setUp(self):
+        self.broker = LoopbackBroker()
+        self.a = self.start_node("a")
+        self.b = self.start_node("b")
+        self.alice = Connection(self.a, "alice")
+        self.alice.wait_for(users_list("general"))
+        self.bob = Connection(self.b, "bob")
+        self.bob.wait_for(users_list("general"))
+
+    def tearDown(self):
+        self.alice.close()
+        self.bob.close()
+        for server in (self.a, self.b):
+            server.stop_bus()
+
+    def start_node(self, node_id):
+        server = make_server()
+        server.node_id = node_id
+        server.bus = LoopbackBackend(self.broker)
+        server.start_bus()
+        return server
+
+    def test_room_message_reaches_other_node(self):
+        self.alice.send({"type": "message", "content": "oi do nó a"})
+        message = self.bob.wait_for(lambda m: m["type"] == "message" and "seq" in m)
+        self.assertEqual(message["content"], "alice: oi do nó a")
+
+    def test_whisper_reaches_other_node(self):
+        self.alice.send({"type": "whisper", "target": "bob", "content": "psiu"})
+        whisper = self.bob.wait_for(lambda m: m["type"] == "whisper")
+        self.assertEqual((whisper["sender"], whisper["content"]), ("alice", "psiu"))
+
+    def test_presence_crosses_nodes(self):
+        joined = self.alice.wait_for(lambda m: m["type"] == "presence_join" and m["username"] == "bob")
+        self.assertEqual(joined["room"], "general")
+        self.assertIn("alice", self.bob.wait_for(users_list("general"))["users"])
+        self.assertEqual(self.a.remote_users, {"bob": "b"})
+
+        self.bob.send({"type": "join_room", "room": "outra"})
+        self.alice.wait_for(lambda m: m["type"] == "presence_leave" and m["username"] == "bob")
+        self.assertEqual(self.a.remote_rooms, {"outra": {"bob": "b"}})
+
+    def test_down_forgets_users_of_the_node(self):
+        self.alice.wait_for(lambda m: m["type"] == "presence_join" and m["username"] == "bob")
+        self.b.bus.stop()  # Queda sem o aviso de desligamento do servidor: o broker avisa
+        self.alice.wait_for(lambda m: m["type"] == "presence_leave" and m["username"] == "bob")
+        self.assertEqual(self.a.remote_users, {})
+        self.assertEqual(self.a.remote_rooms, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+
+from ratelimit import RateLimiter, TokenBucket, build_limits, parse_limit, CONNECTION, USER, ROOM, SWEEP_INTERVAL
+from test_server import Connection, make_server
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_refill_is_capped_at_capacity(self):
+        bucket = TokenBucket(rate=2, capacity=5, now=0)
+        bucket.tokens = 0
+        bucket.refill(1.5)
+        self.assertEqual(bucket.tokens, 3)
+        bucket.refill(100)
+        self.assertEqual(bucket.tokens, 5)
+
+    def test_retry_after(self):
+        bucket = TokenBucket(rate=4, capacity=1, now=0)
+        bucket.tokens = 0.5
+        self.assertAlmostEqual(bucket.retry_after(), 0.125)
+        bucket.rate = 0
+        self.assertEqual(bucket.retry_after(), float("inf"))
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def limiter(self, limits):
+        return RateLimiter(limits, clock=self.clock)
+
+    def test_burst_then_refill(self):
+        limiter = self.limiter({"message": {CONNECTION: (2, 3)}})
+        for _ in range(3):
+            self.assertIsNone(limiter.check("message", "c1", "ana", "general"))
+        scope, retry_after = limiter.check("message", "c1", "ana", "general")
+        self.assertEqual(scope, CONNECTION)
+        self.assertAlmostEqual(retry_after, 0.5)
+        self.clock.now += 0.5
+        self.assertIsNone(limiter.check("message", "c1", "ana", "general"))
+        self.assertIsNotNone(limiter.check("message", "c1", "ana", "general"))
+
+    def test_scopes_have_separate_keys(self):
+        limiter = self.limiter({"message": {USER: (0, 1), ROOM: (0, 2)}})
+        self.assertIsNone(limiter.check("message", "c1", "ana", "sala"))
+        # Outra conexão do mesmo usuário divide o balde de USER
+        self.assertEqual(limiter.check("message", "c2", "ana", "outra")[0], USER)
+        self.assertIsNone(limiter.check("message", "c3", "bia", "sala"))
+        # A sala esgotou com ana e bia; carla ainda tem token de usuário
+        self.assertEqual(limiter.check("message", "c4", "carla", "sala")[0], ROOM)
+        self.assertIsNone(limiter.check("message", "c4", "carla", "livre"))
+
+    def test_rejected_message_consumes_no_token(self):
+        limiter = self.limiter({"message": {CONNECTION: (0, 5), ROOM: (0, 1)}})
+        self.assertIsNone(limiter.check("message", "c1", "ana", "cheia"))
+        for _ in range(10):
+            self.assertEqual(limiter.check("message", "c1", "ana", "cheia")[0], ROOM)
+        for i in range(4):
+            self.assertIsNone(limiter.check("message", "c1", "ana", f"sala{i}"))
+        self.assertEqual(limiter.check("message", "c1", "ana", "sala9")[0], CONNECTION)
+
+    def test_kinds_are_independent_and_unknown_kinds_pass(self):
+        limiter = self.limiter({"message": {CONNECTION: (0, 1)}, "whisper": {CONNECTION: (0, 1)}})
+        self.assertIsNone(limiter.check("message", "c1", "ana", "general"))
+        self.assertIsNone(limiter.check("whisper", "c1", "ana", "general"))
+        self.assertIsNotNone(limiter.check("message", "c1", "ana", "general"))
+        self.assertIsNone(limiter.check("get_users", "c1", "ana", "general"))
+
+    def test_forget_and_sweep(self):
+        limiter = self.limiter({"message": {CONNECTION: (1, 1), USER: (1, 1)}})
+        limiter.check("message", "c1", "ana", "general")
+        limiter.forget("c1")
+        self.assertEqual([key[0] for key in limiter._buckets], [USER])
+        self.clock.now += SWEEP_INTERVAL
+        limiter.check("message", "c2", "bia", "general")
+        # O balde parado de ana encheu e foi varrido; os de bia acabaram de ser usados
+        self.assertEqual(sorted(key[1] for key in limiter._buckets), ["bia", "c2"])
+
+
+class ParseLimitTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_limit("message:room=100/200"), ("message", ROOM, (100.0, 200.0)))
+        self.assertEqual(parse_limit("whisper:user=off"), ("whisper", USER, None))
+        for spec in ("message=1/2", "message:planeta=1/2", "message:room=1", "message:room=-1/2", "message:room=1/0"):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                parse_limit(spec)
+
+    def test_build_limits_does_not_touch_base(self):
+        base = {"message": {CONNECTION: (5, 10), USER: (5, 10)}}
+        limits = build_limits(["message:user=off", "whisper:room=1/2"], base)
+        self.assertEqual(limits, {"message": {CONNECTION: (5, 10)}, "whisper": {ROOM: (1.0, 2.0)}})
+        self.assertEqual(base, {"message": {CONNECTION: (5, 10), USER: (5, 10)}})
+
+
+class RateLimitedReplyTest(unittest.TestCase):
+    def test_flood_gets_rate_limited_reply(self):
+        server = make_server(rate_limits={"message": {CONNECTION: (0.01, 2)}})
+        alice = Connection(server, "alice")
+        try:
+            for i in range(3):
+                alice.send({"type": "message", "content": f"oi {i}"})
+            error = alice.wait_for(lambda m: m["type"] == "error")
+            self.assertEqual((error["code"], error["request"], error["scope"]),
+                             ("rate_limited", "message", CONNECTION))
+            self.assertAlmostEqual(error["retry_after"], 100, delta=1)
+            delivered = [m["content"] for m in alice.received if m.get("seq")]
+            self.assertEqual(delivered, ["alice: oi 0", "alice: oi 1"])
+        finally:
+            alice.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
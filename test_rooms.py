@@ -0,0 +1,157 @@
+import threading
+import unittest
+
+from rooms import RoomRegistry
+
+
+def rooms_in_distinct_shards(registry, count):
+    """Nomes de salas que caem em shards diferentes (o hash muda a cada processo)."""
+    found = {}
+    i = 0
+    while len(found) < count:
+        found.setdefault(registry._index(f"sala{i}"), f"sala{i}")
+        i += 1
+    return list(found.values())
+
+
+class JoinLeaveTest(unittest.TestCase):
+    def setUp(self):
+        self.rooms = RoomRegistry(shards=4)
+
+    def test_join_and_leave_results(self):
+        self.assertTrue(self.rooms.join("sala", "c1", "ana"))
+        self.assertFalse(self.rooms.join("sala", "c2", "bia"))
+        self.assertEqual(self.rooms.leave("sala", "c1"), ("ana", False))
+        self.assertEqual(self.rooms.leave("sala", "c1"), (None, False))
+        self.assertEqual(self.rooms.leave("nenhuma", "c1"), (None, False))
+        self.assertEqual(self.rooms.leave("sala", "c2"), ("bia", True))
+        self.assertNotIn("sala", self.rooms)
+
+    def test_permanent_room_outlives_its_members(self):
+        self.assertIn("general", self.rooms)
+        self.assertFalse(self.rooms.join("general", "c1", "ana"))
+        self.assertEqual(self.rooms.leave("general", "c1"), ("ana", False))
+        self.assertIn("general", self.rooms)
+        self.assertEqual(self.rooms.members("general"), {})
+
+    def test_names_items_and_len(self):
+        self.rooms.join("sala", "c1", "ana")
+        self.assertEqual(sorted(self.rooms.names()), ["general", "sala"])
+        self.assertEqual(len(self.rooms), 2)
+        self.assertEqual(dict(self.rooms.items()), {"general": {}, "sala": {"c1": "ana"}})
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.rooms = RoomRegistry(shards=4)
+        self.rooms.join("sala", "c1", "ana")
+
+    def test_snapshot_is_reused_until_a_change(self):
+        first = self.rooms.members("sala")
+        self.assertIs(self.rooms.members("sala"), first)
+        self.assertIs(self.rooms.roster("sala")[1], first)
+        self.rooms.join("sala", "c2", "bia")
+        second = self.rooms.members("sala")
+        self.assertIsNot(second, first)
+        self.assertEqual(second, {"c1": "ana", "c2": "bia"})
+
+    def test_snapshot_does_not_see_later_changes(self):
+        snapshot = self.rooms.members("sala")
+        self.rooms.join("sala", "c2", "bia")
+        self.rooms.leave("sala", "c1")
+        self.assertEqual(snapshot, {"c1": "ana"})
+        self.assertEqual(self.rooms.members("sala"), {"c2": "bia"})
+
+    def test_iteration_survives_concurrent_changes(self):
+        for i in range(100):
+            self.rooms.join("sala", f"x{i}", f"u{i}")
+        snapshot = self.rooms.members("sala")
+        seen = []
+        for client in snapshot:
+            self.rooms.leave("sala", client)  # Mudar a sala no meio do broadcast não quebra o laço
+            seen.append(client)
+        self.assertEqual(len(seen), 101)
+        self.assertNotIn("sala", self.rooms)
+
+
+class ShardTest(unittest.TestCase):
+    def test_rooms_spread_over_shards(self):
+        rooms = RoomRegistry(shards=8)
+        used = {rooms._index(f"sala{i}") for i in range(200)}
+        self.assertEqual(used, set(range(8)))
+
+    def test_other_shards_are_not_blocked(self):
+        rooms = RoomRegistry(shards=4)
+        busy, free = rooms_in_distinct_shards(rooms, 2)
+        done = threading.Event()
+
+        def join_free():
+            rooms.join(free, "c1", "ana")
+            rooms.next_seq(free)
+            rooms.roster(free)
+            done.set()
+
+        with rooms._locks[rooms._index(busy)]:
+            thread = threading.Thread(target=join_free)
+            thread.start()
+            self.assertTrue(done.wait(5))
+        thread.join()
+
+    def test_concurrent_joins_in_one_room(self):
+        rooms = RoomRegistry(shards=4)
+
+        def join_many(prefix):
+            for i in range(500):
+                rooms.join("sala", f"{prefix}{i}", prefix)
+
+        threads = [threading.Thread(target=join_many, args=(f"t{n}",)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(rooms.members("sala")), 2000)
+
+
+class SeqAndPresenceTest(unittest.TestCase):
+    def setUp(self):
+        self.rooms = RoomRegistry(shards=4)
+
+    def test_seqs_survive_room_deletion(self):
+        self.rooms.join("sala", "c1", "ana")
+        self.assertEqual([self.rooms.next_seq("sala") for _ in range(3)], [1, 2, 3])
+        self.assertEqual(self.rooms.next_seq("outra"), 1)
+        self.rooms.leave("sala", "c1")
+        self.rooms.join("sala", "c1", "ana")
+        self.assertEqual(self.rooms.next_seq("sala"), 4)
+
+    def test_presence_versions_and_scheduling(self):
+        first, second = rooms_in_distinct_shards(self.rooms, 2)
+        self.rooms.join(first, "c1", "ana")
+        self.rooms.join(second, "c2", "bia")
+        shard = self.rooms.queue_presence(first, {"username": "ana"})
+        self.assertEqual(shard, self.rooms._index(first))
+        # Só o primeiro delta de cada shard agenda o envio
+        self.assertIsNone(self.rooms.queue_presence(first, {"username": "bia"}))
+        self.assertIsNotNone(self.rooms.queue_presence(second, {"username": "bia"}))
+
+        pending = self.rooms.take_presence(shard)
+        self.assertEqual(pending, {first: [{"username": "ana", "version": 1},
+                                           {"username": "bia", "version": 2}]})
+        self.assertEqual(self.rooms.take_presence(shard), {})
+        self.assertEqual(self.rooms.roster(first), (2, {"c1": "ana"}))
+        self.assertEqual(self.rooms.queue_presence(first, {}), shard)
+
+    def test_presence_in_deleted_room(self):
+        self.rooms.join("sala", "c1", "ana")
+        self.rooms.queue_presence("sala", {})
+        self.rooms.leave("sala", "c1")
+        self.assertIsNone(self.rooms.queue_presence("sala", {}))
+        self.assertEqual(self.rooms.roster("sala"), (0, {}))
+        # Com membros em outros nós a sala continua versionada
+        delta = {}
+        self.rooms.queue_presence("remota", delta, keep=True)
+        self.assertEqual(delta["version"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
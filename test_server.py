@@ -0,0 +1,232 @@
+import asyncio
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from history import HistoryStore
+from protocol import Codec, encode_message
+from pubsub import LoopbackBroker, LoopbackBackend
+from server import ChatServer, AsyncChatServer
+
+
+def make_server(server_class=ChatServer, **kwargs):
+    kwargs.setdefault("blacklist_path", "inexistente.txt")
+    kwargs.setdefault("rate_limits", None)
+    kwargs.setdefault("presence_window", 0)
+    return server_class(**kwargs)
+
+
+class Connection:
+    """Cliente de teste ligado a handle_client por um socketpair, sem passar pela rede."""
+
+    def __init__(self, server, username, compression=("deflate",), encodings=("json",), resume=None):
+        self.sock, remote = socket.socketpair()
+        self.sock.settimeout(5)
+        threading.Thread(target=server.handle_client, args=(remote,), daemon=True).start()
+        hello = {"username": username, "version": 2, "encodings": list(encodings),
+                 "compression": list(compression)}
+        if resume is not None:
+            hello["resume"] = resume
+        self.codec = Codec()
+        self.sock.sendall(encode_message(hello, 1))
+        self.received = []
+        self.welcome = self.wait_for(lambda m: m["type"] == "welcome")
+        self.codec.upgrade(2, self.welcome["encoding"], self.welcome.get("compression"))
+
+    def send(self, message):
+        self.sock.sendall(encode_message(message, 2, self.codec.encoding))
+
+    def wait_for(self, predicate, count=1):
+        """Lê até `count` mensagens satisfazerem `predicate`; retorna a última delas."""
+        deadline = time.monotonic() + 5
+        matches = [m for m in self.received if predicate(m)]
+        while len(matches) < count:
+            if time.monotonic() > deadline:
+                raise AssertionError(f"esperava {count} mensagens, chegaram {len(matches)}")
+            message = self.codec.next_message()
+            if message is None:
+                data = self.sock.recv(65536)
+                if not data:
+                    raise AssertionError("conexão encerrada pelo servidor")
+                self.codec.feed(data)
+                continue
+            self.received.append(message)
+            if predicate(message):
+                matches.append(message)
+            if message["type"] == "welcome":
+                return message
+        return matches[-1]
+
+    def close(self):
+        self.sock.close()
+
+
+def chat_messages(message):
+    return message["type"] == "message" and "seq" in message
+
+
+class BackfillTest(unittest.TestCase):
+    def setUp(self):
+        self.connections = []
+
+    def tearDown(self):
+        for connection in self.connections:
+            connection.close()
+
+    def connect(self, server, username, **kwargs):
+        connection = Connection(server, username, **kwargs)
+        self.connections.append(connection)
+        return connection
+
+    def fill_room(self, server):
+        alice = self.connect(server, "alice")
+        alice.send({"type": "message", "content": "x" * 2000})
+        for i in range(40):
+            alice.send({"type": "message", "content": f"oi {i}"})
+        alice.wait_for(chat_messages, 41)
+        return alice
+
+    def test_backfill_with_compressed_recent_messages(self):
+        # Mensagens grandes ficam comprimidas no buffer de recentes; a rajada não pode aninhar frames comprimidos
+        server = make_server()
+        self.fill_room(server)
+        bob = self.connect(server, "bob")
+        bob.wait_for(chat_messages, 41)
+        contents = [m["content"] for m in bob.received if chat_messages(m)]
+        self.assertEqual(contents[0], "alice: " + "x" * 2000)
+        self.assertEqual(contents[-1], "alice: oi 39")
+
+    def test_resume_from_history_with_large_message(self):
+        with tempfile.TemporaryDirectory() as directory:
+            server = make_server()
+            server.history = HistoryStore(directory)
+            server.start_history()
+            try:
+                alice = self.fill_room(server)
+                resume = {"room": "general", "after": 0, "epoch": alice.welcome["epoch"]}
+                bob = self.connect(server, "bob", resume=resume)
+                bob.wait_for(chat_messages, 41)
+                self.assertEqual([m["seq"] for m in bob.received if chat_messages(m)], list(range(1, 42)))
+            finally:
+                for connection in self.connections:
+                    connection.close()
+                self.connections = []
+                server.stop_history()
+
+
+# Handshake e primeira mensagem na mesma escrita: cliente legado e cliente com frames
+HANDSHAKES = {
+    "legado": (encode_message({"username": "velho"}, 1) + encode_message({"type": "message", "content": "oi"}, 1),
+               1),
+    "frames": (encode_message({"username": "novo", "version": 2, "encodings": ["json"]}, 1)
+               + encode_message({"type": "message", "content": "oi"}, 2), 2),
+}
+
+
+def expected_broadcast(message):
+    return message.get("content", "").endswith(": oi")
+
+
+class HandshakeTest(unittest.TestCase):
+    def test_message_in_handshake_read_threads(self):
+        for name, (data, version) in HANDSHAKES.items():
+            with self.subTest(name):
+                server = make_server()
+                sock, remote = socket.socketpair()
+                sock.settimeout(5)
+                threading.Thread(target=server.handle_client, args=(remote,), daemon=True).start()
+                try:
+                    sock.sendall(data)
+                    codec = Codec()
+                    while not any(expected_broadcast(m) for m in self.read(sock, codec, version)):
+                        pass
+                finally:
+                    sock.close()
+
+    def test_message_in_handshake_read_asyncio(self):
+        for name, (data, version) in HANDSHAKES.items():
+            with self.subTest(name):
+                asyncio.run(asyncio.wait_for(self.async_scenario(data, version), 5))
+
+    async def async_scenario(self, data, version):
+        server = make_server(AsyncChatServer)
+        server.loop = asyncio.get_running_loop()
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+        try:
+            writer.write(data)
+            codec = Codec()
+            received = []
+            while not any(expected_broadcast(m) for m in received):
+                codec.feed(await reader.read(65536))
+                received += self.decode(codec, version)
+        finally:
+            writer.close()
+            listener.close()
+            await listener.wait_closed()
+
+    def read(self, sock, codec, version):
+        data = sock.recv(65536)
+        if not data:
+            raise AssertionError("conexão encerrada pelo servidor")
+        codec.feed(data)
+        return self.decode(codec, version)
+
+    def decode(self, codec, version):
+        messages = []
+        for message in codec:
+            messages.append(message)
+            if message["type"] == "welcome":
+                codec.upgrade(version, message["encoding"])
+        return messages
+
+
+class AsyncShutdownTest(unittest.TestCase):
+    def test_bus_stops_while_loop_is_running(self):
+        stopped_in_loop = []
+
+        class Bus(LoopbackBackend):
+            def stop(self):
+                stopped_in_loop.append(asyncio.get_event_loop().is_running())
+                super().stop()
+
+        server = make_server(AsyncChatServer, host="127.0.0.1", port=0)
+        server.bus = Bus(LoopbackBroker())
+
+        async def run():
+            task = asyncio.ensure_future(server.serve())
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        asyncio.run(run())
+        self.assertEqual(stopped_in_loop, [True])
+
+    def test_bus_message_after_loop_closed_is_dropped(self):
+        server = make_server(AsyncChatServer)
+        server.loop = asyncio.new_event_loop()
+        server.loop.close()
+        server.call_soon(server.on_bus_message, "presence", {"event": "down", "node": "x"})
+
+
+class PresenceTest(unittest.TestCase):
+    def test_roster_version_dropped_with_the_room(self):
+        server = make_server()
+        alice = Connection(server, "alice")
+        try:
+            for count in (1, 2):
+                alice.send({"type": "join_room", "room": "temporaria"})
+                roster = alice.wait_for(lambda m: m["type"] == "users_list" and m["room"] == "temporaria", count)
+                # Sem a versão antiga guardada, a sala recriada recomeça do 1
+                self.assertEqual(roster["version"], 1)
+                alice.send({"type": "join_room", "room": "general"})
+                alice.wait_for(lambda m: m["type"] == "users_list" and m["room"] == "general", count + 1)
+            self.assertGreater(server.rooms.roster("general")[0], 1)
+        finally:
+            alice.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
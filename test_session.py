@@ -0,0 +1,52 @@
+import socket
+import threading
+import time
+import unittest
+
+from protocol import encode_message
+from session import ChatSession
+
+
+class ChatSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+
+    def tearDown(self):
+        self.listener.close()
+
+    def serve_welcome_and_close(self):
+        """Servidor que aceita uma conexão, manda o welcome e fecha (FIN)."""
+        def serve():
+            sock, _ = self.listener.accept()
+            sock.recv(4096)
+            welcome = {"type": "welcome", "version": 2, "username": "bot", "encoding": "json",
+                       "room": "general", "epoch": "e"}
+            sock.sendall(encode_message(welcome, 1))
+            sock.close()
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        return thread
+
+    def test_failed_send_schedules_reconnect(self):
+        server = self.serve_welcome_and_close()
+        session = ChatSession("bot", host="127.0.0.1", port=self.listener.getsockname()[1])
+        session.connect()
+        server.join()
+        try:
+            sock = session.sock
+            with self.assertRaises(ConnectionError):
+                for _ in range(10):
+                    session.send_message("oi")  # A primeira escrita recebe o RST; as seguintes falham
+                    time.sleep(0.05)
+            self.assertFalse(session.connected)
+            self.assertIsNotNone(session.reconnect_at)
+            self.assertNotIn(sock, [key.fileobj for key in session.selector.get_map().values()])
+            self.assertEqual(sock.fileno(), -1)
+        finally:
+            session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()